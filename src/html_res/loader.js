@@ -0,0 +1,156 @@
+'use strict'
+
+// Used by reports that don't have their data written straight into the page:
+//  - compressed reports: the plotly library, the figure and the datasets are
+//    embedded as gzipped base64 payloads.
+//  - split asset reports: the datasets are separate files next to the report
+//    (listed in the manifest), loaded with fetch.
+// They are unpacked here, then the plot is drawn and main.js is run, in the same
+// order as a normal report.
+
+const typedArrayTypes = {
+    uint8: Uint8Array,
+    uint16: Uint16Array,
+    uint32: Uint32Array,
+    float64: Float64Array
+}
+
+function base64ToBytes(inputBase64) {
+    var binaryString = atob(inputBase64)
+    var bytes = new Uint8Array(binaryString.length)
+
+    for (var i = 0; i < binaryString.length; i++) {
+        bytes[i] = binaryString.charCodeAt(i)
+    }
+
+    return bytes
+}
+
+async function gunzipToText(inputBytes) {
+    var stream = new Blob([inputBytes]).stream().pipeThrough(new DecompressionStream("gzip"))
+
+    return await new Response(stream).text()
+}
+
+async function readPayloads() {
+    var payloadElms = [...document.querySelectorAll("script.intreeactivePayload")]
+    var payloads = {}
+
+    // the size of each payload in the page, for the debug panel in main.js
+    window.payloadSizes = { compressed: true, sizes: {} }
+    await Promise.all(payloadElms.map(async x => {
+        payloadSizes.sizes[x.dataset.name] = x.textContent.length
+        var text = await gunzipToText(base64ToBytes(x.textContent))
+        payloads[x.dataset.name] = x.dataset.name == "plotlyJs" ? text : JSON.parse(text)
+        // the encoded text isn't needed again, so let it be garbage collected
+        x.remove()
+    }))
+
+    return payloads
+}
+
+async function fetchOk(inputUrl) {
+    var response = await fetch(inputUrl)
+
+    if (!response.ok) {
+        throw new Error(`Failed to load ${inputUrl}: ${response.status}`)
+    }
+
+    return response
+}
+
+async function fetchTypedArray(inputUrl, inputDtype) {
+    var buffer = await (await fetchOk(inputUrl)).arrayBuffer()
+
+    return new typedArrayTypes[inputDtype](buffer)
+}
+
+async function fetchSidecars(inputManifest) {
+    var payloads = {}
+    var jsonNames = Object.keys(inputManifest.json)
+
+    var [jsonValues, matrixIndex, matrixValues, coordinates] = await Promise.all([
+        Promise.all(jsonNames.map(async x => (await fetchOk(inputManifest.json[x])).json())),
+        (await fetchOk(inputManifest.matrix.index)).json(),
+        fetchTypedArray(inputManifest.matrix.values, inputManifest.matrix.dtype),
+        fetchTypedArray(inputManifest.coordinates.values, inputManifest.coordinates.dtype)
+    ])
+
+    jsonNames.forEach((x, i) => { payloads[x] = jsonValues[i] })
+
+    // the coordinates file is all the x coordinates, then all the y coordinates
+    var nodeCount = coordinates.length / 2
+    payloads.figure.data.forEach(trace => {
+        trace.x = coordinates.subarray(0, nodeCount)
+        trace.y = coordinates.subarray(nodeCount)
+    })
+
+    // each matrix row is a view on the one array, so nothing is copied
+    var sampleCount = matrixIndex.length
+    payloads.inputSnpMatrix = {
+        index: matrixIndex,
+        data: Array.from({ length: sampleCount }, (_, i) => matrixValues.subarray(i * sampleCount, (i + 1) * sampleCount))
+    }
+
+    return payloads
+}
+
+function runScript(inputText) {
+    // inline scripts added to the page run straight away, in the global scope
+    var scriptElm = document.createElement("script")
+    scriptElm.text = inputText
+    document.body.append(scriptElm)
+}
+
+async function loadReport() {
+    var loadingElm = document.getElementById("loadingMessage")
+    var manifestElm = document.getElementById("intreeactiveManifest")
+    var payloads
+
+    performance.mark("data start")
+    try {
+        if (manifestElm) {
+            payloads = await fetchSidecars(JSON.parse(manifestElm.textContent))
+        }
+        else if ("DecompressionStream" in window) {
+            payloads = await readPayloads()
+        }
+        else {
+            loadingElm.innerHTML = "This report is compressed and needs a newer browser to open it."
+            return
+        }
+    }
+    catch (error) {
+        console.error(error)
+        loadingElm.innerHTML = `Failed to load the report data (${error.message}). If the report was opened from a `
+            + "file, serve its folder instead, for example with <code>python -m http.server</code>."
+        return
+    }
+
+    performance.measure("data parse", "data start")
+
+    if (payloads.plotlyJs) {
+        runScript(payloads.plotlyJs)
+    }
+
+    // main.js expects the datasets as globals
+    for (var name of Object.keys(payloads)) {
+        if (name.startsWith("input")) {
+            window[name] = payloads[name]
+        }
+    }
+
+    performance.mark("plot start")
+    await Plotly.newPlot(
+        document.getElementsByClassName("plotly-graph-div")[0],
+        payloads.figure.data,
+        payloads.figure.layout,
+        { responsive: true }
+    )
+    performance.measure("plot", "plot start")
+
+    loadingElm.remove()
+    runScript(document.getElementById("mainScript").textContent)
+}
+
+loadReport()
@@ -1,24 +1,111 @@
 'use strict'
 
-function showLabels() {
+// Labels are only made for the leaves in view, at most maxLabels of them,
+// and are redrawn as the plot is zoomed and panned. The leaves are
+// indexed by y (see initLabelIndex), so the ones in view are found with
+// a binary search.
+function initLabelIndex() {
+    indexLabelNodes()
+
+    targetElm.on("plotly_relayout", function (eventData) {
+        if (isLabelsShown && Object.keys(eventData).some(x => x.startsWith("xaxis") || x.startsWith("yaxis") || x == "autosize")) {
+            scheduleLabelUpdate()
+        }
+    })
+}
+
+function indexLabelNodes() {
+    var y = targetElm.data[0].y
+    var nodes = targetElm.data[0].text.flatMap((x, i) => x ? [i] : [])
+
+    nodes.sort((a, b) => y[a] - y[b])
+    labelNodesByY = Uint32Array.from(nodes)
+    labelNodeY = Float64Array.from(nodes, i => y[i])
+}
+
+function scheduleLabelUpdate() {
+    // redraw at most once per frame while panning
+    if (!isLabelUpdatePending) {
+        isLabelUpdatePending = true
+        requestAnimationFrame(() => {
+            isLabelUpdatePending = false
+            showLabels()
+        })
+    }
+}
+
+function findFirstIndex(inputSortedArray, inputPredicate) {
+    // binary search for the first value where inputPredicate is true, for
+    // a predicate that is false then true along the array. Returns the
+    // length if it is never true
+    var low = 0
+    var high = inputSortedArray.length
+
+    while (low < high) {
+        var mid = (low + high) >>> 1
+        if (inputPredicate(inputSortedArray[mid])) {
+            high = mid
+        }
+        else {
+            low = mid + 1
+        }
+    }
+
+    return low
+}
+
+function getLabelNodesInView() {
+    var x = targetElm.data[0].x
+    var xRangeMax = Math.max(...targetElm.layout.xaxis.range)
+    var yRangeMin = Math.min(...targetElm.layout.yaxis.range)
+    var yRangeMax = Math.max(...targetElm.layout.yaxis.range)
+    var start = findFirstIndex(labelNodeY, y => y >= yRangeMin)
+    var end = findFirstIndex(labelNodeY, y => y > yRangeMax)
+    var nodes = []
+
+    // labels are drawn to the right of their leaf, so leaves left of the
+    // view can still have their label in view
+    for (var i = start; i < end; i++) {
+        if (x[labelNodesByY[i]] <= xRangeMax) {
+            nodes.push(labelNodesByY[i])
+        }
+    }
+
+    if (nodes.length > maxLabels) {
+        // too many to read, so label evenly spaced leaves
+        var step = nodes.length / maxLabels
+        nodes = Array.from({ length: maxLabels }, (_, i) => nodes[Math.floor(i * step)])
+    }
+
+    return nodes
+}
+
+async function showLabels() {
     isLabelsShown = true
 
+    // labels are redrawn as the plot moves, so only the latest call
+    // gets to draw them
+    var requestNumber = ++labelRequestCount
     var labelLeftPadding = "\t\t\t"
 
     var labelArray
+    var labelMetadata = await getMetadataForLabels(builtLabelArray.length ? builtLabelArray : [labelBy])
+
+    // the labels may have been hidden while the metadata was fetched
+    if (!isLabelsShown || requestNumber != labelRequestCount) {
+        return
+    }
+
+    var data = targetElm.data[0]
+    var nodes = getLabelNodesInView()
+    var labelRows = nodes.map(i => labelMetadata[data.text[i].split("<br")[0]])
 
     if (builtLabelArray.length) {
-        labelArray = targetElm
-            .data[0]
-            .text
-            .map(x => x ? inputMetadata[x.split("<br")[0]] : x)
+        labelArray = labelRows
             .map(x => x ? `${labelLeftPadding}${builtLabelArray.map(labelField => x[labelField]).join(builtLabelSeparator)}` : "")
     }
     else {
-        labelArray = targetElm
-            .data[0]
-            .text
-            .map(x => x ? inputMetadata[x.split("<br")[0]] : x)
+        labelArray = labelRows
             .map(x => x ? `${labelLeftPadding}${x[labelBy]}` : "")
     }
 
@@ -28,17 +115,20 @@ function showLabels() {
     // The non-WebGL version does not need this nesting.
     // We could check if the plot is of type ScatterGl...
     var updateData = {
+        x: [nodes.map(i => data.x[i])],
+        y: [nodes.map(i => data.y[i])],
         text: [labelArray],
         visible: true
     }
 
     if (rainbowMode) {
+        var colours = data.marker.color
         updateData["textfont"] = {
-            color: targetElm.data[0].marker.color
+            color: Array.isArray(colours) ? nodes.map(i => colours[i]) : colours
         }
     }
 
-    Plotly.restyle(targetElm, updateData, 1);
+    return timePromise("restyle labels", Plotly.restyle(targetElm, updateData, 1))
 }
 
 function hideLabels() {
@@ -47,81 +137,146 @@ function hideLabels() {
     Plotly.restyle(targetElm, { "visible": false }, 1);
 }
 
-function doHighlight(inputString) {
-    var colArray = targetElm.data[0].marker.color
-    var labelArray = targetElm.data[0].text.map(x => x ? x.split("<br>")[0] : x)
-    var data = {}
+// Searching for IDs: the ID of each node and an index of the
+// searchGramLength letter substrings of the IDs are built once (see
+// initSearchIndex), so each search only checks the IDs that could match
+function initSearchIndex() {
+    searchIds = targetElm.data[0].text.map(x => x ? x.split("<br>")[0] : "")
+    searchIndex = new Map()
+    searchNodesById = new Map()
+
+    searchIds.forEach((id, i) => {
+        if (!id) {
+            return
+        }
+
+        if (!searchNodesById.has(id)) {
+            searchNodesById.set(id, [])
+        }
+        searchNodesById.get(id).push(i)
+
+        var idGrams = new Set()
+        for (var j = 0; j + searchGramLength <= id.length; j++) {
+            idGrams.add(id.slice(j, j + searchGramLength))
+        }
+        idGrams.forEach(gram => {
+            if (!searchIndex.has(gram)) {
+                searchIndex.set(gram, [])
+            }
+            searchIndex.get(gram).push(i)
+        })
+    })
+}
+
+function findNodesContaining(inputString) {
+    // returns the nodes whose ID contains inputString, in node order
+    var candidates
+
+    if (inputString.length >= searchGramLength) {
+        // only nodes with every substring of the search can match, so
+        // check the nodes of the rarest one
+        for (var j = 0; j + searchGramLength <= inputString.length; j++) {
+            var gramNodes = searchIndex.get(inputString.slice(j, j + searchGramLength))
+            if (!gramNodes) {
+                return []
+            }
+            if (!candidates || gramNodes.length < candidates.length) {
+                candidates = gramNodes
+            }
+        }
+    }
+    else {
+        candidates = searchIds.keys()
+    }
+
+    return Array.from(candidates).filter(i => searchIds[i].includes(inputString))
+}
+
+function showHighlight(inputNodes, inputColours) {
+    // the highlighted nodes are drawn over the tree by their own trace, so
+    // only that small trace is restyled as the search changes
+    var nodeKey = inputNodes.join() + "|" + inputColours.join()
+    if (isCustomColoursEnabled && nodeKey == highlightedNodeKey) {
+        return
+    }
+
+    var data = targetElm.data[0]
+    var updates = []
 
     // store the original colours
     // if we haven't already changed them
     if (!isCustomColoursEnabled) {
         isCustomColoursEnabled = true
-        originalColours = colArray
-    }
-
-    if (inputString.length) {
-        data = {
-            marker: {
-                color: labelArray.map(x =>
-                    x
-                        ? x.includes(inputString)
-                            ? "red"
-                            : "rgb(100, 100, 100)"
-                        : "rgb(100,100,100)"
-                ),
-                size: labelArray.map(x => x ? x.includes(inputString) ? 15 : 10 : x)
-            }
-        }
+        originalColours = data.marker.color
+        updates.push(Plotly.restyle(targetElm, { "marker.color": "rgb(100, 100, 100)" }, [0]))
     }
-    else {
-        // data = {
-        //     marker: {
-        //         color: labelArray.map(x => "rgb(100, 100, 100)")
-        //     }
-        // }
+
+    if (highlightTraceIdx === undefined) {
+        highlightTraceIdx = targetElm.data.length
+        updates.push(Plotly.addTraces(targetElm, {
+            type: "scattergl",
+            x: [],
+            y: [],
+            text: [],
+            mode: "markers",
+            marker: { size: 15, color: [] },
+            hoverinfo: "text",
+            showlegend: false
+        }))
+    }
+
+    highlightedNodeKey = nodeKey
+    updates.push(Plotly.restyle(targetElm, {
+        x: [inputNodes.map(i => data.x[i])],
+        y: [inputNodes.map(i => data.y[i])],
+        text: [inputNodes.map(i => data.text[i])],
+        "marker.color": [inputColours]
+    }, [highlightTraceIdx]))
+
+    return timePromise("restyle highlight", Promise.all(updates))
+}
+
+function onHighlightInput(inputString) {
+    // wait for a pause in typing before searching
+    clearTimeout(highlightInputTimer)
+    highlightInputTimer = setTimeout(() => doHighlight(inputString), highlightInputDelayMs)
+}
+
+function doHighlight(inputString) {
+    if (!inputString.length) {
         restoreOriginalColours()
         return
     }
 
-    Plotly.restyle(targetElm, data);
+    var nodes = findNodesContaining(inputString)
+
+    return showHighlight(nodes, nodes.map(() => "red"))
 }
 
 function doHighlightIdArray(inputArray, inputId) {
     // exact matches to valid IDs only
     // inputArray gets colour one
     // inputId if present gets colour two
-    var colArray = targetElm.data[0].marker.color
-    var labelArray = targetElm.data[0].text.map(x => x ? x.split("<br>")[0] : x)
-    var data = {}
     var colourOne = "blue"
     var colourTwo = "red"
 
-    // store the original colours
-    // if we haven't already changed them
-    if (!isCustomColoursEnabled) {
-        isCustomColoursEnabled = true
-        originalColours = colArray
+    if (!inputArray.length) {
+        restoreOriginalColours()
+        return
     }
 
-    if (inputArray.length) {
-        data = {
-            marker: {
-                color: labelArray.map(x => x ? x == inputId ? colourTwo : inputArray.includes(x) ? colourOne : "rgb(100, 100, 100)" : "rgb(100, 100, 100)"),
-                size: labelArray.map(x => x ? x.includes(inputId) ? 15 : 10 : x)
-            }
+    var nodeColours = new Map()
+    for (var id of inputArray) {
+        for (var i of searchNodesById.get(id) || []) {
+            nodeColours.set(i, colourOne)
         }
     }
-    else {
-        // data = {
-        //     marker: {
-        //         color: labelArray.map(x => "rgb(100, 100, 100)")
-        //     }
-        // }
-        restoreOriginalColours()
-        return
+    for (var i of searchNodesById.get(inputId) || []) {
+        nodeColours.set(i, colourTwo)
     }
+    var nodes = [...nodeColours.keys()].sort((a, b) => a - b)
 
-    Plotly.restyle(targetElm, data);
+    return showHighlight(nodes, nodes.map(i => nodeColours.get(i)))
 }
 
 function getCurrentDropdownStatus() {
@@ -133,6 +288,9 @@ function getCurrentDropdownStatus() {
 
 
 function restoreOriginalColours() {
+    // a search still waiting to run would highlight again
+    clearTimeout(highlightInputTimer)
+
     if (!originalColours) {
         console.warn("nothing to restore")
         return
@@ -146,27 +304,368 @@ function restoreOriginalColours() {
     }
 
     isCustomColoursEnabled = false
+    highlightedNodeKey = undefined
 
-    Plotly.restyle(targetElm, data);
+    var updates = [Plotly.restyle(targetElm, data, [0])]
+    if (highlightTraceIdx !== undefined) {
+        updates.push(Plotly.restyle(targetElm, { x: [[]], y: [[]], text: [[]] }, [highlightTraceIdx]))
+    }
+
+    return timePromise("restyle restore colours", Promise.all(updates))
 }
 
-function populateMetadataTableByIdPair(inputId, inputId2) {
-    var tempMetadata = inputMetadata[inputId]
-    var tempMetadata2 = inputMetadata[inputId2]
+// Facet filter: inputFacets (see get_facets_json in intreeactive.py) has a
+// bitset over the metadata rows for each value of the columns that can be
+// filtered by. The chosen values of a column are ORed, the columns are
+// ANDed (or ORed), and the nodes whose row is in the result keep their
+// colour, drawn over the greyed out tree by showHighlight.
+function initFacetFilter() {
+    if (typeof inputFacets === "undefined" || !Object.keys(inputFacets.columns).length) {
+        return
+    }
+
+    var columnElm = document.createElement("select")
+    columnElm.id = "facetColumnDropdown"
+    columnElm.setAttribute("onchange", "updateFacetValueDropdown()")
+    Object.keys(inputFacets.columns).forEach(x => {
+        var tempElm = document.createElement("option")
+        tempElm.innerHTML = x
+        tempElm.value = x
+        columnElm.append(tempElm)
+    })
 
-    // pre-emptively blank the div
-    metadataElm.innerHTML = ""
+    var valueElm = document.createElement("select")
+    valueElm.id = "facetValueDropdown"
+
+    var addBtnElm = document.createElement("button")
+    addBtnElm.innerHTML = "+"
+    addBtnElm.onclick = () => addFacet(columnElm.value, Number(valueElm.value))
+
+    var modeElm = document.createElement("select")
+    modeElm.id = "facetModeDropdown"
+    modeElm.setAttribute("onchange", "applyFacetFilter()")
+    modeElm.innerHTML = `<option value="all">Match all columns</option><option value="any">Match any column</option>`
+
+    var clearBtnElm = document.createElement("button")
+    clearBtnElm.innerHTML = "Clear"
+    clearBtnElm.setAttribute("onclick", "clearFacets()")
+
+    var facetFieldElm = document.createElement("div")
+    facetFieldElm.id = "facetFilterField"
+
+    var rowElm = document.createElement("tr")
+    rowElm.innerHTML = "<td>Filter by</td><td></td>"
+    rowElm.lastChild.append(columnElm, valueElm, addBtnElm, modeElm, clearBtnElm, facetFieldElm)
+    highlightInputElm.closest("tr").after(rowElm)
+
+    updateFacetValueDropdown()
+}
+
+function updateFacetValueDropdown() {
+    var column = inputFacets.columns[document.getElementById("facetColumnDropdown").value]
+    var valueElm = document.getElementById("facetValueDropdown")
+
+    valueElm.innerHTML = ""
+    column.values
+        .map((x, i) => [String(x), i])
+        .sort((a, b) => a[0].localeCompare(b[0], undefined, { numeric: true }))
+        .forEach(([value, i]) => {
+            var tempElm = document.createElement("option")
+            tempElm.textContent = value
+            tempElm.value = i
+            valueElm.append(tempElm)
+        })
+}
+
+function addFacet(inputColumn, inputValueIdx) {
+    if (!facetSelections.has(inputColumn)) {
+        facetSelections.set(inputColumn, new Set())
+    }
+    facetSelections.get(inputColumn).add(inputValueIdx)
+
+    updateFacetField()
+    return applyFacetFilter()
+}
+
+function removeFacet(inputColumn, inputValueIdx) {
+    facetSelections.get(inputColumn).delete(inputValueIdx)
+    if (!facetSelections.get(inputColumn).size) {
+        facetSelections.delete(inputColumn)
+    }
+
+    updateFacetField()
+    return applyFacetFilter()
+}
+
+function clearFacets() {
+    facetSelections.clear()
+    updateFacetField()
+    return applyFacetFilter()
+}
+
+function updateFacetField() {
+    var facetFieldElm = document.getElementById("facetFilterField")
+
+    facetFieldElm.innerHTML = ""
+    facetSelections.forEach((valueIdxs, column) => {
+        valueIdxs.forEach(valueIdx => {
+            var tempElm = document.createElement("div")
+            tempElm.classList.add("labelBuilderLabel")
+            tempElm.textContent = `${column} = ${inputFacets.columns[column].values[valueIdx]}`
+            tempElm.onclick = () => removeFacet(column, valueIdx)
+            facetFieldElm.append(tempElm)
+        })
+    })
+}
+
+function getFacetBitset(inputColumn, inputValueIdx) {
+    // the bitsets of a column are decoded the first time it is used
+    if (!facetBitsets.has(inputColumn)) {
+        facetBitsets.set(inputColumn, new Uint32Array(base64ToBuffer(inputFacets.columns[inputColumn].bitsets)))
+    }
+
+    var words = inputFacets.words
+    return facetBitsets.get(inputColumn).subarray(inputValueIdx * words, (inputValueIdx + 1) * words)
+}
+
+function getFacetRows() {
+    // the metadata rows matching the filter, as a bitset. The date range
+    // is combined like another column
+    var modeElm = document.getElementById("facetModeDropdown")
+    var isAll = !modeElm || modeElm.value == "all"
+    var columnBitsets = []
+    var rowBits
+
+    facetSelections.forEach((valueIdxs, column) => {
+        var columnBits = new Uint32Array(inputFacets.words)
+        valueIdxs.forEach(valueIdx => {
+            var valueBits = getFacetBitset(column, valueIdx)
+            for (var i = 0; i < columnBits.length; i++) {
+                columnBits[i] |= valueBits[i]
+            }
+        })
+        columnBitsets.push(columnBits)
+    })
+    if (dateFilter) {
+        columnBitsets.push(getDateRangeRows())
+    }
+
+    columnBitsets.forEach(columnBits => {
+        if (!rowBits) {
+            rowBits = columnBits
+        }
+        else {
+            for (var i = 0; i < rowBits.length; i++) {
+                rowBits[i] = isAll ? rowBits[i] & columnBits[i] : rowBits[i] | columnBits[i]
+            }
+        }
+    })
+
+    return rowBits
+}
+
+function getFacetNodeRows() {
+    // the metadata row of each node of the tree shown, or -1
+    if (facetNodeRowsIds !== searchIds) {
+        facetNodeRowsIds = searchIds
+        facetNodeRows = Int32Array.from(searchIds, id => id ? getMetadataIndex(id) ?? -1 : -1)
+    }
+
+    return facetNodeRows
+}
+
+function applyFacetFilter() {
+    if (!facetSelections.size && !dateFilter) {
+        return restoreOriginalColours()
+    }
+
+    var endTiming = startTiming("facet filter")
+    var rowBits = getFacetRows()
+    var nodeRows = getFacetNodeRows()
+    var colours = isCustomColoursEnabled ? originalColours : targetElm.data[0].marker.color
+    var nodes = []
+
+    nodeRows.forEach((row, i) => {
+        if (row >= 0 && (rowBits[row >>> 5] >>> (row & 31)) & 1) {
+            nodes.push(i)
+        }
+    })
+    endTiming()
+
+    highlightInputElm.value = ""
+    return showHighlight(nodes, nodes.map(i => colours[i]))
+}
+
+// Date range filter: inputDates (see get_dates_json in intreeactive.py) has
+// the day number of each metadata row for each date column, and the rows
+// in date order, so the rows in a range are found by binary search. The
+// range is part of the facet filter, so the nodes outside it are greyed out.
+function initDateFilter() {
+    if (typeof inputDates === "undefined" || !Object.keys(inputDates.columns).length) {
+        return
+    }
+
+    var columnElm = document.createElement("select")
+    columnElm.id = "dateColumnDropdown"
+    columnElm.setAttribute("onchange", "updateDateSliders()")
+    Object.keys(inputDates.columns).forEach(x => {
+        var tempElm = document.createElement("option")
+        tempElm.innerHTML = x
+        tempElm.value = x
+        columnElm.append(tempElm)
+    })
+
+    var sliderElms = ["dateStartSlider", "dateEndSlider"].map(id => {
+        var tempElm = document.createElement("input")
+        tempElm.id = id
+        tempElm.type = "range"
+        tempElm.step = 1
+        tempElm.setAttribute("oninput", "scheduleDateFilterUpdate()")
+        return tempElm
+    })
+
+    var labelElm = document.createElement("div")
+    labelElm.id = "dateRangeLabel"
+
+    var clearBtnElm = document.createElement("button")
+    clearBtnElm.innerHTML = "Clear"
+    clearBtnElm.setAttribute("onclick", "clearDateFilter()")
+
+    var rowElm = document.createElement("tr")
+    rowElm.innerHTML = "<td>Date range</td><td></td>"
+    rowElm.lastChild.append(columnElm, clearBtnElm, ...sliderElms, labelElm)
+    highlightInputElm.closest("tr").after(rowElm)
+
+    updateDateSliders()
+}
+
+function getDateColumn(inputColumn) {
+    // the day numbers and date order of a column are decoded the first
+    // time it is used
+    if (!dateColumns.has(inputColumn)) {
+        var column = inputDates.columns[inputColumn]
+        dateColumns.set(inputColumn, {
+            days: new Int32Array(base64ToBuffer(column.days)),
+            order: new Uint32Array(base64ToBuffer(column.order))
+        })
+    }
+
+    return dateColumns.get(inputColumn)
+}
+
+function base64ToBuffer(inputBase64) {
+    var binaryString = atob(inputBase64)
+    var bytes = new Uint8Array(binaryString.length)
+    for (var i = 0; i < binaryString.length; i++) {
+        bytes[i] = binaryString.charCodeAt(i)
+    }
+
+    return bytes.buffer
+}
+
+function dayToDateString(inputDay) {
+    return new Date(inputDay * 86400000).toISOString().slice(0, 10)
+}
+
+function updateDateSliders() {
+    // a new column starts with the whole range, which doesn't filter
+    var column = getDateColumn(document.getElementById("dateColumnDropdown").value)
+    var firstDay = column.days[column.order[0]]
+    var lastDay = column.days[column.order[column.order.length - 1]]
+
+    for (var [id, value] of [["dateStartSlider", firstDay], ["dateEndSlider", lastDay]]) {
+        var sliderElm = document.getElementById(id)
+        sliderElm.min = firstDay
+        sliderElm.max = lastDay
+        sliderElm.value = value
+    }
+    document.getElementById("dateRangeLabel").innerHTML = `${dayToDateString(firstDay)} to ${dayToDateString(lastDay)}`
+
+    if (dateFilter) {
+        dateFilter = undefined
+        applyFacetFilter()
+    }
+}
 
+function scheduleDateFilterUpdate() {
+    // filter at most once per frame while a slider is dragged
+    if (!isDateFilterUpdatePending) {
+        isDateFilterUpdatePending = true
+        requestAnimationFrame(() => {
+            isDateFilterUpdatePending = false
+            updateDateFilter()
+        })
+    }
+}
+
+function updateDateFilter() {
+    var startDay = Number(document.getElementById("dateStartSlider").value)
+    var endDay = Number(document.getElementById("dateEndSlider").value)
+    if (startDay > endDay) {
+        [startDay, endDay] = [endDay, startDay]
+    }
+
+    dateFilter = { column: document.getElementById("dateColumnDropdown").value, start: startDay, end: endDay }
+    var rowCount = getDateRange().length
+    document.getElementById("dateRangeLabel").innerHTML =
+        `${dayToDateString(startDay)} to ${dayToDateString(endDay)} (${rowCount} samples)`
+
+    return applyFacetFilter()
+}
+
+function getDateRange() {
+    // the rows with a date in dateFilter, in date order
+    var column = getDateColumn(dateFilter.column)
+    var first = findFirstIndex(column.order, row => column.days[row] >= dateFilter.start)
+    var last = findFirstIndex(column.order, row => column.days[row] > dateFilter.end)
+
+    return column.order.subarray(first, last)
+}
+
+function getDateRangeRows() {
+    // the rows with a date in dateFilter, as a bitset
+    var rowBits = new Uint32Array(inputFacets.words)
+    getDateRange().forEach(row => {
+        rowBits[row >>> 5] |= 1 << (row & 31)
+    })
+
+    return rowBits
+}
+
+function clearDateFilter() {
+    dateFilter = undefined
+    updateDateSliders()
+    return applyFacetFilter()
+}
+
+async function populateMetadataTableByIdPair(inputId, inputId2) {
+    // this is called as the IDs are typed, so only the latest call
+    // gets to fill in the table
+    var requestNumber = ++metadataTableRequestCount
+    var endTiming = startTiming("metadata table")
+    var tempMetadataRows = await getMetadataRows([inputId, inputId2])
+    var tempMetadata = tempMetadataRows[inputId]
+    var tempMetadata2 = tempMetadataRows[inputId2]
+    var tempMetadataElm
 
     if (tempMetadata && tempMetadata2) {
         // if we have both, do a paired table
-        var tempMetadataElm = formatPairedKeyValuesAsNiceTable(tempMetadata, tempMetadata2)
-        tempMetadataElm.classList.add("metadataTable")
-        metadataElm.append(tempMetadataElm)
+        tempMetadataElm = await formatPairedKeyValuesAsNiceTable(tempMetadata, tempMetadata2)
     }
     else if (tempMetadata || tempMetadata2) {
         // if we only have one, do a table with just that one
-        var tempMetadataElm = formatKeyValuesAsNiceTable(tempMetadata ? tempMetadata : tempMetadata2)
+        tempMetadataElm = await formatKeyValuesAsNiceTable(tempMetadata ? tempMetadata : tempMetadata2)
+    }
+
+    if (requestNumber != metadataTableRequestCount) {
+        endTiming()
+        return
+    }
+
+    // blank the div
+    metadataElm.innerHTML = ""
+
+    if (tempMetadataElm) {
         tempMetadataElm.classList.add("metadataTable")
         metadataElm.append(tempMetadataElm)
     }
@@ -174,6 +673,7 @@ function populateMetadataTableByIdPair(inputId, inputId2) {
         // there's nothing to do
         console.error("Failed to grab metadata for inputId", inputId)
     }
+    endTiming()
 }
 
 class NearestNeighbourID {
@@ -243,7 +743,7 @@ class HighlightAllBtn {
     }
 }
 
-function formatKeyValuesAsNiceTable(inputObj) {
+async function formatKeyValuesAsNiceTable(inputObj) {
     var tempTable = document.createElement("table")
     var tempTableBody = document.createElement("tbody")
 
@@ -305,7 +805,7 @@ function formatKeyValuesAsNiceTable(inputObj) {
             // if we've got a defined SNP threshold
             else {
                 var tempId = inputObj["ID"]
-                var nnTempId = getNeighboursWithinSnpThreshold(tempId, snpThreshold)
+                var nnTempId = await getNeighboursWithinSnpThreshold(tempId, snpThreshold)
 
                 if (nnTempId.length) {
                     td_value.append(...nnTempId.map(x => new NearestNeighbourWithMeta(x[0], x[1]).elm))
@@ -326,7 +826,7 @@ function formatKeyValuesAsNiceTable(inputObj) {
     return tempTable
 }
 
-function formatPairedKeyValuesAsNiceTable(inputObj, inputObj2) {
+async function formatPairedKeyValuesAsNiceTable(inputObj, inputObj2) {
     var tempTable = document.createElement("table")
     var tempTableHead = document.createElement("thead")
     var tempTableBody = document.createElement("tbody")
@@ -358,7 +858,7 @@ function formatPairedKeyValuesAsNiceTable(inputObj, inputObj2) {
             td_value2.setAttribute("onclick", `doHighlight(this.dataset.nodeId)`)
 
             // add the snp distances row
-            var snpDistRow = `<tr><th>SNP distance</th><td colspan=2>${getSnpDistance(inputObj[k], inputObj2[k])}</td></tr>`
+            var snpDistRow = `<tr><th>SNP distance</th><td colspan=2>${await getSnpDistance(inputObj[k], inputObj2[k])}</td></tr>`
             tempTableBody.innerHTML += snpDistRow
         }
 
@@ -419,8 +919,8 @@ function formatPairedKeyValuesAsNiceTable(inputObj, inputObj2) {
             else {
                 var tempId = inputObj["ID"]
                 var tempId2 = inputObj2["ID"]
-                var nnTempId = getNeighboursWithinSnpThreshold(tempId, snpThreshold)
-                var nnTempId2 = getNeighboursWithinSnpThreshold(tempId2, snpThreshold)
+                var nnTempId = await getNeighboursWithinSnpThreshold(tempId, snpThreshold)
+                var nnTempId2 = await getNeighboursWithinSnpThreshold(tempId2, snpThreshold)
 
                 if (nnTempId.length) {
                     td_value.append(...nnTempId.map(x => new NearestNeighbourWithMeta(x[0], x[1]).elm))
@@ -452,25 +952,327 @@ function formatPairedKeyValuesAsNiceTable(inputObj, inputObj2) {
     return tempTable
 }
 
-function getNeighboursWithinSnpThreshold(inputId, inputMaxSnps) {
-    var idx = inputSnpMatrix.index.indexOf(inputId)
-    var data = inputSnpMatrix.data[idx]
-    var returnIds = []
+// The SNP distance queries run in a Web Worker, so looking up the
+// neighbours of a sample in a large matrix doesn't block the plot. This
+// function is the worker's whole script: it is made into a blob by
+// initSnpWorker, so the report stays one file. scope is the worker's
+// global scope (or a stand-in, see startSnpQueriesInPage).
+function snpWorkerMain(scope) {
+    var ids
+    var idIndex
+    var distances
+    var missingDistance
+    var sampleCount
+
+    var queries = {
+        load: function (inputIds, inputDistances, inputMissingDistance) {
+            // inputDistances is every row of the matrix, one after another,
+            // with inputMissingDistance (if any) where a distance is missing
+            ids = inputIds
+            idIndex = new Map(ids.map((x, i) => [x, i]))
+            distances = inputDistances
+            missingDistance = inputMissingDistance
+            sampleCount = ids.length
+        },
+        neighbours: function (inputId, inputMaxSnps) {
+            var idx = idIndex.get(inputId)
+            var returnIds = []
+
+            if (idx === undefined) {
+                return returnIds
+            }
+
+            var row = distances.subarray(idx * sampleCount, (idx + 1) * sampleCount)
+            for (var i = 0; i < sampleCount; i++) {
+                // if below or equal to the threshold, and
+                // not the input ID
+                if ((row[i] <= inputMaxSnps) && (i != idx) && (row[i] !== missingDistance)) {
+                    // push the ID and the number of SNPs
+                    returnIds.push([ids[i], row[i]])
+                }
+            }
+
+            // sort by SNP count
+            // doesn't sort by label
+            returnIds.sort(function (a, b) { return a[1] - b[1] })
+
+            return returnIds
+        },
+        distance: function (inputId1, inputId2) {
+            var idx1 = idIndex.get(inputId1)
+            var idx2 = idIndex.get(inputId2)
+
+            if (idx1 === undefined || idx2 === undefined) {
+                return undefined
+            }
+
+            var distance = distances[idx1 * sampleCount + idx2]
+            return distance === missingDistance ? NaN : distance
+        }
+    }
+
+    scope.onmessage = function (event) {
+        var message = event.data
+
+        try {
+            scope.postMessage({ id: message.id, result: queries[message.type](...message.args) })
+        }
+        catch (error) {
+            scope.postMessage({ id: message.id, error: error.message })
+        }
+    }
+}
+
+function getSnpMatrixValues() {
+    // the rows of the matrix as one typed array, and the value that stands
+    // for a missing distance. In a split asset report the rows are already
+    // views on one array (see loader.js), with NaN for missing distances
+    var rows = inputSnpMatrix.data
+    var sampleCount = inputSnpMatrix.index.length
+
+    if (rows.length && ArrayBuffer.isView(rows[0]) && rows[0].buffer.byteLength == sampleCount * sampleCount * rows[0].BYTES_PER_ELEMENT) {
+        return { values: new rows[0].constructor(rows[0].buffer), missing: NaN }
+    }
+
+    // SNP distances are whole numbers that aren't negative, so go in the
+    // smallest unsigned integer array that holds them, with its largest
+    // value standing for a missing distance (as get_smallest_dtype, which
+    // uses float64 instead when any are missing)
+    var isWhole = true
+    var maxValue = 0
+    rows.forEach(row => {
+        row.forEach(x => {
+            if (x !== null) {
+                isWhole = isWhole && Number.isInteger(x) && x >= 0
+                maxValue = Math.max(maxValue, x)
+            }
+        })
+    })
 
-    data.forEach((x, i) => {
-        // if below or equal to the threshold, and
-        // not the input ID
-        if ((x <= inputMaxSnps) && (i != idx)) {
-            // push the ID and the number of SNPs
-            returnIds.push([inputSnpMatrix.index[i], x])
+    var arrayType = Float64Array
+    var missing = NaN
+    if (isWhole) {
+        var integerType = [Uint8Array, Uint16Array, Uint32Array].find(x => maxValue < 2 ** (8 * x.BYTES_PER_ELEMENT) - 1)
+        if (integerType) {
+            arrayType = integerType
+            missing = 2 ** (8 * integerType.BYTES_PER_ELEMENT) - 1
         }
+    }
+
+    var values = new arrayType(sampleCount * sampleCount)
+    rows.forEach((row, i) => {
+        row.forEach((x, j) => { values[i * sampleCount + j] = x === null ? missing : x })
+    })
+
+    return { values: values, missing: missing }
+}
+
+function startSnpQueriesInPage() {
+    // for browsers that can't start the worker, run the same script here
+    var scope = {}
+    snpWorkerMain(scope)
+
+    snpWorker = {
+        postMessage: message => setTimeout(() => scope.onmessage({ data: message }))
+    }
+    scope.postMessage = reply => onSnpWorkerReply({ data: reply })
+
+    var matrix = getSnpMatrixValues()
+    snpWorker.postMessage({ id: 0, type: "load", args: [inputSnpMatrix.index, matrix.values, matrix.missing] })
+    snpWorkerRequests.forEach((request, id) => {
+        snpWorker.postMessage({ id: id, type: request.type, args: request.args })
+    })
+}
+
+function onSnpWorkerReply(event) {
+    var reply = event.data
+    var request = snpWorkerRequests.get(reply.id)
+
+    if (!request) {
+        return
+    }
+
+    snpWorkerRequests.delete(reply.id)
+    if (reply.error) {
+        request.reject(new Error(reply.error))
+    }
+    else {
+        request.resolve(reply.result)
+    }
+}
+
+function initSnpWorker() {
+    if (isServedReport()) {
+        // the server answers the queries
+        return
+    }
+
+    try {
+        var workerUrl = URL.createObjectURL(new Blob([`(${snpWorkerMain})(self)`], { type: "text/javascript" }))
+        snpWorker = new Worker(workerUrl)
+    }
+    catch (error) {
+        console.warn("Failed to start the SNP distance worker, running the queries in the page instead.", error)
+        startSnpQueriesInPage()
+        return
+    }
+
+    snpWorker.onmessage = onSnpWorkerReply
+    snpWorker.onerror = function (event) {
+        console.warn("The SNP distance worker failed, running the queries in the page instead.", event.message)
+        snpWorker.terminate()
+        startSnpQueriesInPage()
+    }
+
+    var matrix = getSnpMatrixValues()
+    // a new array can be handed over to the worker instead of copied
+    var transfer = ArrayBuffer.isView(inputSnpMatrix.data[0]) ? [] : [matrix.values.buffer]
+    snpWorker.postMessage({ id: 0, type: "load", args: [inputSnpMatrix.index, matrix.values, matrix.missing] }, transfer)
+}
+
+function querySnpWorker(inputType, inputArgs) {
+    return new Promise((resolve, reject) => {
+        var id = ++snpWorkerRequestCount
+        snpWorkerRequests.set(id, { type: inputType, args: inputArgs, resolve: resolve, reject: reject })
+        snpWorker.postMessage({ id: id, type: inputType, args: inputArgs })
     })
+}
+
+async function getNeighboursWithinSnpThreshold(inputId, inputMaxSnps) {
+    if (isServedReport()) {
+        return await timePromise("neighbour query", fetchFromApi("neighbours", [["id", inputId], ["max_snps", inputMaxSnps]]))
+    }
+
+    return await timePromise("neighbour query", querySnpWorker("neighbours", [inputId, inputMaxSnps]))
+}
+
+// A report made by "intreeactive serve" has inputDataApi instead of
+// inputMetadata and inputSnpMatrix, and fetches the metadata and SNP
+// distances from the server as they are needed. These functions work
+// for either kind of report.
+function isServedReport() {
+    return typeof inputDataApi !== "undefined"
+}
+
+async function fetchFromApi(inputRoute, inputParams) {
+    var url = new URL(inputDataApi.url + inputRoute, document.baseURI)
+    inputParams.forEach(([key, value]) => url.searchParams.append(key, value))
+
+    var response = await fetch(url)
+    if (!response.ok) {
+        throw new Error(`Failed to fetch ${url}: ${response.status}`)
+    }
+
+    return await response.json()
+}
+
+// In other reports, inputMetadata is stored by column (see
+// get_metadata_json in intreeactive.py), and read with these.
+function getMetadataIndex(inputId) {
+    if (!metadataIndex) {
+        metadataIndex = new Map(inputMetadata.ids.map((x, i) => [x, i]))
+    }
+
+    return metadataIndex.get(inputId)
+}
+
+function getColumnValue(inputColumn, inputIndex) {
+    // a column is either dictionary encoded or the values as they are
+    var value = inputColumn.codes ? inputColumn.values[inputColumn.codes[inputIndex]] : inputColumn.data[inputIndex]
+
+    return value === undefined ? null : value
+}
+
+function getMetadataValue(inputIndex, inputField) {
+    var neighbours = inputMetadata.neighbours
+
+    if (inputField == inputMetadata.idField) {
+        return inputMetadata.ids[inputIndex]
+    }
+
+    if (inputField == neighbours.field) {
+        // as "ID=distance", which the metadata table expects
+        var nearestNeighbours = []
+        for (var i = neighbours.offsets[inputIndex]; i < neighbours.offsets[inputIndex + 1]; i++) {
+            nearestNeighbours.push(`${getColumnValue(neighbours.ids, i)}=${neighbours.snps[i]}`)
+        }
+
+        // a sample without neighbours has one empty entry
+        return nearestNeighbours.length ? nearestNeighbours : [""]
+    }
+
+    return getColumnValue(inputMetadata.columns[inputField], inputIndex)
+}
+
+function getLocalMetadataColumns(inputFields) {
+    // the same as the "columns" route of a served report
+    var fields = inputFields.filter(x => inputMetadata.fields.includes(x))
+
+    return {
+        ids: inputMetadata.ids,
+        fields: Object.fromEntries(fields.map(field => [field, inputMetadata.ids.map((_, i) => getMetadataValue(i, field))]))
+    }
+}
+
+async function getMetadataIds() {
+    if (isServedReport()) {
+        return await fetchFromApi("ids", [])
+    }
+
+    return inputMetadata.ids
+}
+
+async function getMetadataFields() {
+    if (isServedReport()) {
+        return await fetchFromApi("fields", [])
+    }
+
+    return inputMetadata.fields
+}
+
+async function getMetadataRows(inputIds) {
+    // returns {ID: {field: value}}, leaving out unknown IDs
+    var ids = inputIds.filter(x => x)
+
+    if (isServedReport()) {
+        return ids.length ? await fetchFromApi("metadata", ids.map(x => ["id", x])) : {}
+    }
+
+    return Object.fromEntries(ids.filter(x => getMetadataIndex(x) !== undefined).map(x => [
+        x,
+        Object.fromEntries(inputMetadata.fields.map(field => [field, getMetadataValue(getMetadataIndex(x), field)]))
+    ]))
+}
 
-    // sort by SNP count
-    // doesn't sort by label
-    returnIds.sort(function (a, b) { return a[1] - b[1] })
+async function getMetadataForLabels(inputFields) {
+    // returns {ID: {field: value}} for every ID, with at least inputFields
+
+    // only the last set of label fields is kept, so memory use
+    // doesn't grow as labels are changed
+    var cacheKey = inputFields.join("\t")
+    if (labelMetadataCache.key != cacheKey) {
+        var columns = isServedReport()
+            ? fetchFromApi("columns", inputFields.map(x => ["field", x]))
+            : Promise.resolve(getLocalMetadataColumns(inputFields))
+
+        labelMetadataCache = {
+            key: cacheKey,
+            rows: columns.then(columns => {
+                var fields = Object.keys(columns.fields)
+                var rows = {}
+                columns.ids.forEach((id, i) => {
+                    rows[id] = Object.fromEntries(fields.map(field => [field, columns.fields[field][i]]))
+                })
+                return rows
+            }).catch(error => {
+                // try again next time
+                labelMetadataCache = {}
+                throw error
+            })
+        }
+    }
 
-    return returnIds
+    return await labelMetadataCache.rows
 }
 
 function getParentTableElm(inputElm) {
@@ -494,25 +1296,25 @@ function getParentTableElm(inputElm) {
 //     var colIdx = inputElm.parentElement
 // }
 
-function getSnpDistance(inputId1, inputId2) {
+async function getSnpDistance(inputId1, inputId2) {
     if (!inputId1 || !inputId2) {
         console.warn("Two ids required to get snp distance. Input:", inputId1, inputId2)
         return
     }
 
-    try {
-        var idx1 = inputSnpMatrix.index.indexOf(inputId1)
-        var idx2 = inputSnpMatrix.index.indexOf(inputId2)
-
-        return inputSnpMatrix.data[idx1][idx2]
+    if (isServedReport()) {
+        return await timePromise("distance query", fetchFromApi("distance", [["id", inputId1], ["id", inputId2]]))
     }
-    catch {
+
+    var distance = await timePromise("distance query", querySnpWorker("distance", [inputId1, inputId2]))
+    if (distance === undefined) {
         console.warn("Two valid ids required to get snp distance. Input:", inputId1, inputId2)
-        return
     }
+
+    return distance
 }
 
-function initIdDatalist() {
+async function initIdDatalist() {
     var inputElm1 = document.createElement("input")
     var inputElm2 = document.createElement("input")
     var dataListElm = document.createElement("datalist")
@@ -543,7 +1345,7 @@ function initIdDatalist() {
 
     // don't forget to put a ; after the previous line
     // the spread syntax operator complains otherwise
-    var tempArray = [...Object.keys(inputMetadata)]
+    var tempArray = [...await getMetadataIds()]
     tempArray.sort() // toSorted not supported in old firefox
     tempArray.forEach(x => {
         var tempElm = document.createElement("option")
@@ -561,8 +1363,8 @@ function clearMetadataIdsAndResults() {
     restoreOriginalColours()
 }
 
-function initLabelByDropdown() {
-    var metadataFields = [...Object.keys(inputMetadata[Object.keys(inputMetadata)[0]])]
+async function initLabelByDropdown() {
+    var metadataFields = await getMetadataFields()
     var dropdownElm = document.createElement("select")
     var excludeFields = ["Nearest_neighbour"]
 
@@ -744,13 +1546,17 @@ function toggleDarkMode() {
                 border: 5px solid var(--table-row-even);
                 box-shadow: 0px 0px 4px var(--panel-background);
             }
-            #helpToggle {
+            #helpToggle, #debugToggle {
                 background: var(--page-background);
                 color: white;
                 border: 5px solid var(--table-row-even);
                 box-shadow: 0px 0px 4px var(--panel-background);
             }
-            #builtLabelField .labelBuilderLabel{
+            #debugPanel {
+                background: var(--panel-background);
+                color: var(--panel-foreground);
+            }
+            #builtLabelField .labelBuilderLabel, #facetFilterField .labelBuilderLabel{
                 background: white;
                 color: black;
                 border: 1px solid var(--table-row-odd);
@@ -763,6 +1569,127 @@ function toggleDarkMode() {
     }
 }
 
+// Performance: slow steps are timed with performance.mark/measure, and the
+// timings are shown, with the payload sizes and node counts, in a debug
+// panel that is hidden until its toggle is clicked. The panel can be saved
+// as JSON, to attach to a report that the tree is slow.
+function startTiming(inputName) {
+    // returns a function to call when the step is done
+    var markName = `${inputName} ${++timingMarkCount}`
+    performance.mark(markName)
+
+    return function () {
+        performance.measure(inputName, markName)
+        performance.clearMarks(markName)
+    }
+}
+
+function timePromise(inputName, inputPromise) {
+    var endTiming = startTiming(inputName)
+
+    return Promise.resolve(inputPromise).finally(endTiming)
+}
+
+function initDebugToggle() {
+    var toggleElm = document.createElement("div")
+    toggleElm.id = "debugToggle"
+
+    toggleElm.innerHTML = stopwatchEmoji
+    toggleElm.title = "Performance"
+    toggleElm.setAttribute("onclick", "toggleDebugPanel()")
+
+    var panelElm = document.createElement("div")
+    panelElm.id = "debugPanel"
+    panelElm.classList.add("hidden")
+
+    document.body.append(toggleElm, panelElm)
+}
+
+function toggleDebugPanel() {
+    var panelElm = document.getElementById("debugPanel")
+    panelElm.classList.toggle("hidden")
+
+    if (!panelElm.classList.contains("hidden")) {
+        showDebugInfo()
+    }
+}
+
+function getDebugInfo() {
+    var timings = {}
+    performance.getEntriesByType("measure").forEach(x => {
+        var timing = timings[x.name] ??= { count: 0, totalMs: 0, maxMs: 0, lastMs: 0 }
+        timing.count++
+        timing.totalMs += x.duration
+        timing.maxMs = Math.max(timing.maxMs, x.duration)
+        timing.lastMs = x.duration
+    })
+
+    var data = targetElm.data[0]
+    var reportType = isServedReport() ? "served"
+        : document.getElementById("intreeactiveManifest") ? "split assets"
+        : typeof payloadSizes !== "undefined" && payloadSizes.compressed ? "compressed" : "embedded"
+
+    return {
+        generated: new Date().toISOString(),
+        userAgent: navigator.userAgent,
+        reportType: reportType,
+        counts: {
+            nodes: data.x.length,
+            leaves: labelNodesByY.length,
+            trees: typeof inputTrees !== "undefined" ? inputTrees.length : 1,
+            metadataRows: typeof inputMetadata !== "undefined" ? inputMetadata.ids.length : null,
+            matrixSamples: typeof inputSnpMatrix !== "undefined" ? inputSnpMatrix.index.length : null,
+            levelOfDetail: isLevelOfDetailEnabled()
+        },
+        // the characters of each dataset written into the page, and the files fetched
+        payloadSizes: typeof payloadSizes !== "undefined" ? payloadSizes.sizes : {},
+        fetched: performance.getEntriesByType("resource").map(x => ({
+            name: x.name,
+            transferBytes: x.transferSize,
+            bytes: x.decodedBodySize,
+            ms: x.duration
+        })),
+        timings: timings
+    }
+}
+
+function showDebugInfo() {
+    var info = getDebugInfo()
+    var formatMs = x => x.toFixed(1)
+    var timingRows = Object.entries(info.timings).map(([name, x]) =>
+        `<tr><td>${name}</td><td>${x.count}</td><td>${formatMs(x.lastMs)}</td><td>${formatMs(x.totalMs / x.count)}</td><td>${formatMs(x.maxMs)}</td></tr>`)
+    var sizeRows = Object.entries(info.payloadSizes).map(([name, x]) => `<tr><td>${name}</td><td>${x.toLocaleString()}</td></tr>`)
+        .concat(info.fetched.map(x => `<tr><td>${x.name.split("/").pop()}</td><td>${x.bytes.toLocaleString()}</td></tr>`))
+    var countRows = Object.entries(info.counts).map(([name, x]) => `<tr><td>${name}</td><td>${x}</td></tr>`)
+
+    document.getElementById("debugPanel").innerHTML = `
+        <h3>Performance (${info.reportType} report)</h3>
+        <button onclick="showDebugInfo()">Refresh</button>
+        <button onclick="exportDebugInfo()">Save as JSON</button>
+        <table class="metadataTable">
+            <tr><th>Step</th><th>Count</th><th>Last ms</th><th>Mean ms</th><th>Max ms</th></tr>
+            ${timingRows.join("")}
+        </table>
+        <table class="metadataTable">
+            <tr><th>Data</th><th>Size</th></tr>
+            ${sizeRows.join("")}
+        </table>
+        <table class="metadataTable">
+            ${countRows.join("")}
+        </table>
+    `
+}
+
+function exportDebugInfo() {
+    var blob = new Blob([JSON.stringify(getDebugInfo(), null, 2)], { type: "application/json" })
+    var linkElm = document.createElement("a")
+
+    linkElm.href = URL.createObjectURL(blob)
+    linkElm.download = "intreeactive_performance.json"
+    linkElm.click()
+    setTimeout(() => URL.revokeObjectURL(linkElm.href))
+}
+
 function setRangeX(inputMin, inputMax) {
     var layout = {
         xaxis: {
@@ -833,6 +1760,446 @@ function resetScale() {
     setRangeY(...initialAxisRange.yaxis)
 }
 
+// branches: the report only has the node coordinates and the parent of each
+// node (in the clade summary), and the branches are drawn from these as one
+// SVG path. A clade's first child, vertical line and last child are one
+// line, and the other children have a line each.
+function getBranchPath(inputX, inputY, inputParents) {
+    var nodeCount = inputX.length
+    var parents = Int32Array.from(inputParents)
+    var firstChild = new Int32Array(nodeCount).fill(-1)
+    var lastChild = new Int32Array(nodeCount).fill(-1)
+    var path = []
+
+    for (var i = 0; i < nodeCount; i++) {
+        var p = parents[i]
+
+        if (p < 0) {
+            // the root's branch starts from 0
+            if (inputX[i] != 0) {
+                path.push(`M0 ${inputY[i]}H${inputX[i]}`)
+            }
+            continue
+        }
+        if (firstChild[p] < 0) {
+            firstChild[p] = i
+        }
+        lastChild[p] = i
+    }
+
+    for (var i = 0; i < nodeCount; i++) {
+        var p = parents[i]
+
+        if (firstChild[i] >= 0) {
+            var f = firstChild[i]
+            var l = lastChild[i]
+            path.push(`M${inputX[f]} ${inputY[f]}H${inputX[i]}V${inputY[l]}H${inputX[l]}`)
+        }
+        // zero length branches aren't drawn
+        if (p >= 0 && i != firstChild[p] && i != lastChild[p] && inputX[i] != inputX[p]) {
+            path.push(`M${inputX[p]} ${inputY[i]}H${inputX[i]}`)
+        }
+    }
+
+    return path.join("")
+}
+
+function getBranchShape(inputPath) {
+    return {
+        type: "path",
+        path: inputPath || "M0 0",
+        line: { color: "rgb(25,25,25)" },
+        layer: "below"
+    }
+}
+
+function initBranches() {
+    // large trees are drawn by initLevelOfDetail instead
+    if (cladeSummary === undefined || isLevelOfDetailEnabled()) {
+        return
+    }
+
+    var data = targetElm.data[0]
+    Plotly.relayout(targetElm, { shapes: [getBranchShape(getBranchPath(data.x, data.y, cladeSummary.parents))] })
+}
+
+// level of detail for large trees:
+// clades too small to see at the current zoom are drawn as one collapsed
+// triangle, and clades outside the visible y range are not drawn at all.
+// Detail is added back as the user zooms in.
+function isLevelOfDetailEnabled() {
+    return cladeSummary !== undefined && targetElm.data[0].x.length >= lodMinNodes
+}
+
+function initLevelOfDetail() {
+    if (!isLevelOfDetailEnabled()) {
+        return
+    }
+
+    // look up the clade (if any) for each node
+    cladeOfNode = new Int32Array(targetElm.data[0].x.length).fill(-1)
+    cladeSummary.clades.node.forEach((x, i) => { cladeOfNode[x] = i })
+
+    // set up once, but called again when another tree is shown
+    if (lodTraceIdx === undefined) {
+        // an invisible trace over the collapsed clades, so they show a hover text
+        lodTraceIdx = targetElm.data.length
+        Plotly.addTraces(targetElm, {
+            type: "scattergl",
+            x: [],
+            y: [],
+            text: [],
+            mode: "markers",
+            marker: { opacity: 0, size: 10 },
+            hoverinfo: "text",
+            showlegend: false
+        })
+
+        targetElm.on("plotly_relayout", function (eventData) {
+            // only redraw for changes to the axes or plot size, not our own shape updates
+            if (isLevelOfDetailEnabled() && Object.keys(eventData).some(x => x.startsWith("xaxis") || x.startsWith("yaxis") || x == "autosize")) {
+                scheduleLevelOfDetailUpdate()
+            }
+        })
+    }
+
+    updateLevelOfDetail()
+}
+
+function scheduleLevelOfDetailUpdate() {
+    // redraw at most once per frame while panning
+    if (!isLodUpdatePending) {
+        isLodUpdatePending = true
+        requestAnimationFrame(updateLevelOfDetail)
+    }
+}
+
+function updateLevelOfDetail() {
+    isLodUpdatePending = false
+
+    var x = targetElm.data[0].x
+    var y = targetElm.data[0].y
+    var parents = cladeSummary.parents
+    var clades = cladeSummary.clades
+    var [yRangeMin, yRangeMax] = targetElm.layout.yaxis.range
+    var plotHeight = targetElm._fullLayout.yaxis._length || targetElm.clientHeight
+    var pixelsPerY = plotHeight / Math.abs(yRangeMax - yRangeMin)
+    var branchPath = []
+    var collapsedPath = []
+    var collapsedPoints = { x: [], y: [], text: [] }
+
+    for (var i = 0; i < x.length; i++) {
+        var c = cladeOfNode[i]
+        var parentX = parents[i] >= 0 ? x[parents[i]] : 0
+
+        if (c < 0) {
+            // a leaf, draw its branch if it's in view
+            if (y[i] >= yRangeMin && y[i] <= yRangeMax) {
+                branchPath.push(`M${parentX} ${y[i]}H${x[i]}`)
+            }
+            continue
+        }
+
+        if (clades.yMax[c] < yRangeMin || clades.yMin[c] > yRangeMax) {
+            // the whole clade is out of view, skip it and its descendants
+            i = clades.end[c] - 1
+            continue
+        }
+
+        branchPath.push(`M${parentX} ${y[i]}H${x[i]}`)
+
+        if ((clades.yMax[c] - clades.yMin[c]) * pixelsPerY < lodCollapsePx) {
+            // too small to see, draw a triangle instead of its descendants
+            collapsedPath.push(`M ${x[i]} ${y[i]} L ${clades.xMax[c]} ${clades.yMin[c]} L ${clades.xMax[c]} ${clades.yMax[c]} Z`)
+            collapsedPoints.x.push((x[i] + clades.xMax[c]) / 2)
+            collapsedPoints.y.push(y[i])
+            collapsedPoints.text.push(`Collapsed clade: ${clades.leaves[c]} samples<br>Zoom in to see them`)
+            i = clades.end[c] - 1
+        }
+        else {
+            branchPath.push(`M${x[i]} ${clades.yFirstChild[c]}V${clades.yLastChild[c]}`)
+        }
+    }
+
+    var shapes = [getBranchShape(branchPath.join(""))]
+
+    if (collapsedPath.length) {
+        shapes.push({
+            type: "path",
+            path: collapsedPath.join(" "),
+            line: { color: "rgb(25,25,25)", width: 1 },
+            fillcolor: "rgba(100,100,100,0.3)",
+            layer: "below"
+        })
+    }
+
+    Plotly.relayout(targetElm, { shapes: shapes })
+    Plotly.restyle(targetElm, {
+        x: [collapsedPoints.x],
+        y: [collapsedPoints.y],
+        text: [collapsedPoints.text]
+    }, lodTraceIdx)
+}
+
+
+// Reports with more than one tree or a network colour them from
+// inputColourings, by the category last chosen in any colour dropdown.
+function initColourCategory() {
+    if (typeof inputColourings === "undefined") {
+        return
+    }
+
+    colourCategory = inputColourings.default
+    targetElm.on("plotly_buttonclicked", function (eventData) {
+        colourCategory = eventData.button.label
+    })
+}
+
+function syncColourCategory(inputElm, inputTraceIdx) {
+    // colour a plot by colourCategory, if it was chosen in another plot
+    var menu = inputElm.layout.updatemenus[0]
+    var active = menu.buttons.findIndex(x => x.label === colourCategory)
+
+    if (active < 0 || active === (menu.active ?? 0)) {
+        return
+    }
+    return Plotly.update(inputElm, menu.buttons[active].args[0], { "updatemenus[0].active": active }, [inputTraceIdx])
+}
+
+// Reports with more than one tree: the first tree is the figure, and the
+// others (inputTrees, see get_tree_view in intreeactive.py) only have their
+// layout and the metadata row of each node. Their hover text and colours
+// are made from the shared metadata and inputColourings when first shown.
+function initTreeSwitcher() {
+    if (typeof inputTrees === "undefined") {
+        return
+    }
+
+    var data = targetElm.data[0]
+    treeViews = [{
+        title: targetElm.layout.title.text,
+        x: data.x,
+        y: data.y,
+        text: data.text,
+        path: getTreeViewPath(data.x, data.y, cladeSummary),
+        cladeSummary: cladeSummary,
+        colours: Object.fromEntries(targetElm.layout.updatemenus[0].buttons.map(x => [x.label, x.args[0]["marker.color"][0]])),
+        axisRange: initialAxisRange
+    }]
+    var dropdownElm = document.createElement("select")
+    dropdownElm.id = "treeDropdown"
+    dropdownElm.setAttribute("onchange", "switchTree(Number(this.value))")
+
+    inputTrees.forEach((x, i) => {
+        var tempElm = document.createElement("option")
+        tempElm.innerHTML = x.name
+        tempElm.value = i
+        dropdownElm.append(tempElm)
+    })
+
+    var rowElm = document.createElement("tr")
+    rowElm.innerHTML = "<td>Tree</td><td></td>"
+    rowElm.lastChild.append(dropdownElm)
+    document.querySelector("#ashleyDiv table").rows[0].before(rowElm)
+}
+
+// large trees are drawn by updateLevelOfDetail when they are shown (see
+// isLevelOfDetailEnabled), so the path of every branch is only made for the
+// others
+function getTreeViewPath(inputX, inputY, inputCladeSummary) {
+    if (inputX.length >= lodMinNodes) {
+        return null
+    }
+    return getBranchPath(inputX, inputY, inputCladeSummary.parents)
+}
+
+function getHoverText(inputRow) {
+    // the same as make_hover_text in intreeactive.py
+    var fieldText = inputMetadata.fields.map(field => {
+        var value = getMetadataValue(inputRow, field)
+        return `${field}: ${Array.isArray(value) ? value.join("<br>") : value}<br>`
+    })
+
+    return `${inputMetadata.ids[inputRow]}<br>${fieldText.join("")}`
+}
+
+function getTreeView(inputTreeIdx) {
+    if (!treeViews[inputTreeIdx]) {
+        var tree = inputTrees[inputTreeIdx]
+        var intermediateNodeColour = "rgb(100,100,100)"
+
+        treeViews[inputTreeIdx] = {
+            title: tree.title,
+            x: tree.x,
+            y: tree.y,
+            text: tree.rows.map((row, i) => row >= 0 ? getHoverText(row) : tree.labels[i] ?? null),
+            path: getTreeViewPath(tree.x, tree.y, tree.cladeSummary),
+            cladeSummary: tree.cladeSummary,
+            colours: Object.fromEntries(Object.entries(inputColourings.categories).map(([category, column]) => [
+                category,
+                tree.rows.map(row => row >= 0 ? getColumnValue(column, row) : intermediateNodeColour)
+            ]))
+        }
+    }
+
+    return treeViews[inputTreeIdx]
+}
+
+async function switchTree(inputTreeIdx) {
+    var view = getTreeView(inputTreeIdx)
+
+    if (isCustomColoursEnabled) {
+        restoreOriginalColours()
+        highlightInputElm.value = ""
+    }
+    if (lodTraceIdx !== undefined) {
+        Plotly.restyle(targetElm, { x: [[]], y: [[]], text: [[]] }, lodTraceIdx)
+    }
+
+    var buttons = targetElm.layout.updatemenus[0].buttons.map(x => ({
+        ...x,
+        args: [{ "marker.color": [view.colours[x.label]] }]
+    }))
+
+    cladeSummary = view.cladeSummary
+    await Plotly.update(targetElm, {
+        x: [view.x],
+        y: [view.y],
+        text: [view.text],
+        "marker.color": [view.colours[colourCategory]]
+    }, {
+        "title.text": view.title,
+        "updatemenus[0].buttons": buttons,
+        shapes: [getBranchShape(view.path)]
+    }, [0])
+
+    initSearchIndex()
+    indexLabelNodes()
+    initLevelOfDetail()
+
+    // each tree has its own scale, worked out by plotly the first time it is shown
+    if (!view.axisRange) {
+        await Plotly.relayout(targetElm, { "xaxis.autorange": true, "yaxis.autorange": true })
+        view.axisRange = {
+            xaxis: [...targetElm.layout.xaxis.range],
+            yaxis: [...targetElm.layout.yaxis.range]
+        }
+    }
+    initialAxisRange = view.axisRange
+    resetScale()
+
+    if (isLabelsShown) {
+        showLabels()
+    }
+    if (facetSelections.size || dateFilter) {
+        applyFacetFilter()
+    }
+}
+
+
+// Minimum spanning network (inputNetwork, see get_network_view in
+// intreeactive.py): a second plot in the left panel, in place of the tree,
+// drawn the first time it is shown. Like the other trees, its hover text and
+// colours are made from the shared metadata and inputColourings.
+function initNetworkView() {
+    if (typeof inputNetwork === "undefined") {
+        return
+    }
+
+    networkElm = document.createElement("div")
+    networkElm.id = "networkDiv"
+    networkElm.style.display = "none"
+    targetElm.parentElement.after(networkElm)
+
+    var dropdownElm = document.createElement("select")
+    dropdownElm.id = "viewDropdown"
+    dropdownElm.setAttribute("onchange", "switchView(this.value)")
+    dropdownElm.innerHTML = `<option value="tree">Tree</option><option value="network">Minimum spanning network</option>`
+
+    var rowElm = document.createElement("tr")
+    rowElm.innerHTML = "<td>View</td><td></td>"
+    rowElm.lastChild.append(dropdownElm)
+    document.querySelector("#ashleyDiv table").rows[0].before(rowElm)
+}
+
+function getNetworkFigure() {
+    var network = inputNetwork
+    var edgeX = new Array(network.sources.length * 3).fill(null)
+    var edgeY = new Array(network.sources.length * 3).fill(null)
+    var middleX = new Array(network.sources.length)
+    var middleY = new Array(network.sources.length)
+    var middleText = new Array(network.sources.length)
+
+    // the edges are one line broken by nulls, with an invisible marker
+    // half way along each for its hover text
+    network.sources.forEach((source, i) => {
+        var target = network.targets[i]
+        edgeX[3 * i] = network.x[source]
+        edgeX[3 * i + 1] = network.x[target]
+        edgeY[3 * i] = network.y[source]
+        edgeY[3 * i + 1] = network.y[target]
+        middleX[i] = (network.x[source] + network.x[target]) / 2
+        middleY[i] = (network.y[source] + network.y[target]) / 2
+        middleText[i] = `${inputMetadata.ids[network.rows[source]]} - ${inputMetadata.ids[network.rows[target]]}: ${network.snps[i]} SNPs`
+    })
+
+    var colours = Object.fromEntries(Object.entries(inputColourings.categories).map(([category, column]) => [
+        category,
+        Array.from(network.rows, row => getColumnValue(column, row))
+    ]))
+    var buttons = Object.keys(colours).map(category => ({
+        label: category,
+        method: "restyle",
+        args: [{ "marker.color": [colours[category]] }, [2]]
+    }))
+    var active = Math.max(buttons.findIndex(x => x.label === colourCategory), 0)
+
+    var data = [
+        { type: "scattergl", x: edgeX, y: edgeY, mode: "lines", line: { color: "rgb(150,150,150)", width: 1 }, hoverinfo: "skip" },
+        { type: "scattergl", x: middleX, y: middleY, mode: "markers", marker: { size: 8, opacity: 0 }, text: middleText, hoverinfo: "text" },
+        {
+            type: "scattergl", x: network.x, y: network.y, mode: "markers",
+            marker: { color: colours[buttons[active].label], size: 10 },
+            text: Array.from(network.rows, row => getHoverText(row)), hoverinfo: "text"
+        }
+    ]
+    var layout = {
+        title: { text: `Minimum spanning network (samples up to ${network.maxSnps} SNPs apart)`, yanchor: "top", y: 0.95 },
+        font: targetElm.layout.font,
+        showlegend: false,
+        autosize: true,
+        xaxis: { visible: false },
+        yaxis: { visible: false, scaleanchor: "x" },
+        hovermode: "closest",
+        plot_bgcolor: targetElm.layout.plot_bgcolor,
+        margin: targetElm.layout.margin,
+        updatemenus: [{ ...targetElm.layout.updatemenus[0], buttons: buttons, active: active }]
+    }
+
+    return { data: data, layout: layout }
+}
+
+async function switchView(inputView) {
+    var isNetworkShown = inputView === "network"
+    targetElm.parentElement.style.display = isNetworkShown ? "none" : ""
+    networkElm.style.display = isNetworkShown ? "" : "none"
+
+    if (isNetworkShown && !networkElm.data) {
+        var endTiming = startTiming("network")
+        var figure = getNetworkFigure()
+        await Plotly.newPlot(networkElm, figure.data, figure.layout, { responsive: true })
+        networkElm.on("plotly_buttonclicked", function (eventData) {
+            colourCategory = eventData.button.label
+        })
+        endTiming()
+    }
+
+    // plots hidden when the window changed size are the wrong size
+    var shownElm = isNetworkShown ? networkElm : targetElm
+    await Plotly.Plots.resize(shownElm)
+    await syncColourCategory(shownElm, isNetworkShown ? 2 : 0)
+}
+
 
 // globals
 const targetElm = document.getElementsByClassName("plotly-graph-div")[0]
@@ -840,7 +2207,7 @@ const metadataElm = document.getElementById("metadataDiv")
 const metadataControlsElm = document.getElementById("metadataDivControls")
 const highlightInputElm = document.getElementById("highlightInput")
 const snpThresholdSpinnerElm = document.getElementById("snpThresholdSpinner")
-const initialAxisRange = {
+var initialAxisRange = {
     xaxis: targetElm.layout.xaxis.range,
     yaxis: targetElm.layout.yaxis.range
 }
@@ -852,6 +2219,8 @@ var isLabelsShown = false
 var snpThreshold
 const sunEmoji = "&#x2600;"
 const moonEmoji = "&#x263E;"
+const stopwatchEmoji = "&#x23F1;"
+var timingMarkCount = 0
 var isDarkModeEnabled = false;
 var rangeMin = -0.1
 var rangeMax = 0.5
@@ -860,17 +2229,65 @@ var minInputElm = document.getElementById("minInput")
 var rainbowMode = false
 var builtLabelArray = []
 var builtLabelSeparator = " | " // consider underscore, interpunct, space, slash...
+const lodMinNodes = 10000 // trees with fewer nodes than this are always drawn in full
+const lodCollapsePx = 10 // clades shorter than this on screen are collapsed
+var cladeOfNode
+var lodTraceIdx
+var isLodUpdatePending = false
+var metadataTableRequestCount = 0
+var labelMetadataCache = {}
+var metadataIndex
+var snpWorker
+var snpWorkerRequests = new Map()
+var snpWorkerRequestCount = 0
+const searchGramLength = 3
+const highlightInputDelayMs = 150
+var searchIds
+var searchIndex
+var searchNodesById
+var highlightTraceIdx
+var highlightedNodeKey
+var highlightInputTimer
+const maxLabels = 1000 // more labels than this in view would overlap too much to read
+var labelNodesByY
+var labelNodeY
+var labelRequestCount = 0
+var isLabelUpdatePending = false
+var cladeSummary = typeof inputCladeSummary !== "undefined" ? inputCladeSummary : undefined
+var treeViews
+var colourCategory
+var facetSelections = new Map()
+var facetBitsets = new Map()
+var facetNodeRows
+var facetNodeRowsIds
+var dateColumns = new Map()
+var dateFilter
+var isDateFilterUpdatePending = false
+var networkElm
 
 // init
 function init() {
+    var endTiming = startTiming("init")
+    initSnpWorker();
+    initSearchIndex();
+    initLabelIndex();
     initIdDatalist();
     initLabelByDropdown();
     initSnpThresholdRadio();
     initDarkModeToggle();
     initHelpToggle();
+    initBranches();
+    initLevelOfDetail();
+    initColourCategory();
+    initTreeSwitcher();
+    initNetworkView();
+    initDateFilter();
+    initFacetFilter();
+    initDebugToggle();
     targetElm.on("plotly_update", function () {
         originalColours = targetElm.data[0].marker.color
     })
+    endTiming()
 }
 
 init();
\ No newline at end of file
@@ -0,0 +1,121 @@
+import concurrent.futures
+import gzip
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+
+# Each base has its own bit, so two sequences have the same base at a site when their codes share a bit. Anything else
+# (N, gaps and other ambiguity codes) is 0 and is not counted as a difference, as snp-dists does by default.
+BASE_CODES = np.zeros(256, dtype=np.uint8)
+for _bit, _bases in enumerate(['Aa', 'Cc', 'Gg', 'Tt']):
+    for _base in _bases:
+        BASE_CODES[ord(_base)] = 1 << _bit
+# The number of set bits in each byte.
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+# Roughly the most memory (in bytes) one comparison of two blocks of samples uses.
+TILE_BYTES = 1 << 25
+
+
+def _read_fasta(path_to_alignment: str | os.PathLike):
+    """
+    Read the sequences of a FASTA file, which can be gzipped.
+    :param path_to_alignment: string or path to the FASTA file.
+    :return: generator of (sample ID, base codes of the sequence), where the ID is the title up to the first space.
+    """
+    opener = gzip.open if str(path_to_alignment).endswith('.gz') else open
+    with opener(path_to_alignment, 'rt') as alignment_file:
+        for title, sequence in SimpleFastaParser(alignment_file):
+            sample_id = (title.split(maxsplit=1) or [''])[0]
+            yield sample_id, BASE_CODES[np.frombuffer(sequence.encode('latin-1'), dtype=np.uint8)]
+
+
+def read_alignment(path_to_alignment: str | os.PathLike) -> tuple[list[str], np.ndarray]:
+    """
+    Read a whole genome (or core genome) alignment, keeping only the sites where two samples have different bases, as
+    only these can add to the SNP distances. The file is read twice - first to find those sites, then to keep them - so
+    the whole alignment is never held in memory.
+    :param path_to_alignment: string or path to the FASTA file, which can be gzipped.
+    :return: tuple of the sample IDs, and an array of the base codes (see BASE_CODES) at the variable sites, with a row
+        for each sample.
+    """
+    sample_ids = []
+    bases_seen = None
+    for sample_id, codes in _read_fasta(path_to_alignment):
+        if bases_seen is None:
+            bases_seen = np.zeros(len(codes), dtype=np.uint8)
+        elif len(codes) != len(bases_seen):
+            sys.exit(f"Error: \n "
+                     f"Sequence {sample_id} is {len(codes)} bases long, but {sample_ids[0]} is {len(bases_seen)}. All "
+                     f"sequences in the alignment must be the same length. \n"
+                     f"Exiting...")
+        bases_seen |= codes
+        sample_ids.append(sample_id)
+    if bases_seen is None:
+        sys.exit(f"Error: \n "
+                 f"No sequences found in {path_to_alignment}. \n"
+                 f"Exiting...")
+    if len(set(sample_ids)) < len(sample_ids):
+        duplicates = pd.Index(sample_ids)[pd.Index(sample_ids).duplicated()].unique().to_list()
+        sys.exit(f"Error: \n "
+                 f"Sample IDs {duplicates} occur more than once in the alignment. \n"
+                 f"Exiting...")
+
+    variable_sites = np.flatnonzero(POPCOUNT[bases_seen] > 1)
+    variable_codes = np.empty((len(sample_ids), len(variable_sites)), dtype=np.uint8)
+    for row, (_, codes) in enumerate(_read_fasta(path_to_alignment)):
+        variable_codes[row] = codes[variable_sites]
+    return sample_ids, variable_codes
+
+
+def get_snp_distances(codes: np.ndarray, *, threads: int = None) -> np.ndarray:
+    """
+    Count the sites where each pair of samples have different bases (A, C, G or T - other characters are not
+    compared), as snp-dists does. The sites are packed into bits, with one bit array for each base and one for the
+    sites that have a base, so a pair of samples is compared eight sites at a time. Blocks of the matrix are worked out
+    at the same time on threads.
+    :param codes: array of base codes (see BASE_CODES), with a row for each sample.
+    :param threads: number of threads to use. (int, default = None, the number of CPUs)
+    :return: square array of SNP distances, in the order of the rows of codes.
+    """
+    n_samples = len(codes)
+    has_base = np.packbits(codes != 0, axis=1)
+    bases = [np.packbits((codes & (1 << bit)) != 0, axis=1) for bit in range(4)]
+    distances = np.zeros((n_samples, n_samples), dtype=np.uint32)
+
+    # Square blocks, sized so that comparing one block to another (for every packed site) fits in TILE_BYTES.
+    block_size = max(1, int(np.sqrt(TILE_BYTES / max(has_base.shape[1], 1))))
+    starts = range(0, n_samples, block_size)
+
+    def compare_blocks(row_start: int, column_start: int) -> None:
+        rows = slice(row_start, row_start + block_size)
+        columns = slice(column_start, column_start + block_size)
+        same_base = np.zeros((len(has_base[rows]), len(has_base[columns]), has_base.shape[1]), dtype=np.uint8)
+        for base in bases:
+            same_base |= base[rows, None, :] & base[None, columns, :]
+        different_base = has_base[rows, None, :] & has_base[None, columns, :] & ~same_base
+        block_distances = POPCOUNT[different_base].sum(axis=2, dtype=np.uint32)
+        # The matrix is symmetric, so only the blocks on or above the diagonal are worked out
+        distances[rows, columns] = block_distances
+        distances[columns, rows] = block_distances.T
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads or os.cpu_count()) as executor:
+        # list() so that an error in any block is raised here
+        list(executor.map(lambda pair: compare_blocks(*pair),
+                          [(row_start, column_start) for row_start in starts for column_start in starts
+                           if column_start >= row_start]))
+    return distances
+
+
+def read_in_alignment_snp_dists(path_to_alignment: str | os.PathLike, *, threads: int = None) -> pd.DataFrame:
+    """
+    Work out the SNP distance matrix from an alignment, instead of reading one in with read_in_snp_dist_matrix.
+    :param path_to_alignment: string or path to the FASTA file, which can be gzipped.
+    :param threads: number of threads to use. (int, default = None, the number of CPUs)
+    :return: Pandas dataframe of SNP distances, with the sample IDs as the index and columns.
+    """
+    sample_ids, codes = read_alignment(path_to_alignment)
+    print(f"Working out SNP distances for {len(sample_ids)} samples from {codes.shape[1]} variable sites...")
+    return pd.DataFrame(get_snp_distances(codes, threads=threads), index=sample_ids, columns=sample_ids)
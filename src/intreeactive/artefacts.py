@@ -0,0 +1,182 @@
+import datetime
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from intreeactive import __version__, intreeactive
+from intreeactive.compact_tree import CompactTree
+
+# The manifest describes the other files, so a bundle can be read back (by read_artefacts, or another pipeline).
+MANIFEST_NAME = 'manifest.json'
+ARTEFACTS_FORMAT = 'intreeactive-artefacts'
+ARTEFACTS_VERSION = 1
+
+
+def get_nearest_neighbour_table(nearest_neighbours: pd.Series) -> pd.DataFrame:
+    """
+    Turn the nearest neighbours from get_all_nearest_neighbours ("<ID>=<distance>" joined by "<br>") into a table with
+    a row for each sample and neighbour.
+    :param nearest_neighbours: series of sample ID: nearest neighbours.
+    :return: dataframe with columns sample, neighbour and snps, in the order of the series.
+    """
+    neighbours = nearest_neighbours[nearest_neighbours != ""].str.split("<br>").explode()
+    neighbours = neighbours.str.rsplit("=", n=1, expand=True).reindex(columns=[0, 1])
+    return pd.DataFrame({'sample': neighbours.index.astype(str),
+                         'neighbour': neighbours[0].to_numpy(),
+                         'snps': pd.to_numeric(neighbours[1]).to_numpy()})
+
+
+def get_nearest_neighbours_from_table(neighbour_table: pd.DataFrame) -> pd.Series:
+    """
+    The reverse of get_nearest_neighbour_table.
+    :param neighbour_table: dataframe with columns sample, neighbour and snps.
+    :return: series of sample ID: nearest neighbours, as get_all_nearest_neighbours.
+    """
+    neighbours = neighbour_table['neighbour'] + '=' + neighbour_table['snps'].astype(str)
+    return neighbours.groupby(neighbour_table['sample'].to_numpy(), sort=False).agg("<br>".join)
+
+
+def get_tree_table(tree) -> pd.DataFrame:
+    """
+    Get the nodes of a tree as a table, in depth first order: the tree structure (as in CompactTree), branch lengths,
+    names and the node coordinates of the plot. The branches are drawn from (x of the parent, y) to (x, y), and each
+    internal node has a vertical line from the y of its first child to the y of its last child.
+    :param tree: Bio Phylo Tree object or CompactTree.
+    :return: dataframe with a row for each node.
+    """
+    if not isinstance(tree, CompactTree):
+        tree = CompactTree.from_phylo(tree)
+    return pd.DataFrame({'name': pd.Series(tree.names, dtype=object),
+                         'parent': tree.parents,
+                         'first_child': tree.first_children,
+                         'next_sibling': tree.next_siblings,
+                         'branch_length': tree.branch_lengths,
+                         'x': np.asarray(tree.get_x_coordinates(), dtype=float),
+                         'y': np.asarray(tree.get_y_coordinates(), dtype=float)})
+
+
+def write_artefacts(*,
+                    output_dir: str | os.PathLike,
+                    trees: dict,
+                    metadata: pd.DataFrame,
+                    id_column: str = 'ID',
+                    snp_distance_matrix: pd.DataFrame,
+                    nearest_neighbours: pd.Series,
+                    title: str = None) -> Path:
+    """
+    Write what goes into a report as files other programs can read, and that read_artefacts can make the report from
+    again:
+     - metadata.parquet: the metadata of the samples in the report (after check_ids).
+     - nearest_neighbours.parquet: the nearest neighbours of every sample in the matrix (sample, neighbour, snps).
+     - colours.parquet: the colour of each metadata row for each colour option (see get_row_colourings), in the
+       same order as metadata.parquet.
+     - snp_matrix.npz: the sample IDs ("ids") and SNP distances ("values", in the smallest dtype that holds them).
+     - tree_<n>.parquet: the nodes of each tree (see get_tree_table).
+     - manifest.json: the names of these files, the title, ID column and the trees.
+    :param output_dir: directory to write to, made if it doesn't exist.
+    :param trees: dict of tree name: Bio Phylo Tree object or CompactTree, rooted and ladderized.
+    :param metadata: Pandas dataframe of metadata.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances.
+    :param nearest_neighbours: the nearest neighbours from get_all_nearest_neighbours.
+    :param title: string, title of the plot.
+    :return: path of the manifest.
+    """
+    if intreeactive.pyarrow is None:
+        sys.exit(f"Error: \n Writing artefacts needs pyarrow, but pyarrow could not be imported "
+                 f"({intreeactive.pyarrow_import_error}). Install it with pip install 'pyarrow>=14,<16'. \n Exiting...")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    metadata = metadata.drop(columns="Nearest_neighbour", errors='ignore').reset_index(drop=True)
+    metadata.to_parquet(output_dir / 'metadata.parquet', index=False)
+    get_nearest_neighbour_table(nearest_neighbours).to_parquet(output_dir / 'nearest_neighbours.parquet', index=False)
+    default_colour, row_colourings = intreeactive.get_row_colourings(metadata, id_column)
+    row_colourings.to_parquet(output_dir / 'colours.parquet', index=False)
+
+    matrix_values = snp_distance_matrix.to_numpy()
+    np.savez_compressed(output_dir / 'snp_matrix.npz',
+                        ids=snp_distance_matrix.index.astype(str).to_numpy(dtype=str),
+                        values=matrix_values.astype(intreeactive.get_smallest_dtype(matrix_values)))
+
+    tree_entries = []
+    for index, (name, tree) in enumerate(trees.items()):
+        tree_file = f'tree_{index}.parquet'
+        get_tree_table(tree).to_parquet(output_dir / tree_file, index=False)
+        tree_entries.append(dict(name=name, file=tree_file, leaves=len(intreeactive.get_leaf_names(tree))))
+
+    manifest = dict(format=ARTEFACTS_FORMAT,
+                    version=ARTEFACTS_VERSION,
+                    intreeactive_version=__version__,
+                    created=datetime.datetime.now().isoformat(timespec='seconds'),
+                    title=title,
+                    id_column=id_column,
+                    default_colour=default_colour,
+                    samples=len(metadata),
+                    files=dict(metadata='metadata.parquet',
+                               nearest_neighbours='nearest_neighbours.parquet',
+                               colours='colours.parquet',
+                               snp_matrix='snp_matrix.npz'),
+                    trees=tree_entries)
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest_path.write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+    return manifest_path
+
+
+def read_artefact_colours(artefacts_dir: str | os.PathLike, metadata: pd.DataFrame) -> pd.DataFrame | None:
+    """
+    Read the colours written by write_artefacts, to colour a report made from the artefacts without working them out
+    again (see write_interactive_tree).
+    :param artefacts_dir: the directory with manifest.json in it.
+    :param metadata: the metadata from read_artefacts. Only the colours of its columns are read.
+    :return: dataframe of the colour of each metadata row for each colour option, or None if there are no colours.
+    """
+    artefacts_dir = Path(artefacts_dir)
+    manifest = json.loads((artefacts_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+    colours_file = manifest['files'].get('colours')
+    if colours_file is None:
+        return None
+    colour_columns = intreeactive.get_table_file_columns(artefacts_dir / colours_file, 'parquet')
+    return pd.read_parquet(artefacts_dir / colours_file,
+                           columns=[column for column in colour_columns if column in metadata.columns])
+
+
+def read_artefacts(artefacts_dir: str | os.PathLike, *, metadata_columns: list[str] = None) -> tuple:
+    """
+    Read the files written by write_artefacts, to make the report again without the original inputs.
+    :param artefacts_dir: the directory with manifest.json in it.
+    :param metadata_columns: only read these metadata columns, and the ID column. (default = None, all columns)
+    :return: tuple of a dict of tree name: CompactTree, the metadata, ID column, SNP distance matrix, nearest
+        neighbours (as get_all_nearest_neighbours) and the title the artefacts were written with.
+    """
+    artefacts_dir = Path(artefacts_dir)
+    manifest_path = artefacts_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        sys.exit(f"Error: \n No {MANIFEST_NAME} in {artefacts_dir}. \n Exiting...")
+    manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+    if manifest.get('format') != ARTEFACTS_FORMAT or manifest.get('version', 0) > ARTEFACTS_VERSION:
+        sys.exit(f"Error: \n {manifest_path} is not a version {ARTEFACTS_VERSION} intreeactive artefacts manifest. \n"
+                 f"Exiting...")
+    files = {name: artefacts_dir / file_name for name, file_name in manifest['files'].items()}
+
+    metadata, id_column = intreeactive.read_in_metadata(files['metadata'],
+                                                        id_column=manifest['id_column'],
+                                                        columns=metadata_columns)
+    nearest_neighbours = get_nearest_neighbours_from_table(pd.read_parquet(files['nearest_neighbours']))
+    with np.load(files['snp_matrix']) as snp_matrix:
+        ids = snp_matrix['ids']
+        snp_distance_matrix = pd.DataFrame(snp_matrix['values'], index=ids, columns=ids)
+
+    trees = {}
+    for tree_entry in manifest['trees']:
+        tree_table = pd.read_parquet(artefacts_dir / tree_entry['file'])
+        trees[tree_entry['name']] = CompactTree(parents=tree_table['parent'].to_numpy(),
+                                                first_children=tree_table['first_child'].to_numpy(),
+                                                next_siblings=tree_table['next_sibling'].to_numpy(),
+                                                branch_lengths=tree_table['branch_length'].to_numpy(),
+                                                names=tree_table['name'].to_list())
+    return trees, metadata, id_column, snp_distance_matrix, nearest_neighbours, manifest['title']
@@ -4,58 +4,83 @@ import glob
 import sys
 import datetime
 import textwrap
+import concurrent.futures
 
-from intreeactive import intreeactive
+from intreeactive import alignment, artefacts, diff, intreeactive, server
 
 
 #####################
 # Setup CL arguments
-def get_args():
-    parser = argparse.ArgumentParser(
-        prog='intreeactive',
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog=textwrap.dedent('''\
-        Create an interactive tree in one html file. 
-        
-        It has interactive features such as move, zoom and pan, on-hover sample metadata, node colouring, custom node 
-        label creation and identifying neighbours using custom SNP distance thresholds.
-        All information and code needed is included in one html file. 
-        
-        Quick start with example:
-        intreeactive --tree example/tb_in_middle_earth_tree.new --metadata example/tb_in_middle_earth_metadata.csv \
---snp-distance-matrix example/tb_in_middle_earth_snpdists_matrix.txt -d example -o example_interactive_tree\
--O AL123456.3 -x AL123456.3 -I 'ID_col' --title 'Example interactive phylogeny: TB in Middle Earth.' --force
-        '''
-                               )
-    )
+def _add_input_arguments(parser: argparse.ArgumentParser, *, required: bool = True) -> None:
+    """
+    Add the arguments for the input files, shared by making and serving a report.
+    :param parser: arg parse object
+    :param required: whether the tree, metadata and SNP distance matrix must be given (default = True)
+    :return: None
+    """
     parser.add_argument(
         '--tree',
         '-t',
         dest='tree_path',
         type=str,
-        required=True,
+        action='append',
+        required=required,
         help='Required: supply the path to the tree file. If file is not Newick format, specify the tree type using '
-             '--tree-format/-tf'
+             '--tree-format/-tf. Give --tree more than once to make one report that can switch between the trees, '
+             'for example a whole dataset and its clusters. The metadata and SNP distances are stored once for all '
+             'of them.'
     )
     parser.add_argument(
         '--metadata',
         '-m',
         dest='metadata_path',
         type=str,
-        required=True,
+        required=required,
         help='Required: supply the path to the metadata file. The first column will be used as the sample ID unless '
              'specified with --id-column/-id. This sample ID will be used to match samples in the tree, metadata and '
              'SNP distance matrix. If any samples are not present in the metadata but are in the tree or snp distance '
-             'matrix, use the --ignore-ids/-x to ignore these.'
+             'matrix, use the --ignore-ids/-x to ignore these. Can be delimited text, Parquet or Arrow/Feather '
+             '(Parquet and Arrow need pyarrow installed).'
     )
     parser.add_argument(
+        '--metadata-column',
+        dest='metadata_columns',
+        type=str,
+        action='append',
+        required=False,
+        default=None,
+        help='Optional: only use this metadata column (and the ID column). Can supply one or many --metadata-column '
+             'arguments. Parquet and Arrow metadata files are read by column, so the other columns are not read at '
+             'all. Default=all columns.'
+    )
+    snp_distances = parser.add_mutually_exclusive_group(required=required)
+    snp_distances.add_argument(
         '--snp-distance-matrix',
         '-s',
         dest='snp_distance_matrix_path',
         type=str,
-        required=True,
-        help='Required: Supply path to the SNP distance matrix. Can use any seperator, the order of the columns must be '
-             'identical to the order of the rows.'
+        help='Required (or --alignment): Supply path to the SNP distance matrix. Can use any seperator, the rows and '
+             'columns must be the same samples. Can be the whole matrix, or only the lower or upper triangle with the '
+             'other cells left empty. Can also be Parquet or Arrow/Feather, with the sample names in the first column '
+             '(or as the index, if written from pandas).'
+    )
+    snp_distances.add_argument(
+        '--alignment',
+        '-a',
+        dest='alignment_path',
+        type=str,
+        help='Required (or --snp-distance-matrix): supply the path to a FASTA alignment (which can be gzipped) to work '
+             'out the SNP distances from, instead of a SNP distance matrix. Differences are counted as snp-dists does: '
+             'only sites where both samples have A, C, G or T.'
+    )
+    parser.add_argument(
+        '--threads',
+        dest='threads',
+        type=int,
+        required=False,
+        default=None,
+        help='Optional: number of threads used to work out the SNP distances from --alignment, and of processes used '
+             'to find the nearest neighbours in large SNP distance matrices. Default=the number of CPUs.'
     )
     parser.add_argument(
         '--tree-format',
@@ -67,6 +92,15 @@ def get_args():
         help='Optional: if the tree file is not Newick (.new or .newick), supply the tree file format. '
              'Default: "Newick"'
     )
+    parser.add_argument(
+        '--compact-tree',
+        dest='compact_tree',
+        action='store_true',
+        required=False,
+        help='Optional: hold the tree in compact arrays instead of Biopython objects, which is faster and uses much '
+             'less memory for large trees. Newick trees are read directly, other formats are read with Biopython '
+             'first. The report is the same either way.'
+    )
     parser.add_argument(
         '--outgroup',
         '-O',
@@ -98,6 +132,104 @@ def get_args():
         help='Optional: supply the name(s) of the ID(s) to be ignored - these are IDs that are present in the tree but '
              'not in the SNP distance matrix or the metadata, for example the outgroup/reference. Default=None.'
     )
+    parser.add_argument(
+        '--focus',
+        dest='focus_path',
+        type=str,
+        required=False,
+        default=None,
+        help='Optional: supply the path to a file of sample IDs (one per line) to focus the report on. The tree, '
+             'metadata and SNP distance matrix are cut down to these samples and their context (see --context-snps '
+             'and --ancestral-hops) before the report is made, so this is fast on large datasets. Default=None.'
+    )
+    parser.add_argument(
+        '--context-snps',
+        '-k',
+        dest='context_snps',
+        type=int,
+        required=False,
+        default=0,
+        help='Optional: with --focus, also include every sample within this many SNPs of a focus sample. Default=0.'
+    )
+    parser.add_argument(
+        '--ancestral-hops',
+        dest='ancestral_hops',
+        type=int,
+        required=False,
+        default=0,
+        help='Optional: with --focus, also include every sample below the node this many steps up the tree from each '
+             'focus sample. Default=0.'
+    )
+
+
+def _add_report_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the arguments for how the report looks, shared by making and serving a report.
+    :param parser: arg parse object
+    :return: None
+    """
+    parser.add_argument(
+        '--title',
+        '-y',
+        dest='title',
+        type=str,
+        required=False,
+        default=None,
+        help='Optional: Title to be added to the interactive tree. Default="Interactive Tree - <date today>".'
+    )
+    parser.add_argument(
+        '--renderer',
+        dest='renderer',
+        type=str,
+        required=False,
+        choices=['fast', 'plotly'],
+        default='fast',
+        help='Optional: how the plot is written. "fast" writes the plot data directly, "plotly" builds it through '
+             'plotly graph objects first, which is slower on large trees. Default="fast".'
+    )
+
+
+def get_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='intreeactive',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=textwrap.dedent('''\
+        Create an interactive tree in one html file. 
+        
+        It has interactive features such as move, zoom and pan, on-hover sample metadata, node colouring, custom node 
+        label creation and identifying neighbours using custom SNP distance thresholds.
+        All information and code needed is included in one html file. 
+        
+        Quick start with example:
+        intreeactive --tree example/tb_in_middle_earth_tree.new --metadata example/tb_in_middle_earth_metadata.csv \
+--snp-distance-matrix example/tb_in_middle_earth_snpdists_matrix.txt -d example -o example_interactive_tree\
+-O AL123456.3 -x AL123456.3 -I 'ID_col' --title 'Example interactive phylogeny: TB in Middle Earth.' --force
+
+        For datasets too big for one html file, the report can be served instead, see: intreeactive serve --help
+        '''
+                               )
+    )
+    _add_input_arguments(parser, required=False)
+    parser.add_argument(
+        '--from-artefacts',
+        dest='from_artefacts',
+        type=str,
+        required=False,
+        default=None,
+        help='Optional: make the report from a directory written by --emit-artefacts, instead of --tree, --metadata '
+             'and --snp-distance-matrix, for example to change the title or the metadata columns (--metadata-column) '
+             'without reading and checking the inputs again. Default=None.'
+    )
+    parser.add_argument(
+        '--emit-artefacts',
+        dest='emit_artefacts',
+        type=str,
+        required=False,
+        default=None,
+        help='Optional: also write what goes into the report to this directory, as files other programs can read: '
+             'the metadata, nearest neighbours, node colours and tree nodes (with their coordinates) as Parquet, the '
+             'SNP distances as NumPy .npz, and a manifest.json listing them. Needs pyarrow. Default=None.'
+    )
     parser.add_argument(
         '--output',
         '-o',
@@ -119,21 +251,144 @@ def get_args():
         help='Optional: Name of directory or path with directory to be used to save the output into. '
              'If it does not already exist, it will be created. Default=current working directory.'
     )
+    _add_report_arguments(parser)
     parser.add_argument(
-        '--title',
-        '-y',
-        dest='title',
-        type=str,
+        '--network-snps',
+        dest='network_snps',
+        type=int,
         required=False,
         default=None,
-        help='Optional: Title to be added to the interactive tree. Default="Interactive Tree - <date today>".'
+        help='Optional: add a minimum spanning network of the samples by SNP distance to the report, next to the tree, '
+             'joining samples at most this many SNPs apart. It is coloured by the same metadata columns as the tree. '
+             'Default=None, no network.'
     )
+    output_mode = parser.add_mutually_exclusive_group()
+    output_mode.add_argument(
+        '--compress',
+        dest='compress',
+        help='Optional: gzip the plot and data inside the html file, which makes it much smaller. The browser '
+             'unpacks it when the report is opened (needs a browser from 2023 or later).',
+        action='store_true')
+    output_mode.add_argument(
+        '--split-assets',
+        dest='split_assets',
+        help='Optional: write the plotly library and the data as separate files next to the html, instead of inside '
+             'it. Reports in the same output directory share one copy of the plotly library. The report must be '
+             'opened through a web server, e.g. run "python -m http.server" in the output directory.',
+        action='store_true')
     parser.add_argument(
         '--force',
         dest='force',
         help='Overwrite the output directory if it already exists',
         action='store_true')
-    return parser.parse_args()
+    args = parser.parse_args(argv)
+    input_paths = [args.tree_path, args.metadata_path, args.snp_distance_matrix_path or args.alignment_path]
+    if args.from_artefacts and any(input_paths):
+        parser.error('--from-artefacts replaces --tree, --metadata and --snp-distance-matrix (or --alignment), use one '
+                     'or the other')
+    if not args.from_artefacts and not all(input_paths):
+        parser.error('the following arguments are required: --tree/-t, --metadata/-m, --snp-distance-matrix/-s (or '
+                     '--alignment/-a)')
+    return args
+
+
+def get_serve_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='intreeactive serve',
+        description='Serve an interactive tree from this computer. The metadata and SNP distances stay on the server '
+                    'and are fetched by the report as they are needed, so this works for datasets too big to put in '
+                    'one html file. Open the address that is printed in a browser.'
+    )
+    _add_input_arguments(parser)
+    _add_report_arguments(parser)
+    parser.add_argument(
+        '--host',
+        dest='host',
+        type=str,
+        required=False,
+        default='127.0.0.1',
+        help='Optional: address to serve the report on. Use 0.0.0.0 to let other computers open it. '
+             'Default="127.0.0.1" (this computer only).'
+    )
+    parser.add_argument(
+        '--port',
+        '-p',
+        dest='port',
+        type=int,
+        required=False,
+        default=8000,
+        help='Optional: port to serve the report on. Default=8000.'
+    )
+    return parser.parse_args(argv)
+
+
+
+def get_diff_args(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='intreeactive diff',
+        description='Compare two runs: which samples are new or removed, and which have different nearest neighbours '
+                    'or (with --cluster-snps) a different SNP cluster. The changes are written as a tab separated '
+                    'table, and with --report, marked in a new report.'
+    )
+    parser.add_argument(
+        '--old',
+        dest='old_run',
+        type=str,
+        required=True,
+        help='Required: the earlier run, as a directory written by --emit-artefacts or a SNP distance matrix file.'
+    )
+    parser.add_argument(
+        '--new',
+        dest='new_run',
+        type=str,
+        required=True,
+        help='Required: the later run, as a directory written by --emit-artefacts or a SNP distance matrix file.'
+    )
+    parser.add_argument(
+        '--cluster-snps',
+        dest='cluster_snps',
+        type=int,
+        required=False,
+        default=None,
+        help='Optional: also compare the SNP clusters, of samples joined by chains of samples at most this many SNPs '
+             'apart. Default=None, neighbours only.'
+    )
+    parser.add_argument(
+        '--report',
+        dest='report',
+        help='Optional: also write the report of the new run (which must be an artefacts directory), with a "Change" '
+             'metadata column to colour or filter the changed samples by.',
+        action='store_true')
+    parser.add_argument(
+        '--output',
+        '-o',
+        dest='output_file',
+        type=str,
+        required=False,
+        default='changes',
+        help='Optional: Filename or path with filename to be used as the output. Do not include the suffix, .tsv (and '
+             '.html with --report) will be added. Default="changes".'
+    )
+    parser.add_argument(
+        '--output-dir',
+        '-d',
+        dest='output_dir',
+        type=str,
+        required=False,
+        default=None,
+        help='Optional: Name of directory or path with directory to be used to save the output into. '
+             'If it does not already exist, it will be created. Default=current working directory.'
+    )
+    _add_report_arguments(parser)
+    parser.add_argument(
+        '--force',
+        dest='force',
+        help='Overwrite the output files if they already exist',
+        action='store_true')
+    args = parser.parse_args(argv)
+    if args.report and not os.path.isdir(args.new_run):
+        parser.error('--report needs --new to be a directory written by --emit-artefacts')
+    return args
 
 
 def _handle_outdir(outdir: str | os.PathLike = None) -> os.PathLike:
@@ -180,53 +435,236 @@ def setup_and_check_files(args: argparse.Namespace) -> os.PathLike | str:
     # Check output already exists:
     output_file_path = os.path.join(outdir_path, (args.output_file + '.html'))
     _check_output_exists(output_file_path, args.force)
+    if args.emit_artefacts:
+        _check_output_exists(os.path.join(args.emit_artefacts, artefacts.MANIFEST_NAME), args.force)
     return output_file_path
 
 
-#####################
-def main():
-    args = get_args()
-    output_path = setup_and_check_files(args)
-
+def load_inputs(args: argparse.Namespace, executor: concurrent.futures.Executor) -> tuple:
+    """
+    Read in and check the tree, metadata and SNP distance matrix, and start working out the nearest neighbours.
+    :param args: arg parse object
+    :param executor: executor to read the files and work out the nearest neighbours on.
+    :return: tuple of a dict of tree name: tree, the metadata, ID column, SNP distance matrix and a Future of the
+        nearest neighbours.
+    """
     ### Set up files:
-    # Tree: read tree file (specify format) and parse as Bio.Phylo tree object, specifying an outgroup will root the tree.
-    tree = intreeactive.read_in_tree(path_to_tree=args.tree_path,
-                                     tree_format=args.tree_format,
-                                     outgroup=args.outgroup
-                                     )
+    # The input files are read at the same time, which helps most when they are on a network filesystem.
+    # Tree: read tree file (specify format) and parse as Bio.Phylo tree object, specifying an outgroup will root the
+    # tree. Each tree is named by its file name, or its path if two files have the same name. With more than one tree,
+    # a tree without the outgroup (such as a subtree of one cluster) is left rooted as it is.
+    tree_names = [os.path.splitext(os.path.basename(path))[0] for path in args.tree_path]
+    if len(set(tree_names)) < len(tree_names):
+        tree_names = args.tree_path
+    tree_futures = {name: executor.submit(intreeactive.read_in_tree,
+                                          path_to_tree=path,
+                                          tree_format=args.tree_format,
+                                          outgroup=args.outgroup,
+                                          compact=args.compact_tree,
+                                          skip_missing_outgroup=len(args.tree_path) > 1
+                                          ) for name, path in zip(tree_names, args.tree_path)}
 
     # Metadata: the metadata is used to add information to the hover text, as well as matching up the nearest
-    # neighbours. This reads in from csv into pandas df, sets content to strings, gets the id_column if not specified
-    # (This is the main ID of the sample). Dates are read in using pandas to_datetime, and prefers 2024-01-01, but
-    # it will try to parse other formats, preferring year first, and then day first. Any column names that contain the
-    # string "date" (not case-sensitive) will be given a colour gradient of dates.
-    metadata_df, id_column = intreeactive.read_in_metadata(args.metadata_path, id_column=args.id_column)
+    # neighbours. This reads in from csv into pandas df, sets content to strings, gets the id_column if not
+    # specified (This is the main ID of the sample). Dates are read in using pandas to_datetime, and prefers
+    # 2024-01-01, but it will try to parse other formats, preferring year first, and then day first. Any column
+    # names that contain the string "date" (not case-sensitive) will be given a colour gradient of dates.
+    metadata_future = executor.submit(intreeactive.read_in_metadata, args.metadata_path,
+                                      id_column=args.id_column,
+                                      columns=args.metadata_columns)
 
     # SNP Distance Matrix: This is used to add functionality to the tree and find nearest neighbours.
-    # This reads a file with any delimiter, sets the sample names (in the first column) to the index, and assumes
-    # the order of the column names must match the row names (to store the index once).
-    snp_distance_matrix = intreeactive.read_in_snp_dist_matrix(args.snp_distance_matrix_path)
+    # This reads a file with any delimiter, sets the sample names (in the first column) to the index, and checks the
+    # columns are the same samples as the rows (to store the index once). With --alignment, the matrix is worked out
+    # from the alignment instead, without writing it out.
+    if args.alignment_path:
+        matrix_future = executor.submit(alignment.read_in_alignment_snp_dists, args.alignment_path,
+                                        threads=args.threads)
+    else:
+        matrix_future = executor.submit(intreeactive.read_in_snp_dist_matrix, args.snp_distance_matrix_path)
+
+    # The nearest neighbours only need the SNP distances, so are worked out as soon as they have been read (after
+    # focusing, if --focus is used, as only the focus samples' neighbours are needed, though from every sample).
+    if not args.focus_path:
+        neighbours_future = executor.submit(
+            lambda: intreeactive.get_all_nearest_neighbours(matrix_future.result(), workers=args.threads))
+
+    # Wait for the files in a fixed order, so if more than one can't be read, the same error is always reported.
+    trees = {name: tree_future.result() for name, tree_future in tree_futures.items()}
+    metadata_df, id_column = metadata_future.result()
+    snp_distance_matrix = matrix_future.result()
+
+    # Focus: cut the tree, metadata and SNP distances down to the focus samples and their context, before anything
+    # else is done with them, so the time taken depends on the number of focus samples, not the whole dataset.
+    # The context comes from the first tree, and any other trees are cut down to the same samples.
+    if args.focus_path:
+        first_tree_name = tree_names[0]
+        full_snp_distance_matrix = snp_distance_matrix
+        trees[first_tree_name], metadata_df, snp_distance_matrix = intreeactive.focus_inputs(
+            tree=trees[first_tree_name],
+            metadata=metadata_df,
+            id_column=id_column,
+            snp_dists=snp_distance_matrix,
+            query_ids=intreeactive.read_in_focus_ids(args.focus_path),
+            context_snps=args.context_snps,
+            ancestral_hops=args.ancestral_hops)
+        for name in tree_names[1:]:
+            trees[name] = intreeactive.prune_tree(trees[name], set(metadata_df[id_column]))
+        # A focus sample's nearest neighbour may not be in the focus samples, so they are found in the full matrix
+        neighbours_future = executor.submit(intreeactive.get_all_nearest_neighbours, full_snp_distance_matrix,
+                                            samples=snp_distance_matrix.index, workers=args.threads)
 
     # This checks if sample IDs match up in the various files - the samples in the tree must have metadata
     # and nearest neighbour information.
-    checked_metadata = intreeactive.check_ids(tree=tree,
-                                              metadata=metadata_df,
-                                              id_column=id_column,
-                                              snp_dists=snp_distance_matrix,
-                                              ignore_ids=args.ignore_ids)
+    for tree in trees.values():
+        checked_metadata = intreeactive.check_ids(tree=tree,
+                                                  metadata=metadata_df,
+                                                  id_column=id_column,
+                                                  snp_dists=snp_distance_matrix,
+                                                  ignore_ids=args.ignore_ids)
+
+    # The check_ids function also reduces the metadata down to only entries needed for the tree to save on
+    # computation. With more than one tree, the entries needed for any of the trees are kept.
+    if len(trees) > 1:
+        tree_ids = set().union(*map(intreeactive.get_leaf_names, trees.values()))
+        metadata_df = metadata_df[metadata_df[id_column].isin(tree_ids)].reset_index(drop=True)
+    else:
+        metadata_df = checked_metadata if not checked_metadata.empty else metadata_df
+
+    return trees, metadata_df, id_column, snp_distance_matrix, neighbours_future
 
-    # The check_ids function also reduces the metadata down to only entries needed for the tree to save on computation:
-    metadata_df = checked_metadata if not checked_metadata.empty else metadata_df
+
+#####################
+def main():
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['diff']:
+        run_diff(sys.argv[2:])
+        return
+
+    args = get_args()
+    output_path = setup_and_check_files(args)
 
     # Set up the title for the plot:
     today = datetime.date.today().strftime("%Y%m%d")
     title = args.title if args.title else f"Interactive Phylogeny, {today}"
 
-    # This is the main function - it takes in the Phylo tree object, a path or name to the output file, metadata Pandas
-    # Dataframe, the name of the ID column
-    intreeactive.write_interactive_tree(tree=tree,
+    if args.from_artefacts:
+        # Everything has already been read, checked and worked out, keep the title unless there is a new one
+        trees, metadata_df, id_column, snp_distance_matrix, nearest_neighbours, artefacts_title = \
+            artefacts.read_artefacts(args.from_artefacts, metadata_columns=args.metadata_columns)
+        title = args.title if args.title else artefacts_title or title
+        row_colourings = artefacts.read_artefact_colours(args.from_artefacts, metadata_df)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            trees, metadata_df, id_column, snp_distance_matrix, neighbours_future = load_inputs(args, executor)
+            nearest_neighbours = neighbours_future.result()
+        row_colourings = None
+
+    if args.emit_artefacts:
+        manifest_path = artefacts.write_artefacts(output_dir=args.emit_artefacts,
+                                                  trees=trees,
+                                                  metadata=metadata_df,
+                                                  id_column=id_column,
+                                                  snp_distance_matrix=snp_distance_matrix,
+                                                  nearest_neighbours=nearest_neighbours,
+                                                  title=title)
+        print(f'Artefacts written, see {manifest_path}')
+
+    # This is the main function - it takes in the Phylo tree object(s), a path or name to the output file, metadata
+    # Pandas Dataframe, the name of the ID column
+    intreeactive.write_interactive_tree(tree=trees,
                                         output_name=output_path,
                                         metadata=metadata_df,
                                         id_column=id_column,
                                         snp_distance_matrix=snp_distance_matrix,
-                                        title=title)
+                                        title=title,
+                                        renderer=args.renderer,
+                                        compress=args.compress,
+                                        split_assets=args.split_assets,
+                                        nearest_neighbours=nearest_neighbours,
+                                        network_snps=args.network_snps,
+                                        row_colourings=row_colourings)
+
+
+def serve(argv: list[str] = None):
+    args = get_serve_args(argv)
+    if len(args.tree_path) > 1:
+        print('intreeactive serve takes one --tree. Exiting.', file=sys.stderr)
+        sys.exit()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        trees, metadata_df, id_column, snp_distance_matrix, neighbours_future = load_inputs(args, executor)
+    tree, = trees.values()
+    # The server keeps the SNP distances in the smallest dtype that holds them. Converting them here, and dropping the
+    # matrix as read, means only that copy is kept while the server runs.
+    snp_distance_matrix = snp_distance_matrix.astype(
+        intreeactive.get_smallest_dtype(snp_distance_matrix.to_numpy()), copy=False)
+
+    # Set up the title for the plot:
+    today = datetime.date.today().strftime("%Y%m%d")
+    title = args.title if args.title else f"Interactive Phylogeny, {today}"
+
+    # The report is built once, and the datasets are kept in memory for the report to fetch from
+    report_server = server.make_report_server(tree=tree,
+                                              metadata=metadata_df,
+                                              id_column=id_column,
+                                              snp_distance_matrix=snp_distance_matrix,
+                                              title=title,
+                                              renderer=args.renderer,
+                                              nearest_neighbours=neighbours_future.result(),
+                                              host=args.host,
+                                              port=args.port)
+
+    host, port = report_server.server_address[:2]
+    print(f'Serving the report at http://{host}:{port}/ - press Ctrl+C to stop.')
+    try:
+        report_server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopping.')
+    finally:
+        report_server.server_close()
+
+
+def run_diff(argv: list[str] = None):
+    args = get_diff_args(argv)
+    outdir_path = _handle_outdir(args.output_dir)
+    table_path = os.path.join(outdir_path, args.output_file + '.tsv')
+    report_path = os.path.join(outdir_path, args.output_file + '.html')
+    _check_output_exists(table_path, args.force)
+    if args.report:
+        _check_output_exists(report_path, args.force)
+
+    # Both runs are read at the same time, and the nearest neighbours of a SNP distance matrix file worked out
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        old_future = executor.submit(diff.read_run, args.old_run)
+        new_future = executor.submit(diff.read_run, args.new_run)
+        old_snp_distance_matrix, old_nearest_neighbours = old_future.result()
+        new_snp_distance_matrix, new_nearest_neighbours = new_future.result()
+
+    changes = diff.get_changes(old_snp_distance_matrix=old_snp_distance_matrix,
+                               old_nearest_neighbours=old_nearest_neighbours,
+                               new_snp_distance_matrix=new_snp_distance_matrix,
+                               new_nearest_neighbours=new_nearest_neighbours,
+                               cluster_snps=args.cluster_snps)
+    changes.to_csv(table_path, sep='\t', index=False)
+    counts = changes['change'].value_counts()
+    print(f'{counts.get("new", 0)} new, {counts.get("removed", 0)} removed and {counts.get("changed", 0)} changed '
+          f'samples, see {table_path}')
+
+    if args.report:
+        trees, metadata_df, id_column, snp_distance_matrix, nearest_neighbours, artefacts_title = \
+            artefacts.read_artefacts(args.new_run)
+        today = datetime.date.today().strftime("%Y%m%d")
+        title = args.title if args.title else artefacts_title or f"Interactive Phylogeny, {today}"
+        # The Change column is coloured as well as those in the artefacts
+        intreeactive.write_interactive_tree(tree=trees,
+                                            output_name=report_path,
+                                            metadata=diff.add_change_column(metadata_df, changes, id_column),
+                                            id_column=id_column,
+                                            snp_distance_matrix=snp_distance_matrix,
+                                            title=title,
+                                            renderer=args.renderer,
+                                            nearest_neighbours=nearest_neighbours,
+                                            row_colourings=artefacts.read_artefact_colours(args.new_run, metadata_df))
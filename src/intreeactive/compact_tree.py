@@ -0,0 +1,587 @@
+import os
+import re
+import sys
+
+import numpy as np
+
+# Newick tokens, as read by Bio.Phylo.NewickIO. Comments are skipped.
+NEWICK_TOKEN = re.compile(r"""
+    (?P<open>\() | (?P<close>\)) | (?P<comma>,) | (?P<end>;)
+    | :\ ?(?P<length>[+-]?[0-9]*\.?[0-9]+(?:[eE][+-]?[0-9]+)?)
+    | (?P<comment>\[(?:\\.|[^\]])*\])
+    | '(?P<quoted>(?:\\.|[^'])*)'
+    | (?P<label>[^\s()\[\]':;,]+)
+""", re.VERBOSE)
+# The last character that ends a token, if the file is read in pieces.
+NEWICK_TOKEN_BREAK = re.compile(r"[\s(),;][^\s(),;]*\Z")
+# Size of the pieces a Newick file is read in.
+NEWICK_CHUNK_SIZE = 1 << 20
+# Node coordinates are rounded to this many significant figures of the largest coordinate of the tree.
+COORDINATE_DIGITS = 8
+
+
+def _is_confidence(label: str) -> bool:
+    """
+    Bio.Phylo reads a number in place of an internal node's name as its confidence (support) value, not its name.
+    """
+    try:
+        float(label)
+    except ValueError:
+        return False
+    return True
+
+
+def quantize_coordinates(coords) -> np.ndarray:
+    """
+    Round node coordinates to COORDINATE_DIGITS significant figures of the largest one. This is much finer than the
+    plot can show, even zoomed right in, and makes the numbers written into the report much shorter than the full
+    precision of a float.
+    :param coords: the x- or y-coordinates of the nodes of a tree.
+    :return: array of the rounded coordinates.
+    """
+    coords = np.asarray(coords, dtype=float)
+    extent = np.abs(coords).max(initial=0)
+    if not np.isfinite(extent) or extent == 0:
+        return coords
+    return np.round(coords, COORDINATE_DIGITS - 1 - int(np.floor(np.log10(extent))))
+
+
+def summarise_clades(*,
+                     parents: np.ndarray,
+                     x_coords: np.ndarray,
+                     y_coords: np.ndarray,
+                     first_children: np.ndarray,
+                     last_children: np.ndarray) -> dict:
+    """
+    Summarise the clades (internal nodes) of a tree whose nodes are numbered depth first, so a clade and all its
+    descendants are a contiguous range of nodes. See intreeactive.get_clade_summary for what is returned.
+    :param parents: index of the parent of each node, -1 for the root.
+    :param x_coords: x-coordinate of each node.
+    :param y_coords: y-coordinate of each node.
+    :param first_children: index of the first child of each node, -1 for leaves.
+    :param last_children: index of the last child of each node, -1 for leaves.
+    :return: dict with 'parents' and 'clades'.
+    """
+    node_count = len(parents)
+    is_leaf = first_children < 0
+
+    # Accumulate from the leaves up - in depth first order, a parent always comes before its children.
+    subtree_size = np.ones(node_count, dtype=np.int64)
+    leaves = is_leaf.astype(np.int64)
+    x_max = np.array(x_coords, dtype=float)
+    y_min = np.array(y_coords, dtype=float)
+    y_max = y_min.copy()
+    for index in range(node_count - 1, 0, -1):
+        parent = parents[index]
+        subtree_size[parent] += subtree_size[index]
+        leaves[parent] += leaves[index]
+        x_max[parent] = max(x_max[parent], x_max[index])
+        y_min[parent] = min(y_min[parent], y_min[index])
+        y_max[parent] = max(y_max[parent], y_max[index])
+
+    clade_nodes = np.flatnonzero(~is_leaf).astype(np.int64)
+    y_coords = np.asarray(y_coords, dtype=float)
+    return dict(parents=np.asarray(parents, dtype=np.int64),
+                clades=dict(node=clade_nodes,
+                            end=clade_nodes + subtree_size[clade_nodes],
+                            leaves=leaves[clade_nodes],
+                            xMax=x_max[clade_nodes],
+                            yMin=y_min[clade_nodes],
+                            yMax=y_max[clade_nodes],
+                            yFirstChild=y_coords[first_children[clade_nodes]].tolist(),
+                            yLastChild=y_coords[last_children[clade_nodes]].tolist()))
+
+
+class CompactTree:
+    """
+    A tree held as arrays instead of one Bio.Phylo Clade object per node, for large trees. Nodes are numbered in depth
+    first (preorder) order, so the root is node 0, a parent always comes before its children, and a clade and all its
+    descendants are a contiguous range of nodes.
+    Missing branch lengths are NaN, and unnamed nodes have the name None. Names are interned, so repeated names (and
+    the names in the metadata) share one string.
+    """
+
+    def __init__(self, *, parents, first_children, next_siblings, branch_lengths, names: list):
+        """
+        :param parents: index of the parent of each node, -1 for the root.
+        :param first_children: index of the first child of each node, -1 for leaves.
+        :param next_siblings: index of the next child of the same parent, -1 for the last child.
+        :param branch_lengths: branch length of each node, NaN where missing.
+        :param names: name of each node, None where missing.
+        The nodes can be in any order, they are put in depth first order starting from the node without a parent.
+        """
+        self.parents = np.asarray(parents, dtype=np.int32)
+        self.first_children = np.asarray(first_children, dtype=np.int32)
+        self.next_siblings = np.asarray(next_siblings, dtype=np.int32)
+        self.branch_lengths = np.asarray(branch_lengths, dtype=np.float64)
+        self.names = [sys.intern(name) if name is not None else None for name in names]
+        self._reorder(self._get_preorder(int(np.flatnonzero(self.parents < 0)[0])))
+
+    @classmethod
+    def from_newick(cls, path_to_tree: str | os.PathLike) -> 'CompactTree':
+        """
+        Read a Newick file, giving the same tree as Bio.Phylo.read(path_to_tree, 'newick'). The file is read in pieces
+        and no Bio.Phylo objects are made.
+        :param path_to_tree: path to tree file.
+        :return: CompactTree.
+        """
+        parents = [-1]
+        first_children = [-1]
+        next_siblings = [-1]
+        last_children = [-1]
+        branch_lengths = [np.nan]
+        names = [None]
+
+        def new_node(parent: int) -> int:
+            node = len(parents)
+            parents.append(parent)
+            first_children.append(-1)
+            next_siblings.append(-1)
+            last_children.append(-1)
+            branch_lengths.append(np.nan)
+            names.append(None)
+            if parent >= 0:
+                add_child(parent, node)
+            return node
+
+        def add_child(parent: int, child: int) -> None:
+            parents[child] = parent
+            if first_children[parent] < 0:
+                first_children[parent] = child
+            else:
+                next_siblings[last_children[parent]] = child
+            last_children[parent] = child
+
+        # The same steps as Bio.Phylo.NewickIO.Parser: "(" starts the first child of the current node, "," its next
+        # sibling and ")" goes back up to the parent.
+        root = current = 0
+        open_count = close_count = 0
+        is_finished = False
+
+        def read_tokens(text: str, is_last: bool) -> int:
+            """
+            Handle the tokens in text, returning where it got to. Unless is_last, a token that might carry on in the
+            next piece of the file is left for then.
+            """
+            nonlocal root, current, open_count, close_count, is_finished
+            position = 0
+            # a token is only complete if something that ends it (a bracket, comma, semicolon or whitespace) follows
+            last_break = NEWICK_TOKEN_BREAK.search(text)
+            complete_end = len(text) if is_last else (last_break.start() if last_break else 0)
+            while True:
+                match = NEWICK_TOKEN.search(text, position)
+                if match is None:
+                    return len(text) if is_last else position
+                if not is_last:
+                    skipped = text[position:match.start()]
+                    # an unfinished quoted name or comment, or a token that might carry on in the next piece
+                    if "'" in skipped or "[" in skipped or match.end() > complete_end:
+                        return position
+                position = match.end()
+                kind = match.lastgroup
+
+                if is_finished:
+                    if kind != 'comment':
+                        raise ValueError("There are multiple trees in this file; use parse() instead.")
+                elif kind == 'open':
+                    current = new_node(current)
+                    open_count += 1
+                elif kind == 'comma':
+                    # if the current node is the root, the outer brackets are missing, so add a new root
+                    if current == root:
+                        root = new_node(-1)
+                        add_child(root, current)
+                    current = new_node(parents[current])
+                elif kind == 'close':
+                    if parents[current] < 0:
+                        raise ValueError("Parenthesis mismatch.")
+                    current = parents[current]
+                    close_count += 1
+                elif kind == 'end':
+                    is_finished = True
+                elif kind == 'length':
+                    branch_lengths[current] = float(match.group('length'))
+                elif kind == 'quoted':
+                    # two quoted names next to each other are one name with a quote in it
+                    quoted = match.group('quoted')
+                    names[current] = quoted if not names[current] else f"{names[current]}'{quoted}"
+                elif kind == 'label':
+                    names[current] = match.group('label')
+
+        with open(path_to_tree) as tree_file:
+            text = ""
+            for chunk in iter(lambda: tree_file.read(NEWICK_CHUNK_SIZE), ""):
+                text += chunk
+                text = text[read_tokens(text, is_last=False):]
+            read_tokens(text, is_last=True)
+
+        if open_count != close_count:
+            raise ValueError(f"Mismatch, {open_count} open vs {close_count} close parentheses.")
+        if len(parents) == 1 and names[0] is None and np.isnan(branch_lengths[0]):
+            raise ValueError(f"No trees found in {path_to_tree}")
+
+        for node, name in enumerate(names):
+            if name and first_children[node] >= 0 and _is_confidence(name):
+                names[node] = None
+
+        return cls(parents=parents,
+                   first_children=first_children,
+                   next_siblings=next_siblings,
+                   branch_lengths=branch_lengths,
+                   names=names)
+
+    @classmethod
+    def from_phylo(cls, tree) -> 'CompactTree':
+        """
+        Convert a Bio.Phylo tree, for tree formats other than Newick.
+        :param tree: Bio.Phylo tree object.
+        :return: CompactTree.
+        """
+        clades = list(tree.find_clades())
+        node_index = {clade: index for index, clade in enumerate(clades)}
+        parents = np.full(len(clades), -1, dtype=np.int32)
+        first_children = np.full(len(clades), -1, dtype=np.int32)
+        next_siblings = np.full(len(clades), -1, dtype=np.int32)
+        for index, clade in enumerate(clades):
+            children = [node_index[child] for child in clade.clades]
+            parents[children] = index
+            if children:
+                first_children[index] = children[0]
+                next_siblings[children[:-1]] = children[1:]
+        return cls(parents=parents,
+                   first_children=first_children,
+                   next_siblings=next_siblings,
+                   branch_lengths=[np.nan if clade.branch_length is None else clade.branch_length
+                                   for clade in clades],
+                   names=[clade.name for clade in clades])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get_children(self, node: int) -> list[int]:
+        children = []
+        child = self.first_children[node]
+        while child >= 0:
+            children.append(int(child))
+            child = self.next_siblings[child]
+        return children
+
+    def _set_children(self, node: int, children: list[int]) -> None:
+        self.first_children[node] = children[0] if children else -1
+        for child, next_sibling in zip(children, children[1:] + [-1]):
+            self.parents[child] = node
+            self.next_siblings[child] = next_sibling
+
+    def _get_preorder(self, root: int) -> list[int]:
+        first_children = self.first_children.tolist()
+        next_siblings = self.next_siblings.tolist()
+        order = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            # the next sibling is visited after this node's clade
+            if node != root and next_siblings[node] >= 0:
+                stack.append(next_siblings[node])
+            if first_children[node] >= 0:
+                stack.append(first_children[node])
+        return order
+
+    def _reorder(self, order: list[int]) -> None:
+        """
+        Renumber the nodes in the given order. Nodes not in order are dropped.
+        """
+        order = np.asarray(order, dtype=np.int32)
+        new_index = np.full(len(self.names) + 1, -1, dtype=np.int32)  # the extra -1 keeps -1 as "no node"
+        new_index[order] = np.arange(len(order), dtype=np.int32)
+        self.parents = new_index[self.parents[order]]
+        self.first_children = new_index[self.first_children[order]]
+        self.next_siblings = new_index[self.next_siblings[order]]
+        self.branch_lengths = self.branch_lengths[order]
+        self.names = [self.names[node] for node in order.tolist()]
+        self._subtree_sizes = None
+
+    def _add_node(self, branch_length: float) -> int:
+        self.parents = np.append(self.parents, np.int32(-1))
+        self.first_children = np.append(self.first_children, np.int32(-1))
+        self.next_siblings = np.append(self.next_siblings, np.int32(-1))
+        self.branch_lengths = np.append(self.branch_lengths, branch_length)
+        self.names.append(None)
+        return len(self.names) - 1
+
+    def is_leaf(self) -> np.ndarray:
+        return self.first_children < 0
+
+    def get_leaf_names(self) -> list[str]:
+        """
+        :return: the leaf names, in depth first order (as Bio.Phylo get_terminals).
+        """
+        return [self.names[node] for node in np.flatnonzero(self.is_leaf()).tolist()]
+
+    def get_last_children(self) -> np.ndarray:
+        last_children = np.full(len(self), -1, dtype=np.int32)
+        # in depth first order, the last child of a node is the one with the highest index
+        np.maximum.at(last_children, self.parents[1:], np.arange(1, len(self), dtype=np.int32))
+        return last_children
+
+    def get_subtree_sizes(self) -> np.ndarray:
+        """
+        :return: the number of nodes in each node's clade, including itself. Node i's clade is nodes i to
+            i + size - 1.
+        """
+        if self._subtree_sizes is None:
+            sizes = [1] * len(self)
+            parents = self.parents.tolist()
+            for node in range(len(self) - 1, 0, -1):
+                sizes[parents[node]] += sizes[node]
+            self._subtree_sizes = np.array(sizes, dtype=np.int64)
+        return self._subtree_sizes
+
+    def get_leaf_counts(self) -> np.ndarray:
+        is_leaf = self.is_leaf()
+        leaf_rank = np.concatenate([[0], np.cumsum(is_leaf)])
+        ends = np.arange(len(self)) + self.get_subtree_sizes()
+        return leaf_rank[ends] - leaf_rank[:-1]
+
+    def get_ancestor(self, node: int, hops: int) -> int:
+        """
+        :return: the node hops steps up the tree from node, or the root if that is fewer steps.
+        """
+        for _ in range(hops):
+            if self.parents[node] < 0:
+                break
+            node = int(self.parents[node])
+        return node
+
+    def get_clade_leaf_names(self, node: int) -> list[str]:
+        end = node + int(self.get_subtree_sizes()[node])
+        return [self.names[leaf] for leaf in range(node, end) if self.first_children[leaf] < 0]
+
+    def get_common_ancestor(self, nodes: list[int]) -> int:
+        paths = []
+        for node in nodes:
+            path = [node]
+            while self.parents[path[-1]] >= 0:
+                path.append(int(self.parents[path[-1]]))
+            paths.append(path[::-1])
+        common_ancestor = 0
+        for ancestors in zip(*paths):
+            if len(set(ancestors)) > 1:
+                break
+            common_ancestor = ancestors[0]
+        return common_ancestor
+
+    def root_with_outgroup(self, outgroup_name: str) -> None:
+        """
+        Reroot the tree on the clade containing every node called outgroup_name, in the same way as Bio.Phylo
+        root_with_outgroup (a terminal outgroup gets a new root with a 0 length branch to it, an internal one becomes
+        the root, and a bifurcating old root is removed, keeping the total branch length).
+        :param outgroup_name: name of the outgroup.
+        """
+        matches = [node for node, name in enumerate(self.names) if name == outgroup_name]
+        if not matches:
+            raise ValueError(f"target {outgroup_name!r} is not in this tree")
+        outgroup = self.get_common_ancestor(matches)
+        if outgroup == 0:
+            # Outgroup is the current root -- no change
+            return
+
+        # the path from below the root to the outgroup
+        outgroup_path = [outgroup]
+        while self.parents[outgroup_path[0]] != 0:
+            outgroup_path.insert(0, int(self.parents[outgroup_path[0]]))
+
+        def or_zero(value):
+            return 0.0 if np.isnan(value) or value == 0 else value
+
+        # The children of the nodes that change, as lists, so each node is only ever in one sibling chain. They are
+        # written back at the end.
+        children = {}
+
+        def get_children(node: int) -> list[int]:
+            if node not in children:
+                children[node] = self.get_children(node)
+            return children[node]
+
+        prev_blen = or_zero(self.branch_lengths[outgroup])
+        if self.first_children[outgroup] < 0:
+            # Create a new root with a 0-length branch to the outgroup
+            self.branch_lengths[outgroup] = 0.0
+            new_root = self._add_node(self.branch_lengths[0])
+            children[new_root] = [outgroup]
+            if len(outgroup_path) == 1:
+                new_parent = new_root
+            else:
+                parent = outgroup_path.pop(-2)
+                get_children(parent).remove(outgroup)
+                prev_blen, self.branch_lengths[parent] = self.branch_lengths[parent], prev_blen
+                children[new_root].insert(0, parent)
+                new_parent = parent
+        else:
+            # Use the given outgroup node as the new (trifurcating) root
+            new_root = outgroup
+            self.branch_lengths[new_root] = self.branch_lengths[0]
+            new_parent = new_root
+
+        # Reverse the branches above the outgroup, keeping the descendants of those clades as they are.
+        for parent in outgroup_path[-2::-1]:
+            get_children(parent).remove(new_parent)
+            prev_blen, self.branch_lengths[parent] = self.branch_lengths[parent], prev_blen
+            get_children(new_parent).insert(0, parent)
+            new_parent = parent
+
+        # Finally, handle the original root according to number of descendants
+        old_root_children = get_children(0)
+        old_root_children.remove(outgroup if outgroup in old_root_children else new_parent)
+        if len(old_root_children) == 1:
+            # Delete the old bifurcating root & add branch lengths
+            ingroup = old_root_children.pop()
+            ingroup_length = self.branch_lengths[ingroup]
+            self.branch_lengths[ingroup] = ingroup_length + prev_blen if or_zero(ingroup_length) else prev_blen
+            get_children(new_parent).insert(0, ingroup)
+        else:
+            # Keep the old trifurcating/polytomous root as an internal node
+            self.branch_lengths[0] = prev_blen
+            get_children(new_parent).insert(0, 0)
+
+        for node, node_children in children.items():
+            self._set_children(node, node_children)
+        self.parents[new_root] = -1
+        self._reorder(self._get_preorder(new_root))
+
+    def ladderize(self, reverse: bool = False) -> None:
+        """
+        Sort the children of every node by their number of leaves, as Bio.Phylo ladderize. Children with the same
+        number of leaves keep their order.
+        :param reverse: if True, put the clades with the most leaves first.
+        """
+        leaf_counts = self.get_leaf_counts()
+        nodes = np.arange(1, len(self))
+        # sort by parent, then leaf count, then the current order
+        order = nodes[np.lexsort((nodes, -leaf_counts[nodes] if reverse else leaf_counts[nodes], self.parents[nodes]))]
+        parents = self.parents[order]
+        is_first = np.concatenate([[True], parents[1:] != parents[:-1]])
+        is_last = np.concatenate([parents[1:] != parents[:-1], [True]])
+        self.first_children[:] = -1
+        self.first_children[parents[is_first]] = order[is_first]
+        self.next_siblings[0] = -1
+        self.next_siblings[order] = np.where(is_last, -1, np.roll(order, -1))
+        self._reorder(self._get_preorder(0))
+
+    def prune(self, keep_ids: set[str]) -> 'CompactTree':
+        """
+        Make a copy of the tree with only the leaves in keep_ids, as intreeactive.prune_tree.
+        :param keep_ids: set of leaf names to keep.
+        :return: pruned CompactTree.
+        """
+        is_leaf = self.is_leaf()
+        kept_leaves = np.array([is_leaf[node] and name in keep_ids for node, name in enumerate(self.names)])
+        kept_below = kept_leaves.astype(np.int64)
+        kept_children = np.zeros(len(self), dtype=np.int64)
+        parents = self.parents.tolist()
+        for node in range(len(self) - 1, 0, -1):
+            if kept_below[node]:
+                kept_below[parents[node]] += kept_below[node]
+                kept_children[parents[node]] += 1
+        is_kept = kept_leaves | (kept_children >= 2)
+        if not is_kept.any():
+            raise ValueError("None of the leaves to keep are in the tree")
+
+        # Each kept node hangs from its nearest kept ancestor, with the branch lengths of the removed nodes in between
+        # added to its own.
+        new_parents = np.full(len(self), -1, dtype=np.int32)
+        branch_lengths = self.branch_lengths.copy()
+        nearest_kept = np.full(len(self), -1, dtype=np.int32)
+        removed_length = np.full(len(self), np.nan)
+        for node in range(len(self)):
+            parent = parents[node]
+            above = nearest_kept[parent] if parent >= 0 else -1
+            length_above = removed_length[parent] if parent >= 0 else np.nan
+            if is_kept[node]:
+                new_parents[node] = above
+                if not (np.isnan(length_above) and np.isnan(branch_lengths[node])):
+                    branch_lengths[node] = np.nansum([length_above, branch_lengths[node]])
+                nearest_kept[node] = node
+                removed_length[node] = np.nan
+            else:
+                nearest_kept[node] = above
+                removed_length[node] = (length_above if np.isnan(branch_lengths[node])
+                                        else np.nansum([length_above, branch_lengths[node]]))
+
+        kept = np.flatnonzero(is_kept)
+        new_index = np.full(len(self) + 1, -1, dtype=np.int32)
+        new_index[kept] = np.arange(len(kept), dtype=np.int32)
+        kept_parents = new_index[new_parents[kept]]
+        # children are in depth first order, so siblings are in their original order
+        first_children = np.full(len(kept), -1, dtype=np.int32)
+        next_siblings = np.full(len(kept), -1, dtype=np.int32)
+        last_child = {}
+        for child, parent in enumerate(kept_parents.tolist()):
+            if parent < 0:
+                continue
+            if parent in last_child:
+                next_siblings[last_child[parent]] = child
+            else:
+                first_children[parent] = child
+            last_child[parent] = child
+        return CompactTree(parents=kept_parents,
+                           first_children=first_children,
+                           next_siblings=next_siblings,
+                           branch_lengths=branch_lengths[kept],
+                           names=[self.names[node] for node in kept.tolist()])
+
+    def get_x_coordinates(self) -> list:
+        """
+        The distance of each node from the root, as intreeactive.get_x_coordinates. If there are no branch lengths,
+        unit branch lengths are used.
+        :return: list of x-coordinates, a Python int or float for each node (as Bio.Phylo depths, so they are written
+            the same way).
+        """
+        def get_depths(unit_branch_lengths: bool) -> list:
+            # "branch_length or 0", as Bio.Phylo
+            lengths = [1 if unit_branch_lengths else (0 if np.isnan(length) or length == 0 else length)
+                       for length in self.branch_lengths.tolist()]
+            root_length = self.branch_lengths[0]
+            depths = [0 if np.isnan(root_length) or root_length == 0 else root_length.item()]
+            for node, parent in enumerate(self.parents.tolist()[1:], start=1):
+                depths.append(depths[parent] + lengths[node])
+            return depths
+
+        x_coords = get_depths(unit_branch_lengths=False)
+        if not max(x_coords):
+            x_coords = get_depths(unit_branch_lengths=True)
+        return x_coords
+
+    def get_y_coordinates(self, dist: float = 0.1) -> list:
+        """
+        The leaves are dist apart, and each internal node is halfway between its first and last child, as
+        intreeactive.get_y_coordinates.
+        :return: list of y-coordinates.
+        """
+        is_leaf = self.is_leaf().tolist()
+        y_coords = [0.0] * len(self)
+        leaf_number = 0
+        for node in range(len(self)):
+            if is_leaf[node]:
+                leaf_number += 1
+                y_coords[node] = leaf_number * dist
+        first_children = self.first_children.tolist()
+        last_children = self.get_last_children().tolist()
+        for node in range(len(self) - 1, -1, -1):
+            if not is_leaf[node]:
+                y_coords[node] = (y_coords[first_children[node]] + y_coords[last_children[node]]) / 2
+        return y_coords
+
+    def get_layout(self) -> tuple[list, list, list, dict]:
+        """
+        Lay out the tree for plotting, the same as intreeactive.get_tree_layout does for a Bio.Phylo tree.
+        :return: tuple of the x-coordinates, y-coordinates and names of the nodes, and the clade summary.
+        """
+        x_coords = quantize_coordinates(self.get_x_coordinates())
+        y_coords = quantize_coordinates(self.get_y_coordinates())
+        clade_summary = summarise_clades(parents=self.parents,
+                                         x_coords=x_coords,
+                                         y_coords=y_coords,
+                                         first_children=self.first_children,
+                                         last_children=self.get_last_children())
+        return x_coords.tolist(), y_coords.tolist(), list(self.names), clade_summary
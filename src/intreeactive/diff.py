@@ -0,0 +1,129 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from intreeactive import artefacts, intreeactive
+
+# The Change column added to the metadata of the new report by add_change_column.
+CHANGE_COLUMN = 'Change'
+
+
+def read_run(path: str | os.PathLike) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Read the SNP distances and nearest neighbours of one run, from a directory written by --emit-artefacts (which has
+    the nearest neighbours already) or from a SNP distance matrix file.
+    :param path: artefacts directory, or SNP distance matrix file.
+    :return: tuple of the SNP distance matrix and the nearest neighbours (as get_all_nearest_neighbours).
+    """
+    if Path(path).is_dir():
+        _, _, _, snp_distance_matrix, nearest_neighbours, _ = artefacts.read_artefacts(path)
+        # Samples without neighbours aren't in the artefacts
+        return snp_distance_matrix, nearest_neighbours.reindex(snp_distance_matrix.index, fill_value="")
+    if not Path(path).exists():
+        sys.exit(f"Error: \n {path} is not an artefacts directory or a SNP distance matrix file. \n Exiting...")
+    snp_distance_matrix = intreeactive.read_in_snp_dist_matrix(path)
+    return snp_distance_matrix, intreeactive.get_all_nearest_neighbours(snp_distance_matrix)
+
+
+def sort_nearest_neighbours(nearest_neighbours: pd.Series) -> pd.Series:
+    """
+    Sort each sample's nearest neighbours by ID, so two runs with the samples in a different order in the matrix can be
+    compared.
+    :param nearest_neighbours: series of sample ID: nearest neighbours, as get_all_nearest_neighbours.
+    :return: series of sample ID: sorted nearest neighbours, in the same order.
+    """
+    neighbour_table = artefacts.get_nearest_neighbour_table(nearest_neighbours)
+    neighbour_table = neighbour_table.sort_values(['sample', 'neighbour'], kind='stable')
+    sorted_neighbours = artefacts.get_nearest_neighbours_from_table(neighbour_table)
+    return sorted_neighbours.reindex(nearest_neighbours.index.astype(str), fill_value="")
+
+
+def get_cluster_table(snp_distance_matrix: pd.DataFrame, cluster_snps: float) -> pd.DataFrame:
+    """
+    Get the SNP cluster (see get_snp_clusters) of each sample, named by its first sample ID in sorted order, and a
+    fingerprint of its members - the sum of a hash of each member's ID - so clusters with the same members in two runs
+    have the same fingerprint whatever their names or order.
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances.
+    :param cluster_snps: the largest SNP distance linking two samples in a cluster.
+    :return: dataframe indexed by sample ID, with cluster (name), size and members (fingerprint) columns.
+    """
+    clusters = intreeactive.get_snp_clusters(snp_distance_matrix, cluster_snps).to_numpy()
+    sample_ids = snp_distance_matrix.index.astype(str)
+    n_clusters = int(clusters.max(initial=-1)) + 1
+    # uint64 sums wrap around, which is fine for a fingerprint
+    fingerprints = np.zeros(n_clusters, dtype=np.uint64)
+    np.add.at(fingerprints, clusters, pd.util.hash_array(sample_ids.to_numpy(dtype=object)))
+    names = pd.Series(sample_ids).groupby(clusters).min().to_numpy()
+    return pd.DataFrame({'cluster': names[clusters],
+                         'size': np.bincount(clusters, minlength=n_clusters)[clusters],
+                         'members': fingerprints[clusters]},
+                        index=sample_ids)
+
+
+def get_changes(*,
+                old_snp_distance_matrix: pd.DataFrame,
+                old_nearest_neighbours: pd.Series,
+                new_snp_distance_matrix: pd.DataFrame,
+                new_nearest_neighbours: pd.Series,
+                cluster_snps: float = None) -> pd.DataFrame:
+    """
+    Compare two runs sample by sample, joining them on the sample IDs: which samples are new or removed, and which
+    samples in both runs have different nearest neighbours, or (with cluster_snps) a cluster with different members.
+    :param old_snp_distance_matrix: the SNP distance matrix of the old run.
+    :param old_nearest_neighbours: the nearest neighbours of the old run, as get_all_nearest_neighbours.
+    :param new_snp_distance_matrix: the SNP distance matrix of the new run.
+    :param new_nearest_neighbours: the nearest neighbours of the new run, as get_all_nearest_neighbours.
+    :param cluster_snps: if given, also compare the SNP clusters at this distance (see get_snp_clusters). (float,
+        default = None)
+    :return: dataframe with a row for each sample that changed, sorted by change then sample: sample, change ("new",
+        "removed" or "changed"), neighbours_changed, old_neighbours and new_neighbours and, with cluster_snps,
+        cluster_changed, old_cluster, old_cluster_size, new_cluster and new_cluster_size.
+    """
+    runs = pd.concat({'old_neighbours': sort_nearest_neighbours(old_nearest_neighbours),
+                      'new_neighbours': sort_nearest_neighbours(new_nearest_neighbours)}, axis=1)
+    in_old = runs.index.isin(old_snp_distance_matrix.index.astype(str))
+    in_new = runs.index.isin(new_snp_distance_matrix.index.astype(str))
+    in_both = in_old & in_new
+    runs['neighbours_changed'] = in_both & (runs['old_neighbours'] != runs['new_neighbours']).to_numpy()
+    is_changed = runs['neighbours_changed'].to_numpy()
+
+    if cluster_snps is not None:
+        runs = runs.join(get_cluster_table(old_snp_distance_matrix, cluster_snps).add_prefix('old_'))
+        runs = runs.join(get_cluster_table(new_snp_distance_matrix, cluster_snps).add_prefix('new_'))
+        runs['cluster_changed'] = in_both & (runs['old_members'] != runs['new_members']).to_numpy()
+        runs = runs.drop(columns=['old_members', 'new_members']).rename(columns={'old_size': 'old_cluster_size',
+                                                                               'new_size': 'new_cluster_size'})
+        is_changed = is_changed | runs['cluster_changed'].to_numpy()
+
+    runs.insert(0, 'change', np.select([~in_old, ~in_new, is_changed], ['new', 'removed', 'changed'], ''))
+    changes = runs[runs['change'] != ''].rename_axis('sample').reset_index()
+    changes = changes.sort_values(['change', 'sample'], kind='stable', ignore_index=True)
+    for column in ['old_cluster_size', 'new_cluster_size']:
+        if column in changes:
+            changes[column] = changes[column].astype('Int64')
+    return changes
+
+
+def add_change_column(metadata: pd.DataFrame, changes: pd.DataFrame, id_column: str = 'ID') -> pd.DataFrame:
+    """
+    Add a Change column to the metadata of the new run (in place), so the changed samples can be coloured or filtered
+    by in the report: "New", "Neighbours changed", "Cluster changed", "Neighbours and cluster changed" or "Unchanged".
+    :param metadata: Pandas dataframe of metadata of the new run.
+    :param changes: the changes from get_changes.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :return: the metadata.
+    """
+    changes = changes.set_index('sample')
+    cluster_changed = changes.get('cluster_changed', False)
+    labels = pd.Series(np.select([changes['change'] == 'new',
+                                  changes['neighbours_changed'] & cluster_changed,
+                                  changes['neighbours_changed'],
+                                  cluster_changed],
+                                 ['New', 'Neighbours and cluster changed', 'Neighbours changed', 'Cluster changed'],
+                                 'Unchanged'),
+                       index=changes.index)
+    metadata[CHANGE_COLUMN] = metadata[id_column].map(labels).fillna('Unchanged')
+    return metadata
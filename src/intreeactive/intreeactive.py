@@ -1,56 +1,222 @@
 import os.path
+import copy
 import json
 import datetime
 import base64
+import gzip
 import sys
+import uuid
+import urllib.parse
+import hashlib
+import functools
+import concurrent.futures
 import plotly.colors
 
 from importlib.resources import files, as_file
 from pathlib import Path
 from Bio import Phylo
-from typing import List, Optional, Literal
+from typing import Iterator, List, Optional, Literal
+import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup as bs
 
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard library json module is used instead.
+    orjson = None
+
+# The error from importing pyarrow, if it couldn't be, which is shown when it is needed (it may be installed but built
+# for another version of NumPy).
+pyarrow_import_error = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError as error:  # pyarrow is optional, it is only needed to read Arrow and Parquet inputs.
+    pyarrow = None
+    pyarrow_import_error = error
+
+from intreeactive import __version__
+from intreeactive import neighbours
+from intreeactive.compact_tree import CompactTree, quantize_coordinates, summarise_clades
 
 # Set up html_res path:
 html_res = files('html_res')
+# Files in html_res that are rendered into the static asset bundle (as well as everything in help_images):
+STATIC_ASSET_FILES = ['favicon.png', 'main.css', 'main.js', 'loader.js', 'help.html']
+# Metadata and SNP distance matrix files that are read with pyarrow instead of as delimited text, recognised by their
+# extension or, failing that, the magic bytes they start with.
+TABLE_FILE_EXTENSIONS = {'.parquet': 'parquet', '.pq': 'parquet', '.arrow': 'arrow', '.feather': 'arrow'}
+TABLE_FILE_MAGIC = {b'PAR1': 'parquet', b'ARROW1': 'arrow'}
 
 
 def read_in_tree(*,
                  path_to_tree: str | os.PathLike,
                  outgroup: str = None,
-                 tree_format: Literal["newick", "nexus", "nexml", "phyloxml", "cdao"] = None):
+                 tree_format: Literal["newick", "nexus", "nexml", "phyloxml", "cdao"] = None,
+                 compact: bool = False,
+                 skip_missing_outgroup: bool = False):
     """
     Parse tree using Bio.Phylo.read.
     :param path_to_tree: path to tree file.
     :param outgroup: outgroup to root the tree on (str, default = None).
     :param tree_format: format of tree, should be newick, nexus, phyloxm, nexml, cdao (str, default = newick).
+    :param compact: read the tree into a CompactTree, which is faster and smaller for large trees. Newick trees are
+    read without making any Bio.Phylo objects. (bool, default = False)
+    :param skip_missing_outgroup: if the outgroup isn't in the tree, leave the tree rooted as it is (with a note)
+    instead of failing, e.g. for a subtree of one cluster. (bool, default = False)
     :return: tree - class instance of Bio.Phylo.<tree_format>.Tree. For the default Newick tree, this returns
-    Bio.Phylo.Newick.Tree object.
+    Bio.Phylo.Newick.Tree object. If compact, a CompactTree.
     """
     if not tree_format:
         tree_format = 'newick'
-    tree = Phylo.read(path_to_tree, tree_format)
+    if compact:
+        if tree_format == 'newick':
+            tree = CompactTree.from_newick(path_to_tree)
+        else:
+            tree = CompactTree.from_phylo(Phylo.read(path_to_tree, tree_format))
+    else:
+        tree = Phylo.read(path_to_tree, tree_format)
     if outgroup:
-        tree.root_with_outgroup({'name': outgroup})
+        has_outgroup = outgroup in tree.names if compact else tree.find_any(name=outgroup) is not None
+        if has_outgroup or not skip_missing_outgroup:
+            tree.root_with_outgroup(outgroup if compact else {'name': outgroup})
+        else:
+            print(f"Note: {path_to_tree} does not contain the outgroup {outgroup}, so it is not rooted on it.")
     tree.ladderize(reverse=True)
     return tree
 
 
+def get_leaf_names(tree) -> list[str]:
+    """
+    :param tree: Bio.Phylo tree object or CompactTree.
+    :return: the names of the leaves of the tree, in depth first order.
+    """
+    if isinstance(tree, CompactTree):
+        return tree.get_leaf_names()
+    return [leaf.name for leaf in tree.get_terminals()]
+
+
+def get_table_file_format(path: str | os.PathLike) -> Literal["parquet", "arrow"] | None:
+    """
+    Work out if a metadata or SNP distance matrix file is Parquet or Arrow IPC (Feather version 2), from its extension
+    or, if that isn't one of TABLE_FILE_EXTENSIONS, the start of the file.
+    :param path: path to the file.
+    :return: "parquet", "arrow", or None for delimited text.
+    """
+    table_format = TABLE_FILE_EXTENSIONS.get(Path(path).suffix.lower())
+    if table_format is None:
+        with open(path, 'rb') as handle:
+            start = handle.read(max(map(len, TABLE_FILE_MAGIC)))
+        table_format = next((name for magic, name in TABLE_FILE_MAGIC.items() if start.startswith(magic)), None)
+    return table_format
+
+
+def get_table_file_columns(path: str | os.PathLike, table_format: Literal["parquet", "arrow"]) -> list[str]:
+    """
+    Get the column names of a Parquet or Arrow file, from its schema, without reading the data.
+    """
+    if pyarrow is None:
+        sys.exit(f"Error: \n {path} is an {table_format} file, which needs pyarrow to read, but pyarrow could not be "
+                 f"imported ({pyarrow_import_error}). Install it with pip install 'pyarrow>=14,<16'. \n Exiting...")
+    if table_format == 'parquet':
+        return pyarrow.parquet.read_schema(path).names
+    with pyarrow.memory_map(str(path)) as source:
+        return pyarrow.ipc.open_file(source).schema.names
+
+
+def read_arrow_table(path: str | os.PathLike,
+                     table_format: Literal["parquet", "arrow"],
+                     columns: Optional[list[str]] = None) -> "pyarrow.Table":
+    """
+    Read a Parquet or Arrow IPC (Feather) file into a pyarrow Table. Only the given columns are read from the file.
+    Arrow files are memory mapped, so they are only read from disk as the columns are used. The index written by
+    pandas (if any) is moved to be the first column.
+    :param path: path to the file.
+    :param table_format: "parquet" or "arrow", from get_table_file_format.
+    :param columns: the columns to read, or None for all of them. (default = None)
+    :return: pyarrow Table of the columns.
+    """
+    if pyarrow is None:
+        get_table_file_columns(path, table_format)  # exits with an error
+    if table_format == 'parquet':
+        table = pyarrow.parquet.read_table(path, columns=columns, memory_map=True)
+    else:
+        with pyarrow.memory_map(str(path)) as source:
+            table = pyarrow.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    # For example a SNP distance matrix written from a dataframe with the sample names as the index. A RangeIndex is
+    # only described in the metadata, not stored as a column.
+    pandas_metadata = table.schema.pandas_metadata or {}
+    index_columns = [column for column in pandas_metadata.get('index_columns', [])
+                     if isinstance(column, str) and column in table.column_names]
+    if index_columns:
+        table = table.select(index_columns + [column for column in table.column_names if column not in index_columns])
+    return table
+
+
+def read_table_file(path: str | os.PathLike,
+                    table_format: Literal["parquet", "arrow"],
+                    columns: Optional[list[str]] = None) -> pd.DataFrame:
+    """
+    Read a Parquet or Arrow IPC (Feather) file into a dataframe (see read_arrow_table).
+    :param path: path to the file.
+    :param table_format: "parquet" or "arrow", from get_table_file_format.
+    :param columns: the columns to read, or None for all of them. (default = None)
+    :return: dataframe of the columns, with the index written by pandas (if any) as the first column. Missing values
+        are NaN.
+    """
+    table_df = read_arrow_table(path, table_format, columns=columns).to_pandas()
+    if not isinstance(table_df.index, pd.RangeIndex):
+        table_df = table_df.reset_index()
+    # Missing text is None, make it NaN as when reading a text file
+    text_columns = [column for column in table_df.columns if pd.api.types.is_object_dtype(table_df[column])]
+    if len(text_columns):
+        table_df[text_columns] = table_df[text_columns].fillna(np.nan)
+    return table_df
+
+
 def read_in_metadata(path_to_metadata: str | os.PathLike,
-                     id_column: str = None) -> tuple[pd.DataFrame, str]:
+                     id_column: str = None,
+                     columns: Optional[list[str]] = None) -> tuple[pd.DataFrame, str]:
     """
     Read in metadata and read with Pandas - all cells should be strings.
     Change the id_column to "ID" and make sure there are no other ID columns.
+    The metadata can be delimited text, Parquet or Arrow IPC (Feather) (see get_table_file_format).
+    :param path_to_metadata: path to the metadata file.
+    :param id_column: the column with the sample IDs. The first column is used if this isn't given or isn't in the
+        file. (default = None)
+    :param columns: only read these columns, and the ID column. For Parquet and Arrow files the other columns are not
+        read from the file at all. (default = None, all columns)
+    :return: tuple of the metadata and the name of the ID column, "ID".
     """
-    metadata_df = pd.read_csv(path_to_metadata, sep=None, engine='python', encoding='windows-1252')
-    metadata_df = metadata_df.astype(str)
+    table_format = get_table_file_format(path_to_metadata)
+    if table_format is None:
+        metadata_df = pd.read_csv(path_to_metadata, sep=None, engine='python', encoding='windows-1252')
+        file_columns = metadata_df.columns.to_list()
+    else:
+        file_columns = get_table_file_columns(path_to_metadata, table_format)
     # If id_column supplied and present in the dataframe, use that, else use the first column.
-    if not id_column or id_column not in metadata_df.columns.values:
-        id_column = metadata_df.columns.values[0]
+    if not id_column or id_column not in file_columns:
+        id_column = file_columns[0]
+    if columns is not None:
+        missing_columns = set(columns) - set(file_columns)
+        if missing_columns:
+            sys.exit(f"Error: \n Metadata column(s) {', '.join(sorted(missing_columns))} not found in "
+                     f"{path_to_metadata}. \n Exiting...")
+        # keep the columns in the order of the file
+        file_columns = [column for column in file_columns if column == id_column or column in columns]
+    if table_format is None:
+        metadata_df = metadata_df[file_columns]
+    else:
+        metadata_df = read_table_file(path_to_metadata, table_format, columns=file_columns)
+    metadata_df = metadata_df.astype(str)
     # Check if there are any other columns called "ID":
     if "ID" in metadata_df.columns.values and metadata_df.columns.values[0] != "ID":
         metadata_df.rename(columns={"ID": "other_id_x"}, inplace=True)
@@ -62,16 +228,151 @@ def read_in_metadata(path_to_metadata: str | os.PathLike,
 def read_in_snp_dist_matrix(path_to_snp_dists: str | os.PathLike) -> pd.DataFrame:
     """
     Read in snp distance matrix using pandas. The row names and column names should match, and should be parsed as
-    strings.
+    strings. The file can be the whole matrix, or just the lower or upper triangle (with the other cells left empty).
     :param path_to_snp_dists: string or path to the snp distance matrix.
+    :return: the full, checked matrix (see validate_snp_dist_matrix).
     """
-    snpdist_matrix = pd.read_csv(path_to_snp_dists, sep=None, engine='python', index_col=0)
-    # Assert that the order of the columns is identical to the order of the rows that way we know we only need to store
-    # the index once
-    assert list(snpdist_matrix) == list(snpdist_matrix.columns)
+    table_format = get_table_file_format(path_to_snp_dists)
+    if table_format is None:
+        snpdist_matrix = pd.read_csv(path_to_snp_dists, sep=None, engine='python', index_col=0)
+    else:
+        # The sample names are the first column, as in a text matrix. The distances are put straight from the Arrow
+        # columns into one array, without making a dataframe of the columns first. Missing distances are NaN.
+        matrix_table = read_arrow_table(path_to_snp_dists, table_format)
+        snpdist_matrix = pd.DataFrame(np.column_stack([column.to_numpy(zero_copy_only=False)
+                                                       for column in matrix_table.columns[1:]]),
+                                      index=pd.Index(matrix_table.column(0).to_pylist()).astype(str),
+                                      columns=matrix_table.column_names[1:])
+    problems, snpdist_matrix = validate_snp_dist_matrix(snpdist_matrix)
+    if problems:
+        sys.exit("Error: \n "
+                 f"{path_to_snp_dists} is not a valid snp distance matrix: \n  - " + "\n  - ".join(problems) + "\n"
+                 "Exiting...")
     return snpdist_matrix
 
 
+def validate_snp_dist_matrix(snpdist_matrix: pd.DataFrame, *, max_examples: int = 5) -> tuple[list[str], pd.DataFrame]:
+    """
+    Check a snp distance matrix all at once, so every problem is reported together rather than the first one turning up
+    later as an error somewhere else: the row and column names must be the same samples, without duplicates, and the
+    distances whole numbers that are not negative, symmetric, with zeros on the diagonal.
+    If only the lower or upper triangle is filled in, the empty cells are filled from the other triangle (and an empty
+    diagonal with zeros). If the columns are the rows in another order, they are put in the order of the rows.
+    :param snpdist_matrix: dataframe read from a matrix file, with the sample names as the index and columns.
+    :param max_examples: the number of sample names or pairs to give for each problem. (int, default = 5)
+    :return: tuple of a list of problems (empty if there are none), and the full matrix with string sample names.
+    """
+    problems = []
+
+    def examples(labels, count: int = None) -> str:
+        labels = list(labels)
+        count = len(labels) if count is None else count
+        return ', '.join(map(str, labels[:max_examples])) + (f' and {count - max_examples} more'
+                                                             if count > max_examples else '')
+
+    ###########
+    # 1. Sample names
+    ###########
+    row_ids = snpdist_matrix.index.astype(str)
+    column_ids = snpdist_matrix.columns.astype(str)
+    for name, ids in [('row', row_ids), ('column', column_ids)]:
+        if ids.has_duplicates:
+            problems.append(f"duplicate {name} names: {examples(ids[ids.duplicated()].unique())}")
+    if problems:
+        # the rows and columns can't be matched up, so there is nothing more to check
+        return problems, snpdist_matrix
+    if not row_ids.equals(column_ids):
+        if set(row_ids) != set(column_ids):
+            problems.append(f"the row and column names are not the same samples: "
+                            f"{examples(row_ids.symmetric_difference(column_ids, sort=False))} are only in one")
+            return problems, snpdist_matrix
+        snpdist_matrix = snpdist_matrix.set_axis(column_ids, axis=1)[row_ids]
+    snpdist_matrix = snpdist_matrix.set_axis(row_ids, axis=0).set_axis(row_ids, axis=1)
+
+    ###########
+    # 2. Distances
+    ###########
+    # Only the columns that aren't already numbers (for example with text in them) are converted, so a numeric matrix
+    # is checked as one array without copying it.
+    text_columns = [column for column, dtype in snpdist_matrix.dtypes.items()
+                    if not pd.api.types.is_numeric_dtype(dtype)]
+    if text_columns:
+        numbers = snpdist_matrix[text_columns].apply(pd.to_numeric, errors='coerce')
+        not_numbers = numbers.isna().to_numpy() & snpdist_matrix[text_columns].notna().to_numpy()
+        if not_numbers.any():
+            problems.append(f"distances that are not numbers for: {examples(row_ids[not_numbers.any(axis=1)])}")
+        snpdist_matrix = snpdist_matrix.copy(deep=False)
+        snpdist_matrix[text_columns] = numbers
+    values = snpdist_matrix.to_numpy()
+
+    # The checks are made a block of rows at a time, against the same block of columns (the rows of the transpose), so
+    # only a few block sized arrays are made rather than copies of the whole matrix. Only the first max_examples of
+    # each problem are kept, with a count of the rest.
+    n_samples = len(values)
+    block_size = max(1, neighbours.BLOCK_CELLS // max(n_samples, 1))
+    found = {problem: [[], 0] for problem in ['missing', 'not_zero', 'not_symmetric', 'not_counts']}
+
+    def found_problems(problem: str, labels) -> None:
+        labels = list(labels)
+        found[problem][0].extend(labels[:max_examples - len(found[problem][0])])
+        found[problem][1] += len(labels)
+
+    is_empty = False
+    largest = 0
+    for start in range(0, n_samples, block_size):
+        stop = min(start + block_size, n_samples)
+        block = values[start:stop].astype(float)
+        mirror = values[:, start:stop].T.astype(float)
+        block_rows = np.arange(stop - start)
+        block_diagonal = (block_rows, start + block_rows)
+
+        # A lower or upper triangular matrix has the other triangle empty; fill it from the transpose.
+        empty = np.isnan(block)
+        if empty.any():
+            is_empty = True
+            filled = np.where(empty, mirror, block)
+            filled[block_diagonal] = np.nan_to_num(filled[block_diagonal], nan=0)
+            rows, columns = np.nonzero(np.isnan(filled) & (np.arange(n_samples) >= start + block_rows[:, None]))
+            found_problems('missing', (f'{row_ids[start + i]}-{row_ids[j]}' for i, j in zip(rows, columns)))
+        else:
+            filled = block
+
+        # Missing distances are already reported, so they are left out of the other checks.
+        known = ~np.isnan(filled)
+        diagonal = filled[block_diagonal]
+        found_problems('not_zero', row_ids[start:stop][~np.isnan(diagonal) & (diagonal != 0)])
+        rows, columns = np.nonzero(~empty & ~np.isnan(mirror) & (block != mirror)
+                                   & (np.arange(n_samples) > start + block_rows[:, None]))
+        found_problems('not_symmetric', (f'{row_ids[start + i]}-{row_ids[j]}' for i, j in zip(rows, columns)))
+        not_counts = known & ((filled < 0) | (filled != np.floor(filled)) | np.isinf(filled))
+        found_problems('not_counts', row_ids[start:stop][not_counts.any(axis=1)])
+        if known.any():
+            largest = max(largest, np.nanmax(filled))
+
+    for problem, message in [('missing', "distances missing (in both triangles) for: "),
+                             ('not_zero', "the distance of a sample to itself is not 0 for: "),
+                             ('not_symmetric', "the matrix is not symmetric for: "),
+                             ('not_counts', "distances that are not whole numbers of 0 or more for: ")]:
+        labels, count = found[problem]
+        if count:
+            problems.append(message + examples(labels, count))
+    if problems:
+        return problems, snpdist_matrix
+
+    if is_empty or not np.issubdtype(values.dtype, np.integer):
+        # The distances are stored in the smallest whole number type that holds them, filling a block at a time
+        whole_values = np.empty(values.shape, dtype=np.min_scalar_type(int(largest)))
+        for start in range(0, n_samples, block_size):
+            stop = min(start + block_size, n_samples)
+            block = values[start:stop].astype(float)
+            block_rows = np.arange(stop - start)
+            filled = np.where(np.isnan(block), values[:, start:stop].T, block)
+            filled[block_rows, start + block_rows] = np.nan_to_num(filled[block_rows, start + block_rows], nan=0)
+            whole_values[start:stop] = filled
+        snpdist_matrix = pd.DataFrame(whole_values, index=row_ids, columns=row_ids)
+    return problems, snpdist_matrix
+
+
 def check_ids(*,
               tree,
               metadata: pd.DataFrame,
@@ -85,7 +386,7 @@ def check_ids(*,
     it can be dropped (for performance later).
     If a sample ID occurs in the snp_dists and not in the tree, it can be ignored.
 
-    :param tree: Bio.Phylo.Newick.Tree object
+    :param tree: Bio.Phylo.Newick.Tree object or CompactTree
     :param metadata: a dataframe with metadata - all cells should be strings.
     :param snp_dists: a dataframe matrix of the snp distances. The row names and column names should match, and should
     be parsed as strings.
@@ -95,7 +396,7 @@ def check_ids(*,
 
     :returns: metadata dataframe if changes made, else empty dataframe.
     """
-    samples_in_tree = [leaf.name for leaf in tree.get_terminals()]
+    samples_in_tree = get_leaf_names(tree)
     samples_in_metadata = metadata[id_column].to_list()
     samples_in_snpdists = list(snp_dists)
     # Check all samples in tree are in metadata and snp dists, if not, exit.
@@ -138,6 +439,144 @@ def check_ids(*,
     return pd.DataFrame()
 
 
+def read_in_focus_ids(path_to_focus_ids: str | os.PathLike) -> list[str]:
+    """
+    Read in the sample IDs to focus the report on - one ID per line. Blank lines and lines starting with '#' are
+    skipped.
+    :param path_to_focus_ids: string or path to the file of IDs.
+    :return: list of IDs, in the order of the file.
+    """
+    with open(path_to_focus_ids) as focus_file:
+        focus_ids = [line.strip() for line in focus_file]
+    return [focus_id for focus_id in focus_ids if focus_id and not focus_id.startswith('#')]
+
+
+def get_focus_ids(*,
+                  tree,
+                  snp_dists: pd.DataFrame,
+                  query_ids: list[str],
+                  context_snps: int = 0,
+                  ancestral_hops: int = 0) -> set[str]:
+    """
+    Get the tree leaves to keep in a focused report: the query samples, every sample within context_snps SNPs of any
+    query sample, and every leaf below the node ancestral_hops steps above each query sample.
+    :param tree: Bio.Phylo tree object or CompactTree.
+    :param snp_dists: a dataframe matrix of the snp distances.
+    :param query_ids: the IDs to focus on. IDs that are not leaves of the tree are skipped with a warning.
+    :param context_snps: include samples within this many SNPs of a query sample (int, default = 0).
+    :param ancestral_hops: include the leaves below the node this many steps up the tree from each query sample
+    (int, default = 0, which adds nothing).
+    :return: set of leaf names to keep.
+    """
+    leaves = set(get_leaf_names(tree))
+    for query_id in query_ids:
+        if query_id not in leaves:
+            print(f"Warning: focus sample {query_id} is not in the tree, skipping.", file=sys.stderr)
+    query_ids = [query_id for query_id in query_ids if query_id in leaves]
+    if not query_ids:
+        sys.exit("Error: \n "
+                 "None of the focus sample IDs occur in the tree. \n"
+                 "Exiting...")
+    focus_ids = set(query_ids)
+
+    # One comparison over the query rows of the matrix, rather than a lookup per pair of samples:
+    query_rows = snp_dists.loc[snp_dists.index.isin(query_ids)]
+    if not query_rows.empty:
+        within_context = (query_rows.to_numpy() <= context_snps).any(axis=0)
+        focus_ids.update(snp_dists.columns[within_context])
+
+    if ancestral_hops > 0:
+        if isinstance(tree, CompactTree):
+            leaf_nodes = {tree.names[node]: node for node in np.flatnonzero(tree.is_leaf()).tolist()}
+            for query_id in query_ids:
+                ancestor = tree.get_ancestor(leaf_nodes[query_id], ancestral_hops)
+                focus_ids.update(tree.get_clade_leaf_names(ancestor))
+        else:
+            leaf_clades = {leaf.name: leaf for leaf in tree.get_terminals()}
+            parents = {child: clade for clade in tree.find_clades() for child in clade.clades}
+            for query_id in query_ids:
+                ancestor = leaf_clades[query_id]
+                for _ in range(ancestral_hops):
+                    if ancestor not in parents:
+                        break
+                    ancestor = parents[ancestor]
+                focus_ids.update(leaf.name for leaf in ancestor.get_terminals())
+
+    return focus_ids & leaves
+
+
+def prune_tree(tree, keep_ids: set[str]):
+    """
+    Make a copy of the tree with only the leaves in keep_ids. Internal nodes left with one child are removed, adding
+    their branch length to the child, so the copy is the smallest tree joining the kept leaves. The input tree is not
+    changed.
+    :param tree: Bio.Phylo tree object or CompactTree.
+    :param keep_ids: set of leaf names to keep.
+    :return: pruned copy of the tree.
+    """
+    if isinstance(tree, CompactTree):
+        return tree.prune(keep_ids)
+
+    def prune_clade(clade):
+        if clade.is_terminal():
+            return copy.copy(clade) if clade.name in keep_ids else None
+        children = [child for child in map(prune_clade, clade.clades) if child is not None]
+        if not children:
+            return None
+        if len(children) == 1:
+            child = children[0]
+            if clade.branch_length is not None or child.branch_length is not None:
+                child.branch_length = (clade.branch_length or 0) + (child.branch_length or 0)
+            return child
+        pruned_clade = copy.copy(clade)
+        pruned_clade.clades = children
+        return pruned_clade
+
+    pruned_tree = copy.copy(tree)
+    pruned_tree.root = prune_clade(tree.root)
+    return pruned_tree
+
+
+def focus_inputs(*,
+                 tree,
+                 metadata: pd.DataFrame,
+                 id_column: str = 'ID',
+                 snp_dists: pd.DataFrame,
+                 query_ids: list[str],
+                 context_snps: int = 0,
+                 ancestral_hops: int = 0) -> tuple:
+    """
+    Cut the tree, metadata and snp distance matrix down to the query samples and their context (see get_focus_ids),
+    so a report on a few samples from a large dataset only has to lay out and write those samples.
+    A "Focus" column is added to the metadata, marking each sample as "Query" or "Context", so it can be used to colour
+    the tree.
+    :param tree: Bio.Phylo tree object or CompactTree.
+    :param metadata: a dataframe with metadata - all cells should be strings.
+    :param id_column: string, the name of the ID column.
+    :param snp_dists: a dataframe matrix of the snp distances.
+    :param query_ids: the IDs to focus on.
+    :param context_snps: include samples within this many SNPs of a query sample (int, default = 0).
+    :param ancestral_hops: include the leaves below the node this many steps up the tree from each query sample
+    (int, default = 0).
+    :return: tuple of the pruned tree, metadata and snp distance matrix.
+    """
+    focus_ids = get_focus_ids(tree=tree,
+                              snp_dists=snp_dists,
+                              query_ids=query_ids,
+                              context_snps=context_snps,
+                              ancestral_hops=ancestral_hops)
+    print(f"Focusing on {len(set(query_ids) & focus_ids)} query samples and "
+          f"{len(focus_ids - set(query_ids))} context samples.")
+
+    tree = prune_tree(tree, focus_ids)
+    metadata = metadata[metadata[id_column].isin(focus_ids)].reset_index(drop=True)
+    metadata['Focus'] = np.where(metadata[id_column].isin(query_ids), 'Query', 'Context')
+    # Keep the order of the matrix, so the rows and columns still match:
+    matrix_ids = snp_dists.index[snp_dists.index.isin(focus_ids)]
+    snp_dists = snp_dists.loc[matrix_ids, matrix_ids]
+    return tree, metadata, snp_dists
+
+
 # https://github.com/empet/Phylogenetic-trees - source for functions to parse the tree and format into plotly-ready
 # structures. These functions are based on the same named `get_x_coordinates()`, `get_y_coordinates()` functions in
 # Biopython: https://github.com/biopython/biopython/blob/master/Bio/Phylo/_utils.py.
@@ -263,6 +702,42 @@ def draw_clade(clade, x_coords: dict, y_coords: dict, line_shapes: List[dict], x
             draw_clade(child, x_coords, y_coords, line_shapes, line_colour=line_colour, x_start=x_curr)
 
 
+def get_clade_summary(x_coords: dict, y_coords: dict) -> dict:
+    """
+    Summarise the clades (internal nodes) of the tree, so the browser can draw large trees with less detail when zoomed
+    out - clades that are too small to see are drawn as one collapsed shape.
+    Nodes are numbered in the order of x_coords, which is depth first (from tree.depths()), so a clade and all its
+    descendants are the contiguous range of nodes from the clade to 'end'.
+    :param x_coords: dict of clade: x-coord, from get_x_coordinates.
+    :param y_coords: dict of clade: y-coord, from get_y_coordinates.
+    :return: dict with 'parents' (index of the parent of each node, -1 for the root) and 'clades', a dict of lists with
+        one entry per clade: 'node' (index of the clade), 'end' (index after its last descendant), 'leaves' (number of
+        leaves), 'xMax', 'yMin' and 'yMax' (the box its descendants fit in), and 'yFirstChild' and 'yLastChild' (the
+        ends of its vertical branch line).
+    """
+    nodes = list(x_coords.keys())
+    node_index = {clade: index for index, clade in enumerate(nodes)}
+    node_count = len(nodes)
+
+    parents = np.full(node_count, -1, dtype=np.int64)
+    for index, clade in enumerate(nodes):
+        for child in clade.clades:
+            parents[node_index[child]] = index
+
+    first_children = np.full(node_count, -1, dtype=np.int64)
+    last_children = np.full(node_count, -1, dtype=np.int64)
+    for index, clade in enumerate(nodes):
+        if clade.clades:
+            first_children[index] = node_index[clade.clades[0]]
+            last_children[index] = node_index[clade.clades[-1]]
+
+    return summarise_clades(parents=parents,
+                            x_coords=np.array([x_coords[clade] for clade in nodes], dtype=float),
+                            y_coords=np.array([y_coords[clade] for clade in nodes], dtype=float),
+                            first_children=first_children,
+                            last_children=last_children)
+
+
 def get_nearest_neighbours(snp_distances: pd.DataFrame, node: str, *, do_join: bool = True) -> str | list:
     """
     Get a dictionary of the nearest neighbours and their snp distance to given node (sample or ID in df).
@@ -298,6 +773,81 @@ def get_nearest_neighbours(snp_distances: pd.DataFrame, node: str, *, do_join: b
         return nearest_neighbours
 
 
+def get_all_nearest_neighbours(snp_distances: pd.DataFrame, *, samples: list[str] = None, block_size: int = None,
+                               workers: int = None) -> pd.Series:
+    """
+    Get the nearest neighbours of every sample in the snp distance matrix at once, formatted as get_nearest_neighbours
+    does. The matrix is worked through a block of rows at a time, so memory use stays at block_size rows, and the
+    blocks of large matrices are shared out over processes (see neighbours.map_row_blocks).
+    :param snp_distances: Pandas dataframe, snp distance matrix. Column order must match row order.
+    :param samples: only get the nearest neighbours of these samples, from all the samples in the matrix. (default =
+        None, every sample)
+    :param block_size: number of samples to compare at a time (int, default = None, sized to neighbours.BLOCK_CELLS).
+    :param workers: number of processes to use. (int, default = None, the number of CPUs)
+    :return: Pandas series of sample ID: nearest neighbours, as "<ID>=<distance>" joined by "<br>".
+    """
+    if snp_distances.index.has_duplicates:
+        duplicates = snp_distances.index[snp_distances.index.duplicated()].unique().to_list()
+        print(f"Issues with snp distance matrix - check samples {duplicates} only occur once in the matrix")
+        sys.exit()
+
+    # Each column is the distances to one sample, so the rows of the transpose are worked through (pandas usually
+    # stores a single-type dataframe by column, so these rows are already contiguous in memory).
+    names = snp_distances.index.to_numpy().astype(str)
+    if samples is None:
+        sample_positions = None
+        values = snp_distances.to_numpy().T
+    else:
+        # Only the columns of these samples are taken, so the time and memory depend on their number
+        sample_positions = np.flatnonzero(snp_distances.index.isin(samples))
+        values = snp_distances.iloc[:, sample_positions].to_numpy().T
+    minimums, rows, nearest = neighbours.get_nearest(values, self_columns=sample_positions, block_size=block_size,
+                                                     workers=workers)
+    # The neighbours come back in order of sample, then matrix order, so each sample's ties stay in matrix order
+    formatted = pd.Series(np.char.add(np.char.add(names[nearest], '='), minimums[rows].astype(np.int64).astype(str)))
+    nearest_neighbours = formatted.groupby(rows).agg("<br>".join).reindex(range(len(values)), fill_value="")
+    index = snp_distances.index if samples is None else snp_distances.index[sample_positions]
+    return pd.Series(nearest_neighbours.to_numpy(), index=index, dtype=object)
+
+
+def get_snp_edges(snp_distances: pd.DataFrame, max_snps: float, *, block_size: int = None,
+                  workers: int = None) -> pd.DataFrame:
+    """
+    Get every pair of samples within max_snps of each other, once each, from the snp distance matrix. Large matrices
+    are shared out over processes, as get_all_nearest_neighbours.
+    :param snp_distances: Pandas dataframe, snp distance matrix. Column order must match row order.
+    :param max_snps: the largest SNP distance kept.
+    :param block_size: number of samples to compare at a time (int, default = None, sized to neighbours.BLOCK_CELLS).
+    :param workers: number of processes to use. (int, default = None, the number of CPUs)
+    :return: Pandas dataframe with source, target and snps columns, in the order of the samples in the matrix.
+    """
+    rows, columns, distances = neighbours.get_edges(snp_distances.to_numpy(), max_snps, block_size=block_size,
+                                                    workers=workers)
+    return pd.DataFrame({'source': snp_distances.index.to_numpy()[rows],
+                         'target': snp_distances.index.to_numpy()[columns],
+                         'snps': distances.astype(np.int64)})
+
+
+def add_nearest_neighbours(*,
+                           metadata: pd.DataFrame,
+                           id_column: str = 'ID',
+                           snp_distance_matrix: pd.DataFrame,
+                           nearest_neighbours: Optional[pd.Series] = None) -> pd.DataFrame:
+    """
+    Add the Nearest_neighbour column to the metadata (in place), for the hover text and the metadata panel.
+    :param metadata: Pandas dataframe of metadata.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances.
+    :param nearest_neighbours: the nearest neighbours from get_all_nearest_neighbours, if they have already been worked
+        out. (pandas series, default = None)
+    :return: the metadata.
+    """
+    if nearest_neighbours is None:
+        nearest_neighbours = get_all_nearest_neighbours(snp_distance_matrix)
+    metadata["Nearest_neighbour"] = metadata[id_column].map(nearest_neighbours).fillna("")
+    return metadata
+
+
 def make_hover_text(metadata_df: pd.DataFrame,
                     id_column: str,
                     node_list: list) -> list:
@@ -323,6 +873,21 @@ def make_hover_text(metadata_df: pd.DataFrame,
     return hover_text
 
 
+def get_category_colours(metadata_df: pd.DataFrame, category: str) -> pd.Series:
+    """
+    Give each unique item in a column of the metadata (category) its own colour, from plotly's 48 qualitative colours,
+    in sorted order so the colours are always the same.
+    :param metadata_df: the Pandas dataframe of metadata.
+    :param category: the column name to be coloured from the Pandas dataframe.
+    :return: series of the colour of each metadata row, with the same index.
+    """
+    # Create list of colours - use plotly built in, for total of 48 unique colours.
+    available_colours = px.colors.qualitative.Dark24 + px.colors.qualitative.Light24
+    # Create a dict and assign each value in the category a different colour (sort list to keep colours consistent).
+    colouring_dict = dict(zip(sorted(list(set(metadata_df[category]))), available_colours))
+    return metadata_df[category].map(colouring_dict)
+
+
 def get_colourings(metadata_df: pd.DataFrame,
                    id_column: str,
                    category: str,
@@ -342,10 +907,7 @@ def get_colourings(metadata_df: pd.DataFrame,
     :param intermediate_node_colour: colour for intermediate nodes (default = grey).
     :return: list of colours for each node in the order that the nodes occur.
     """
-    # Create list of colours - use plotly built in, for total of 48 unique colours.
-    available_colours = px.colors.qualitative.Dark24 + px.colors.qualitative.Light24
-    # Create a dict and assign each value in the category a different colour (sort list to keep colours consistent).
-    colouring_dict = dict(zip(sorted(list(set(metadata_df[category]))), available_colours))
+    row_colours = get_category_colours(metadata_df, category).to_list()
     # Create the list of colours - the list is as long as the number of nodes in the tree.
     list_of_colours = [intermediate_node_colour] * int(number_of_nodes)
     # For each row in the metadata field with the index, get the index in text list
@@ -353,10 +915,32 @@ def get_colourings(metadata_df: pd.DataFrame,
         for index, node_name in enumerate(node_list):
             if node_name is not None and node_name.startswith(sample_id):
                 # Only colour entries in the metadata that match in the tree
-                list_of_colours[index] = (colouring_dict[metadata_df.loc[df_index, category]])
+                list_of_colours[index] = row_colours[df_index]
     return list_of_colours
 
 
+def get_date_colours(metadata_df: pd.DataFrame, date_category: str) -> pd.Series:
+    """
+    Colour the dates in a column of the metadata in a gradient, from royal blue (oldest) to maroon red (newest).
+    Missing dates are black (rgb(0, 0, 0)).
+    :param metadata_df: the Pandas dataframe of metadata.
+    :param date_category: the name of the column that contained dates to be coloured in a gradient from the metadata.
+    :return: series of the colour of each metadata row, with the same index.
+    """
+    # Make date column actually dates, set anything not a date to not a time.
+    dates = pd.to_datetime(metadata_df[date_category], errors='coerce', format='mixed', yearfirst=True, dayfirst=True)
+    # Dates will be given a colour ranging from maroon (most recent) to royal blue (oldest).
+    # If there is only one date all samples will be maroon (rgb(0, 0, 151)). Any empty dates get black (rgb(0, 0, 0)).
+    date_deltas = (dates.max() - dates).dt.days
+    # Scale all date deltas between 0 and 1. Date delta can be 0 if dates are the same
+    max_delta = date_deltas.max()
+    date_deltas = date_deltas / (max_delta if max_delta != 0 and pd.notna(max_delta) else 1)
+    # Make dict of colours based on the date delta:
+    unique_deltas = date_deltas.dropna().unique().tolist()
+    gradient_colouring_dict = dict(zip(unique_deltas, plotly.colors.sample_colorscale('Jet', unique_deltas)))
+    return date_deltas.map(gradient_colouring_dict).fillna('rgb(0, 0, 0)')
+
+
 def get_continuous_colourings(metadata_df: pd.DataFrame,
                               id_column: str,
                               date_category: str,
@@ -375,47 +959,15 @@ def get_continuous_colourings(metadata_df: pd.DataFrame,
     :param intermediate_node_colour: colour for intermediate nodes (default = grey).
     :return: list of colours for each node in the order that the nodes occur.
     """
-    # Copy metadata:
-    metadata_copy = metadata_df.copy()
-    # Make date column actually dates, set anything not a date to not a time, drop later.
-    metadata_copy[date_category] = pd.to_datetime(metadata_copy[date_category],
-                                                  errors='coerce',
-                                                  format='mixed',
-                                                  yearfirst=True,
-                                                  dayfirst=True)
-    # If all dates are empty, assign all nodes to black (rgb(0, 0, 0):
-    if len(metadata_copy[date_category].unique()) == 1 \
-            and any([pd.isna(i) for i in metadata_copy[date_category].unique()]):
-        metadata_copy['date_delta'] = metadata_copy[date_category].apply(lambda x: '0')
-        gradient_colouring_dict = dict([('0', 'rgb(0, 0, 0)')])
-    # Dates will be given a colour ranging from maroon (most recent) to royal blue (oldest).
-    # If there is only one date all samples will be maroon (rgb(0, 0, 151)). Any empty dates get black (rgb(0, 0, 0)).
-    else:
-        # Get most recent
-        most_recent_date = metadata_copy[date_category].max()
-        # Add date delta column
-        metadata_copy['date_delta'] = metadata_copy[date_category].apply(lambda x: most_recent_date - x)
-        # Convert to days (ints)
-        metadata_copy['date_delta'] = metadata_copy['date_delta'].dt.days
-        # Get max date delta to scale all date deltas between 0 and 1:
-        max_delta = metadata_copy['date_delta'].max()
-        max_delta = max_delta if max_delta != 0 else 1  # Date delta can be 0 if dates are the same empty
-        metadata_copy['date_delta'] = metadata_copy['date_delta'].apply(lambda x: x / max_delta)
-        # Make dict of colours based on the date delta:
-        date_deltas = sorted(metadata_copy['date_delta'].dropna().to_list())
-        colour_gradient = plotly.colors.sample_colorscale('Jet', date_deltas)
-        gradient_colouring_dict = dict(zip(date_deltas, colour_gradient))
-        # Replace NaN with 'no_date' and add to dict to return black:
-        metadata_copy['date_delta'] = metadata_copy['date_delta'].fillna('no_date')
-        gradient_colouring_dict['no_date'] = 'rgb(0, 0, 0)'
+    row_colours = get_date_colours(metadata_df, date_category).to_list()
     # Create the list of colours - the list is as long as the number of nodes in the tree.
     list_of_gradient_colours = [intermediate_node_colour] * int(number_of_nodes)
     # For each row in the metadata field with the index, get the index in text list
-    for df_index, sample_id in enumerate(metadata_copy[id_column]):
+    for df_index, sample_id in enumerate(metadata_df[id_column]):
         for index, node_name in enumerate(node_list):
             if node_name is not None and node_name.startswith(sample_id):
                 # Only colour entries in the metadata that match in the tree
-                list_of_gradient_colours[index] = (gradient_colouring_dict[metadata_copy.loc[df_index, 'date_delta']])
+                list_of_gradient_colours[index] = row_colours[df_index]
     return list_of_gradient_colours
 
 
@@ -435,36 +987,455 @@ def inline_html_images(html_res_path: os.PathLike | str, input_html: str) -> str
     return str(soup)
 
 
-def generate_html(html_res_path: os.PathLike | str, input_fig: go.Figure) -> str:
+def _json_default(obj):
+    """
+    Convert the NumPy types the standard library json module cannot encode into plain Python types.
+    """
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def json_for_script(obj) -> str:
+    """
+    Encode an object (which may contain NumPy arrays) as compact JSON that is safe to place inside a <script> tag.
+    orjson is used if it is installed, otherwise the standard library json module.
+    :param obj: object to encode - dicts, lists, strings, numbers and NumPy arrays/scalars.
+    :return: JSON string, with "</" escaped so the HTML parser cannot close the script early.
+    """
+    if orjson is not None:
+        json_str = orjson.dumps(obj, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    else:
+        json_str = json.dumps(obj, default=_json_default, separators=(',', ':'))
+    return json_str.replace('</', '<\\/')
+
+
+@functools.cache
+def get_plotly_template() -> dict:
+    """
+    Get the default plotly template as a plain dict, so figures built without go.Figure look the same as those that
+    are (go.Figure adds the template to the layout).
+    :return: dict of the default template.
+    """
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+def build_figure_spec(*,
+                      x_nodes: np.ndarray,
+                      y_nodes: np.ndarray,
+                      colourings: list,
+                      hover_text: list,
+                      drop_down_update: list,
+                      graph_title: str) -> dict:
+    """
+    Build the Plotly figure as a plain dict (data and layout), without going through the plotly graph objects and their
+    property validation. Trace 0 is the nodes and trace 1 is the hidden text labels used by main.js. There are no
+    branches in the figure, main.js draws them (from the clade summary) when the report is opened.
+    :param x_nodes: array of node x-coordinates.
+    :param y_nodes: array of node y-coordinates.
+    :param colourings: list of colours for each node.
+    :param hover_text: list of hover text for each node.
+    :param drop_down_update: the updatemenus list, used to change the node colours.
+    :param graph_title: title of the plot.
+    :return: dict with 'data' and 'layout' keys, ready for Plotly.newPlot.
     """
-    Takes in a plotly figure, reads some resources from the html_res directory and generates a static HTML string as
-    output.
-    :param html_res_path: path to the html_res directory.
-    :param input_fig: plotly go figure object.
+    node_trace = dict(type='scattergl',
+                      x=x_nodes,
+                      y=y_nodes,
+                      mode='markers',
+                      marker=dict(color=colourings,
+                                  size=10),
+                      opacity=1.0,
+                      text=hover_text,
+                      hoverinfo='text')
+
+    # Text annotations as a separate trace
+    text_trace = dict(type='scattergl',
+                      x=x_nodes,
+                      y=y_nodes,
+                      mode='text',
+                      text=[f"\t\t\t{x.split('<br>')[0]}" if x else "" for x in hover_text],
+                      textposition='middle right',
+                      visible=False)
+
+    layout = dict(title=dict(text=graph_title, yanchor='top', y=0.95),
+                  font=dict(family='Arial', size=14),
+                  showlegend=False,
+                  autosize=True,
+                  xaxis=dict(showline=True,
+                             zeroline=False,
+                             showgrid=False,
+                             ticklen=4,
+                             showticklabels=True,
+                             title=dict(text='Branch Length')),
+                  yaxis=dict(visible=False),
+                  hovermode='closest',
+                  plot_bgcolor='rgb(250,250,250)',
+                  margin=dict(l=10, t=150),
+                  updatemenus=drop_down_update)  # This adds the drop-down menu to change the node colours.
+
+    return dict(data=[node_trace, text_trace], layout=layout)
+
+
+def get_cache_dir() -> Path:
+    """
+    Get the directory used to cache the static asset bundle. Uses $INTREEACTIVE_CACHE_DIR if set, otherwise
+    $XDG_CACHE_HOME/intreeactive (default ~/.cache/intreeactive).
+    :return: path to the cache directory (it might not exist yet).
+    """
+    if os.environ.get('INTREEACTIVE_CACHE_DIR'):
+        return Path(os.environ['INTREEACTIVE_CACHE_DIR'])
+    return Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache', 'intreeactive')
+
+
+def get_static_assets_fingerprint() -> str:
+    """
+    Fingerprint the files that go into the static asset bundle, with the intreeactive and plotly versions, so a cached
+    bundle is rebuilt if any of them change.
+    :return: hex digest string.
+    """
+    hasher = hashlib.sha1(f'{__version__}|{plotly.__version__}'.encode('utf-8'))
+    resources = [html_res.joinpath(name) for name in STATIC_ASSET_FILES]
+    resources += sorted(html_res.joinpath('help_images').iterdir(), key=lambda resource: resource.name)
+    for resource in resources:
+        hasher.update(resource.name.encode('utf-8'))
+        hasher.update(resource.read_bytes())
+    return hasher.hexdigest()[:16]
+
+
+def build_static_assets() -> dict:
+    """
+    Render the parts of the report that do not change between runs: the favicon, css, help page (with the images
+    inlined), main.js, loader.js and the plotly template.
+    :return: dict of strings (and the template dict), keyed by asset name.
+    """
+    with as_file(html_res) as html_res_path:
+        return dict(favicon=base64.b64encode(Path(html_res_path, 'favicon.png').read_bytes()).decode('utf-8'),
+                    css=Path(html_res_path, 'main.css').read_text(),
+                    help_html=inline_html_images(html_res_path, 'help.html'),
+                    main_js=Path(html_res_path, 'main.js').read_text(),
+                    loader_js=Path(html_res_path, 'loader.js').read_text(),
+                    plotly_template=get_plotly_template())
+
+
+@functools.cache
+def get_static_assets() -> dict:
+    """
+    Get the static asset bundle, building it on first use for this version and caching it on disk (see get_cache_dir)
+    so later runs only need to read one file. If the cache can't be written the bundle is just rebuilt next time.
+    :return: dict of assets from build_static_assets.
+    """
+    cache_path = get_cache_dir() / f'static_assets_{__version__}_{get_static_assets_fingerprint()}.json'
+    try:
+        return json.loads(cache_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        pass
+
+    assets = build_static_assets()
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and move it into place, so reports generated in parallel never read a partial bundle
+        temp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+        temp_path.write_text(json.dumps(assets), encoding='utf-8')
+        os.replace(temp_path, cache_path)
+    except OSError as error:
+        print(f'Could not cache static assets in {cache_path.parent}: {error}', file=sys.stderr)
+    return assets
+
+
+def figure_spec_to_json(figure_spec: dict) -> str:
+    """
+    Encode a figure spec from build_figure_spec as JSON, adding the plotly template to the layout.
+    :param figure_spec: dict with 'data' and 'layout' keys.
+    :return: JSON string of the figure.
+    """
+    layout = dict(figure_spec['layout'], template=get_static_assets()['plotly_template'])
+    return json_for_script(dict(data=figure_spec['data'], layout=layout))
+
+
+def figure_spec_to_html(figure_spec: dict, default_height: int = 900) -> str:
+    """
+    Write a figure spec from build_figure_spec into the same div structure as go.Figure.to_html(full_html=False), so
+    main.js finds the plot the same way.
+    :param figure_spec: dict with 'data' and 'layout' keys.
+    :param default_height: height of the plot in pixels.
     :return: string of html.
     """
-    return_html = f"""<!DOCTYPE html>
+    div_id = str(uuid.uuid4())
+    return f"""<div style="height:{default_height}px; width:100%;">
+            <script>window.PlotlyConfig = {{MathJaxConfig: 'local'}};</script>
+            <script>{get_plotlyjs()}</script>
+            <div id="{div_id}" class="plotly-graph-div" style="height:100%; width:100%;"></div>
+            <script>performance.mark("plot start")</script>
+            <script>
+                window.PLOTLYENV = window.PLOTLYENV || {{}};
+                if (document.getElementById("{div_id}")) {{
+                    const figure = {figure_spec_to_json(figure_spec)};
+                    Plotly.newPlot("{div_id}", figure.data, figure.layout, {{"responsive": true}})
+                        .then(() => performance.measure("plot", "plot start"))
+                }};
+            </script>
+        </div>"""
+
+
+def compress_payload(payload: str) -> str:
+    """
+    Gzip a text payload and base64 encode it, so it can be embedded in the html and unpacked by loader.js.
+    :param payload: text to compress, for example a JSON string.
+    :return: base64 string of the gzipped text.
+    """
+    # mtime=0 so the same input always gives the same report
+    return base64.b64encode(gzip.compress(payload.encode('utf-8'), compresslevel=6, mtime=0)).decode('ascii')
+
+
+def iter_compressed_payloads(payloads: dict[str, str]) -> Iterator[str]:
+    """
+    Generate the script tags that hold compressed payloads for loader.js.
+    :param payloads: dict of payload name to its text.
+    :return: iterator of html strings.
+    """
+    for name, payload in payloads.items():
+        yield f'<script type="application/octet-stream" class="intreeactivePayload" data-name="{name}">'
+        yield compress_payload(_resolve(payload))
+        yield '</script>\n'
+
+
+def get_smallest_dtype(values: np.ndarray) -> str:
+    """
+    Get the smallest dtype that holds the values exactly - an unsigned integer type if they are all whole numbers that
+    are not negative (like SNP distances), else float64.
+    :param values: array of numbers.
+    :return: dtype name, one of uint8, uint16, uint32 or float64 (these have matching typed arrays in loader.js).
+    """
+    if values.size and np.all(np.isfinite(values)) and np.all(values >= 0) and np.all(np.mod(values, 1) == 0):
+        for dtype in ['uint8', 'uint16', 'uint32']:
+            if values.max() <= np.iinfo(dtype).max:
+                return dtype
+    return 'float64'
+
+
+def write_shared_plotlyjs(output_dir: str | os.PathLike) -> str:
+    """
+    Write the plotly library into the output directory, named by its version, so every split asset report in the
+    directory shares one copy. It is only written if it is not already there.
+    :param output_dir: directory the reports are written to.
+    :return: file name of the plotly library, relative to the output directory.
+    """
+    plotlyjs_name = f'plotly-{get_plotlyjs_version()}.min.js'
+    plotlyjs_path = Path(output_dir, plotlyjs_name)
+    if not plotlyjs_path.exists():
+        plotlyjs_path.write_text(get_plotlyjs(), encoding='utf-8')
+    return plotlyjs_name
+
+
+def write_split_assets(*,
+                       output_name: str | os.PathLike,
+                       figure_spec: go.Figure | dict,
+                       data_payloads: dict[str, str],
+                       snp_distance_matrix: pd.DataFrame) -> dict:
+    """
+    Write the data for a split asset report as files next to the html: a shared plotly library, and a
+    <output>_data directory with the node coordinates and SNP distances as binary arrays, and the figure and other
+    datasets as JSON. The html then only needs a manifest of these files, which loader.js fetches.
+    :param output_name: path of the html report.
+    :param figure_spec: dict with 'data' and 'layout' keys, from build_figure_spec, or a plotly go.Figure.
+    :param data_payloads: dict of global variable name to the JSON string of its value (except inputSnpMatrix).
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances.
+    :return: manifest dict of the files, with paths relative to the html report.
+    """
+    if isinstance(figure_spec, go.Figure):
+        # to_plotly_json encodes arrays, so the coordinates are taken from the trace itself
+        node_x, node_y = figure_spec.data[0].x, figure_spec.data[0].y
+        figure_spec = figure_spec.to_plotly_json()
+    else:
+        node_x, node_y = figure_spec['data'][0]['x'], figure_spec['data'][0]['y']
+    output_path = Path(output_name)
+    data_dir = output_path.parent / f'{output_path.stem}_data'
+    data_dir.mkdir(exist_ok=True)
+    # Paths in the manifest are relative URLs
+    data_dir_name = urllib.parse.quote(data_dir.name)
+
+    manifest = dict(plotlyjs=write_shared_plotlyjs(output_path.parent), json={})
+
+    # Coordinates are all x coordinates followed by all y coordinates, both traces are at the same positions.
+    coordinates = np.concatenate([np.asarray(node_x, dtype='<f8'), np.asarray(node_y, dtype='<f8')])
+    coordinates.tofile(data_dir / 'coordinates.bin')
+    manifest['coordinates'] = dict(values=f'{data_dir_name}/coordinates.bin', dtype='float64')
+
+    # The figure without coordinates, as loader.js puts them back in
+    figure_without_coordinates = dict(figure_spec, data=[dict(trace, x=None, y=None) for trace in figure_spec['data']])
+    json_payloads = dict(figure=figure_spec_to_json(figure_without_coordinates), **data_payloads)
+    for name, payload in json_payloads.items():
+        Path(data_dir, f'{name}.json').write_text(payload, encoding='utf-8')
+        manifest['json'][name] = f'{data_dir_name}/{urllib.parse.quote(name)}.json'
+
+    # The SNP distances as one flat array, row by row, with the sample IDs (the row and column order) separately.
+    matrix_values = snp_distance_matrix.to_numpy()
+    matrix_dtype = get_smallest_dtype(matrix_values)
+    matrix_values.astype(np.dtype(matrix_dtype).newbyteorder('<')).tofile(data_dir / 'matrix.bin')
+    Path(data_dir, 'matrix_index.json').write_text(json_for_script(list(map(str, snp_distance_matrix.index))),
+                                                    encoding='utf-8')
+    manifest['matrix'] = dict(values=f'{data_dir_name}/matrix.bin',
+                              index=f'{data_dir_name}/matrix_index.json',
+                              dtype=matrix_dtype)
+    return manifest
+
+
+def get_snp_matrix_json(snp_distance_matrix: pd.DataFrame) -> str:
+    """
+    Serialise the SNP distance matrix for main.js, as {"index": [sample IDs], "data": [rows]}. The columns are in the
+    same order as the rows, so are not written.
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances.
+    :return: JSON string.
+    """
+    # basket case to make sure we have normal jsonable types instead of weird numpy types
+    matrix_json = json.loads(snp_distance_matrix.to_json(orient="split"))
+    del matrix_json["columns"]
+
+    # Technically we only need ~half the data because snp_dist(A,B) == snp_dist(B,A) but we're keeping all of it for now
+    return json_for_script(matrix_json)
+
+
+def encode_column(values: pd.Series) -> dict:
+    """
+    Encode a column of values for main.js. A column with many repeated values is dictionary encoded, as
+    {"values": [each value once], "codes": [index into values for each row]}, otherwise it is {"data": [values]}.
+    Missing values are null.
+    """
+    codes, uniques = pd.factorize(values)
+    if len(uniques) <= len(values) // 2:
+        return dict(values=uniques.to_list(), codes=codes)
+    return dict(data=values.astype(object).where(values.notna(), None).to_list())
+
+
+def get_metadata_json(metadata: pd.DataFrame, id_column: str = 'ID') -> str:
+    """
+    Serialise the metadata for main.js by column, which is much smaller (and quicker to parse) than an object per
+    sample:
+    {"ids": [sample IDs], "fields": [column names], "columns": {column name: encoded column (see encode_column)},
+     "neighbours": {"field": "Nearest_neighbour", "offsets": [...], "ids": encoded IDs, "snps": [...]}}
+    The nearest neighbours of sample i are ids and snps from offsets[i] to offsets[i + 1]. The ID column is "ids", so
+    is not in "columns".
+    :param metadata: Pandas dataframe of metadata, with the Nearest_neighbour column added.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :return: JSON string.
+    """
+    duplicated = metadata[id_column].duplicated()
+    if duplicated.any():
+        sys.exit(f"Error: \n Metadata IDs must be unique, check {metadata[id_column][duplicated].unique().tolist()} "
+                 f"only occur once in the metadata. \n Exiting...")
+
+    # "<ID>=<distance>" joined by "<br>" (see get_all_nearest_neighbours), or "" if there are none
+    neighbour_lists = metadata["Nearest_neighbour"].str.split("<br>")
+    neighbour_counts = neighbour_lists.map(lambda x: len(x) if x != [""] else 0).to_numpy()
+    neighbour_pairs = neighbour_lists.explode()
+    neighbour_pairs = neighbour_pairs[neighbour_pairs != ""].str.rsplit("=", n=1, expand=True).reindex(columns=[0, 1])
+
+    columns = [column for column in metadata.columns if column not in [id_column, "Nearest_neighbour"]]
+    return json_for_script(dict(
+        ids=metadata[id_column].to_list(),
+        fields=metadata.columns.to_list(),
+        idField=id_column,
+        columns={column: encode_column(metadata[column]) for column in columns},
+        neighbours=dict(field="Nearest_neighbour",
+                        offsets=np.concatenate([[0], np.cumsum(neighbour_counts)]),
+                        ids=encode_column(neighbour_pairs[0].reset_index(drop=True)),
+                        snps=pd.to_numeric(neighbour_pairs[1]).to_numpy())))
+
+
+def _resolve(value):
+    """
+    Wait for and return the result of value if it is still being worked out in the background (a Future), else return
+    value as it is.
+    """
+    return value.result() if isinstance(value, concurrent.futures.Future) else value
+
+
+def iter_html(input_fig: go.Figure | dict | None,
+              data_payloads: dict[str, str],
+              *,
+              compress: bool = False,
+              sidecar_manifest: dict = None) -> Iterator[str]:
+    """
+    Generate the static HTML report in pieces, so it can be streamed to a file without joining it into one string.
+    The static assets come from the cached bundle (see get_static_assets).
+    :param input_fig: plotly go figure object, or a figure spec dict from build_figure_spec. Not used for split asset
+        reports. This and the data_payloads values can also be Futures, which are waited for when they are needed, so
+        the start of the report can be written while they are worked out.
+    :param data_payloads: dict of global variable name (e.g. "inputMetadata") to the JSON string of its value. These
+        are the datasets used by main.js.
+    :param compress: if True, the plotly library, figure and datasets are gzipped and unpacked in the browser by
+        loader.js, which makes the file much smaller (default = False).
+    :param sidecar_manifest: for split asset reports, the manifest from write_split_assets. The plot and datasets are
+        then loaded from those files by loader.js (default = None).
+    :return: iterator of html strings.
+    """
+    assets = get_static_assets()
+    # Compressed and split asset reports draw the plot and run main.js from loader.js, once the data is loaded
+    use_loader = compress or sidecar_manifest is not None
+
+    yield f"""<!DOCTYPE html>
 <html lang="en">
     <head>
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <meta charset="UTF-8"/>
         <title>Intreeactive report (generated: {datetime.datetime.now()})</title>
-        <link rel="icon" href="data:image/png;base64,{base64.encodebytes(Path(html_res_path, 'favicon.png').read_bytes()).decode('utf-8')}" />
+        <link rel="icon" href="data:image/png;base64,{assets['favicon']}" />
         <style>
-            {Path(html_res_path, 'main.css').read_text()}
+            """
+    yield assets['css']
+    yield """
         </style>
+"""
+    if sidecar_manifest is not None:
+        yield f"""        <script>window.PlotlyConfig = {{MathJaxConfig: 'local'}};</script>
+        <script src="{sidecar_manifest['plotlyjs']}"></script>
+        <script type="application/json" id="intreeactiveManifest">{json_for_script(sidecar_manifest)}</script>
+"""
+    elif compress:
+        yield from iter_compressed_payloads(data_payloads)
+    else:
+        # The datasets are timed from before their script is parsed to after it has run, for the debug panel in main.js
+        yield """        <script>performance.mark("data start")</script>
+        <script>
+"""
+        payload_sizes = {}
+        for name, payload in data_payloads.items():
+            payload = _resolve(payload)
+            payload_sizes[name] = len(payload)
+            yield f"const {name} = "
+            yield payload
+            yield "\n\n"
+        yield f"""        </script>
         <script>
-            {Path(html_res_path, 'tempmetadata.js').read_text()}
+            performance.measure("data parse", "data start")
+            var payloadSizes = {json_for_script(dict(compressed=False, sizes=payload_sizes))}
         </script>
-    </head>
+"""
+    yield """    </head>
     <body>
         <div id="leftPanel">
-                {
-    input_fig.to_html(
-        full_html=False,
-        default_height=900,
-    )
-    }
+                """
+    input_fig = _resolve(input_fig)
+    if use_loader:
+        # An empty plot, loader.js draws the figure into it
+        yield f"""<div style="height:900px; width:100%;">
+            <div id="loadingMessage">Loading...</div>
+            <div id="{uuid.uuid4()}" class="plotly-graph-div" style="height:100%; width:100%;"></div>
+        </div>
+"""
+        if compress:
+            figure_json = figure_spec_to_json(input_fig) if isinstance(input_fig, dict) else input_fig.to_json()
+            yield """        <script>window.PlotlyConfig = {MathJaxConfig: 'local'};</script>
+"""
+            yield from iter_compressed_payloads({'plotlyJs': get_plotlyjs(), 'figure': figure_json})
+    elif isinstance(input_fig, dict):
+        yield figure_spec_to_html(input_fig)
+    else:
+        yield input_fig.to_html(full_html=False, default_height=900)
+    yield """
         </div>
         <div id="rightPanel">
             <div id="ashleyDiv" class="fancyDiv">
@@ -472,7 +1443,7 @@ def generate_html(html_res_path: os.PathLike | str, input_fig: go.Figure) -> str
                     <tr>
                         <td>Highlight by ID</td>
                         <td>
-                            <input type="text" id="highlightInput" oninput="doHighlight(this.value)"></input>
+                            <input type="text" id="highlightInput" oninput="onHighlightInput(this.value)"></input>
                             <button onclick="restoreOriginalColours(); highlightInputElm.value = ''">Clear</button>
                         </td>
                     </tr>
@@ -520,71 +1491,60 @@ def generate_html(html_res_path: os.PathLike | str, input_fig: go.Figure) -> str
             </div>
         </div>
         <div id="helpModal" class="hidden">
-            {inline_html_images(html_res_path, 'help.html')}
+            """
+    yield assets['help_html']
+    yield """
         </div>
     </body>
-    <script>
-        {Path(html_res_path, 'main.js').read_text()}
+"""
+    if use_loader:
+        # main.js is run by loader.js once everything is loaded
+        yield '    <script type="text/plain" id="mainScript">\n'
+        yield assets['main_js']
+        yield '\n    </script>\n    <script>\n'
+        yield assets['loader_js']
+        yield '\n    </script>\n</html>'
+    else:
+        yield """    <script>
+        """
+        yield assets['main_js']
+        yield """
     </script>
 </html>"""
 
-    return return_html
-
 
-def write_interactive_tree(*,
-                           tree,
-                           output_name: str | os.PathLike,
-                           metadata: pd.DataFrame,
-                           id_column: str = 'ID',
-                           snp_distance_matrix: pd.DataFrame,
-                           title: str = None) -> None:
+def generate_html(input_fig: go.Figure | dict, data_payloads: dict[str, str], *, compress: bool = False) -> str:
     """
-    Create an interactive phylogeny (html) file for a given phylogeny file.
-    :param tree: Bio Phylo Tree object.
-    :param output_name: A file name for or path and file name for the output (str). Do not add file format suffix.
-    :param metadata: Pandas dataframe of metadata. Each column will be read in as hover text for the tree
-        (pandas df)
-    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
-    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances. Column order must match row
-        order (pandas df)
-    :param title: string, title of the plot.
-    :return: None, but html files are created
+    Takes in a plotly figure and the datasets for main.js, and generates a static HTML string as output.
+    :param input_fig: plotly go figure object, or a figure spec dict from build_figure_spec.
+    :param data_payloads: dict of global variable name (e.g. "inputMetadata") to the JSON string of its value.
+    :param compress: if True, gzip the plotly library, figure and datasets (default = False).
+    :return: string of html.
     """
-    ##################
-    # Set up:
-    print(f'Creating Tree \'{title}\'... \n Number of leaves: {len(list(tree.get_terminals()))}')
+    return "".join(iter_html(input_fig, data_payloads, compress=compress))
 
-    # Add nearest neighbours to the metadata dataframe
-    metadata["Nearest_neighbour"] = metadata[id_column].apply(
-        lambda x: get_nearest_neighbours(snp_distance_matrix, x))
 
+def get_tree_layout(tree) -> tuple[list, list, list, dict]:
+    """
+    Lay out the tree for plotting. The branches are not drawn here: main.js draws them from the node coordinates and
+    the parent of each node (in the clade summary).
+    :param tree: Bio Phylo Tree object.
+    :return: tuple of the x-coordinates, y-coordinates and names of the nodes (in depth first order), and the clade
+        summary (see get_clade_summary).
+    """
     ###########
-    # 1. Get x and y coordinated for the tree
+    # 1. Get x and y coordinated for the tree, rounded so they are shorter to write (see quantize_coordinates)
     tree_x_coords = get_x_coordinates(tree)
     tree_y_coords = get_y_coordinates(tree)
+    tree_x_coords = dict(zip(tree_x_coords.keys(), quantize_coordinates(list(tree_x_coords.values())).tolist()))
+    tree_y_coords = dict(zip(tree_y_coords.keys(), quantize_coordinates(list(tree_y_coords.values())).tolist()))
 
     ###########
-    # 2. Draw tree line shapes by iteratively moving through the branches starting at the tree root.
-    # Set the line shapes for each node and leaf in the tree, ready for Plotly to plot:
-    tree_line_shapes = []
-
-    draw_clade(clade=tree.root,
-               x_coords=tree_x_coords,
-               y_coords=tree_y_coords,
-               line_shapes=tree_line_shapes,
-               line_colour='rgb(25,25,25)',
-               line_width=1)
-
-    # Combine all the shapes into one SVG path
-    svg_path = []
-    for record_dict in tree_line_shapes:
-        svg_path.append(
-            f"M {record_dict['x0']} {record_dict['y0']} L {record_dict['x1']} {record_dict['y1']}")
-    svg_path = " ".join(svg_path)
+    # 2. Summarise the clades, for drawing the branches (and level-of-detail drawing of large trees) in the browser
+    clade_summary = get_clade_summary(tree_x_coords, tree_y_coords)
 
     ###########
-    # 3. Create the text for the hover text
-    # Get the node coordinates:
+    # 3. Get the node coordinates:
     my_tree_clades = tree_x_coords.keys()
     x_nodes = []  # list of nodes x-coordinates
     y_nodes = []  # list of nodes y-coordinates
@@ -595,11 +1555,16 @@ def write_interactive_tree(*,
         y_nodes.append(tree_y_coords[clade])
         node_list.append(clade.name)
 
-    hover_text = make_hover_text(metadata, id_column, node_list)
+    return x_nodes, y_nodes, node_list, clade_summary
 
-    ###########
-    # 4. Set colours for the nodes - select a suitable column from the metadata:
-    # get the default category to colour on first:
+
+def get_colour_categories(metadata: pd.DataFrame) -> tuple[str, list[str]]:
+    """
+    Choose the metadata columns the nodes can be coloured by: date columns (coloured in a gradient) and columns with 48
+    or fewer unique values.
+    :param metadata: Pandas dataframe of metadata.
+    :return: tuple of the column to colour by when the report is opened, and the columns for the colour drop-down.
+    """
     count = 1
     default_category = ""
     while count <= len(metadata.columns.values):
@@ -609,25 +1574,356 @@ def write_interactive_tree(*,
         else:
             count += 1
 
-    colourings = get_colourings(metadata_df=metadata,
-                                id_column=id_column,
-                                category=default_category,
-                                number_of_nodes=len(x_nodes),
-                                node_list=node_list)
+    colour_categories = [category for category in metadata.columns.values
+                         if "date" in category.lower() or len(set(metadata[category])) <= 48]
+    return default_category, colour_categories
+
+
+def get_graph_title(tree, title: str = None) -> str:
+    """
+    :param tree: Bio Phylo Tree object or CompactTree.
+    :param title: string, title of the plot.
+    :return: the title with the number of leaves, or a dated default title if there is none.
+    """
+    if title:
+        return f'{title}; (n={len(get_leaf_names(tree))})'
+    return f"Interactive Tree - {datetime.datetime.now()}"
+
+
+def get_row_colourings(metadata: pd.DataFrame, id_column: str = 'ID', *,
+                       row_colourings: Optional[pd.DataFrame] = None) -> tuple[str, pd.DataFrame]:
+    """
+    Get the colour of each metadata row for each of the colour drop-down options. The colours are the same as those of
+    the figure (see get_category_colours and get_date_colours).
+    :param metadata: Pandas dataframe of metadata.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :param row_colourings: colours already worked out for these metadata rows, for example read from artefacts. They
+        are used for the colour options they have, and the rest are worked out. (pandas df, default = None)
+    :return: tuple of the column coloured by when the report is opened, and a dataframe of colours with a column for
+        each colour option, in the order of the metadata rows.
+    """
+    default_category, colour_categories = get_colour_categories(metadata)
+    if row_colourings is None or len(row_colourings) != len(metadata):
+        row_colourings = pd.DataFrame()
+    # Each row is coloured by its own values, so there is no need to match the rows to nodes
+    colourings = {category: row_colourings[category].to_numpy() if category in row_colourings else
+                  (get_date_colours if "date" in category.lower() else get_category_colours)(metadata,
+                                                                                            category).to_numpy()
+                  for category in colour_categories}
+    return default_category, pd.DataFrame(colourings, columns=colour_categories)
+
+
+def get_row_colourings_json(metadata: pd.DataFrame, id_column: str = 'ID', *,
+                            row_colourings: Optional[pd.DataFrame] = None) -> str:
+    """
+    Serialise the row colours from get_row_colourings, for main.js to colour the other trees in a report with more
+    than one tree (see get_tree_view):
+    {"default": column coloured by when the report is opened, "categories": {column: encoded colours (see
+     encode_column)}}
+    :param metadata: Pandas dataframe of metadata, with the Nearest_neighbour column added.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :param row_colourings: colours already worked out, see get_row_colourings. (pandas df, default = None)
+    :return: JSON string.
+    """
+    default_category, row_colourings = get_row_colourings(metadata, id_column, row_colourings=row_colourings)
+    return json_for_script(dict(default=default_category,
+                                categories={category: encode_column(row_colourings[category].reset_index(drop=True))
+                                            for category in row_colourings.columns}))
+
+
+def get_facets_json(metadata: pd.DataFrame, id_column: str = 'ID') -> str:
+    """
+    Index the metadata columns the report can be filtered by (the colour drop-down columns, except dates) with a
+    bitset for each value, where bit i is set if metadata row i has that value. main.js combines the bitsets of the
+    chosen values to filter the nodes, a word of 32 rows at a time:
+    {"words": number of 32 bit words in each bitset,
+     "columns": {column: {"values": [each value once], "bitsets": base64 of the bitsets of each value in turn, as
+      little-endian uint32}}}
+    Missing values are not in any bitset.
+    :param metadata: Pandas dataframe of metadata, with the Nearest_neighbour column added.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :return: JSON string.
+    """
+    _, colour_categories = get_colour_categories(metadata)
+    n_words = (len(metadata) + 31) // 32
+    columns = {}
+    for column in colour_categories:
+        if column in [id_column, "Nearest_neighbour"] or "date" in column.lower():
+            continue
+        codes, uniques = pd.factorize(metadata[column])
+        # A row of bits for each value, padded to whole words
+        bits = np.packbits(codes[None, :] == np.arange(len(uniques))[:, None], axis=1, bitorder='little')
+        bits = np.pad(bits, ((0, 0), (0, n_words * 4 - bits.shape[1])))
+        columns[column] = dict(values=uniques.to_list(), bitsets=base64.b64encode(bits.tobytes()).decode('ascii'))
+    return json_for_script(dict(words=n_words, columns=columns))
+
+
+def get_dates_json(metadata: pd.DataFrame) -> str:
+    """
+    Index the date columns (those with "date" in the name, parsed as get_continuous_colourings does) for the date range
+    filter in main.js, which finds the rows in a range by binary search:
+    {"columns": {column: {"days": base64 of the day number (days since 1970-01-01) of each metadata row, as
+      little-endian int32, "order": base64 of the rows with a date, sorted by date, as little-endian uint32}}}
+    Rows with no date have the smallest int32 as their day number, and are not in "order". Columns with no dates are
+    left out.
+    :param metadata: Pandas dataframe of metadata.
+    :return: JSON string.
+    """
+    columns = {}
+    for column in metadata.columns:
+        if "date" not in column.lower():
+            continue
+        dates = pd.to_datetime(metadata[column], errors='coerce', format='mixed', yearfirst=True, dayfirst=True)
+        if dates.isna().all():
+            continue
+        days = (dates - pd.Timestamp('1970-01-01')).dt.days.fillna(np.iinfo(np.int32).min).to_numpy(dtype='<i4')
+        order = np.flatnonzero(dates.notna().to_numpy())
+        order = order[np.argsort(days[order], kind='stable')].astype('<u4')
+        columns[column] = dict(days=base64.b64encode(days.tobytes()).decode('ascii'),
+                               order=base64.b64encode(order.tobytes()).decode('ascii'))
+    return json_for_script(dict(columns=columns))
+
+
+def get_tree_view(tree, *, metadata_index: dict[str, int], title: str = None) -> dict:
+    """
+    Lay out one of the other trees in a report with more than one tree. Only the layout is kept; the hover text and
+    colours are made in the browser from the metadata and colour datasets shared by all the trees, found by the index
+    of each node's metadata row.
+    :param tree: Bio Phylo Tree object or CompactTree.
+    :param metadata_index: dict of sample ID: row number in the metadata dataset (see get_metadata_json).
+    :param title: string, title of the plot.
+    :return: dict with the plot title, node coordinates, metadata row of each node ("rows", -1 if it has none), names
+        of named nodes without metadata ("labels", by node number) and clade summary.
+    """
+    if isinstance(tree, CompactTree):
+        x_nodes, y_nodes, node_list, clade_summary = tree.get_layout()
+    else:
+        x_nodes, y_nodes, node_list, clade_summary = get_tree_layout(tree)
+
+    rows = np.array([metadata_index.get(name, -1) for name in node_list], dtype=np.int32)
+    labels = {str(index): name for index, name in enumerate(node_list) if name is not None and rows[index] < 0}
+    return dict(title=get_graph_title(tree, title),
+                x=np.asarray(x_nodes, dtype=float),
+                y=np.asarray(y_nodes, dtype=float),
+                rows=rows,
+                labels=labels,
+                cladeSummary=clade_summary)
+
+
+def get_minimum_spanning_network(snp_distances: pd.DataFrame, max_snps: float, *,
+                                 sample_ids: list[str] = None) -> pd.DataFrame:
+    """
+    Get the minimum spanning network of the samples by SNP distance, only joining samples within max_snps of each
+    other (see neighbours.get_minimum_spanning_edges). This never makes more than one row of the matrix at a time, so
+    works for matrices that would be too big to copy.
+    :param snp_distances: Pandas dataframe, snp distance matrix. Column order must match row order.
+    :param max_snps: the largest SNP distance joined.
+    :param sample_ids: the samples to include, in order. (list, default = None, all the samples in the matrix)
+    :return: Pandas dataframe with source, target and snps columns, in the order the edges were added.
+    """
+    sample_ids = snp_distances.index.to_list() if sample_ids is None else list(sample_ids)
+    sources, targets, distances = neighbours.get_minimum_spanning_edges(
+        snp_distances.to_numpy(), max_snps, samples=snp_distances.index.get_indexer(sample_ids))
+    sample_ids = np.asarray(sample_ids, dtype=object)
+    return pd.DataFrame({'source': sample_ids[sources],
+                         'target': sample_ids[targets],
+                         'snps': distances.astype(np.int64)})
+
+
+def get_snp_clusters(snp_distances: pd.DataFrame, max_snps: float) -> pd.Series:
+    """
+    Cluster the samples by SNP distance with single linkage: samples are in the same cluster if there is a chain of
+    samples between them, each within max_snps of the next. These are the parts of the minimum spanning network.
+    :param snp_distances: Pandas dataframe, snp distance matrix. Column order must match row order.
+    :param max_snps: the largest SNP distance linking two samples.
+    :return: Pandas series of sample ID: cluster number, with the clusters numbered in the order of their first sample
+        in the matrix.
+    """
+    sources, targets, _ = neighbours.get_minimum_spanning_edges(snp_distances.to_numpy(), max_snps)
+    # The network has no loops, so each edge joins two clusters; the cluster is named by its first sample
+    first_sample = np.arange(len(snp_distances))
 
+    def find(sample: int) -> int:
+        while first_sample[sample] != sample:
+            first_sample[sample] = first_sample[first_sample[sample]]
+            sample = first_sample[sample]
+        return sample
+
+    for source, target in zip(sources.tolist(), targets.tolist()):
+        source, target = find(source), find(target)
+        first_sample[max(source, target)] = min(source, target)
+    roots = np.array([find(sample) for sample in range(len(snp_distances))], dtype=np.intp)
+    return pd.Series(pd.factorize(roots)[0], index=snp_distances.index)
+
+
+def get_network_layout(n_nodes: int, sources: np.ndarray, targets: np.ndarray,
+                       lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lay out a network with no loops (like a minimum spanning network) with the equal angle algorithm: each part of the
+    network is spread out from its best connected node, giving each branch an angle in proportion to the number of
+    leaves past it, so branches never cross. The parts are then packed in rows, largest first.
+    :param n_nodes: number of nodes.
+    :param sources: source node of each edge.
+    :param targets: target node of each edge.
+    :param lengths: length of each edge.
+    :return: tuple of x and y coordinates of each node.
+    """
+    neighbour_lists = [[] for _ in range(n_nodes)]
+    for source, target, length in zip(sources.tolist(), targets.tolist(), lengths.tolist()):
+        neighbour_lists[source].append((target, length))
+        neighbour_lists[target].append((source, length))
+    degrees = np.array([len(node_neighbours) for node_neighbours in neighbour_lists])
+
+    # Find the parts of the network, each in breadth-first order from its best connected node (the first, if tied)
+    part_of_node = np.full(n_nodes, -1)
+    parts = []
+    for start in np.argsort(-degrees, kind='stable').tolist():
+        if part_of_node[start] >= 0:
+            continue
+        part_of_node[start] = len(parts)
+        order = [start]
+        for node in order:
+            for neighbour, _ in neighbour_lists[node]:
+                if part_of_node[neighbour] < 0:
+                    part_of_node[neighbour] = len(parts)
+                    order.append(neighbour)
+        parts.append(order)
+
+    x = np.zeros(n_nodes)
+    y = np.zeros(n_nodes)
+    parent = np.full(n_nodes, -1)
+    leaves = np.zeros(n_nodes)
+    angle_start = np.zeros(n_nodes)
+    angle_width = np.zeros(n_nodes)
+    part_sizes = []
+    for order in parts:
+        root = order[0]
+        parent[root] = root
+        # Each node's children are its neighbours not seen before it in breadth-first order
+        children = {node: [] for node in order}
+        for node in order:
+            for neighbour, length in neighbour_lists[node]:
+                if parent[neighbour] < 0:
+                    parent[neighbour] = node
+                    children[node].append((neighbour, length))
+        for node in reversed(order):
+            leaves[node] = sum(leaves[child] for child, _ in children[node]) or 1
+
+        # Each node shares its wedge of angles out to its children, in proportion to their leaves
+        angle_start[root], angle_width[root] = 0, 2 * np.pi
+        for node in order:
+            child_start = angle_start[node]
+            for child, length in children[node]:
+                angle_start[child] = child_start
+                angle_width[child] = angle_width[node] * leaves[child] / leaves[node]
+                angle = child_start + angle_width[child] / 2
+                x[child] = x[node] + length * np.cos(angle)
+                y[child] = y[node] + length * np.sin(angle)
+                child_start += angle_width[child]
+        part_x, part_y = x[order], y[order]
+        x[order] -= part_x.min()
+        y[order] -= part_y.min()
+        part_sizes.append((part_x.max() - part_x.min(), part_y.max() - part_y.min()))
+
+    # Pack the parts in rows of about the same width as the total height, largest (most nodes) first
+    gap = 1
+    row_width = max([np.sqrt(sum((width + gap) * (height + gap) for width, height in part_sizes))] +
+                    [width for width, _ in part_sizes])
+    left = top = row_height = 0
+    for order, (width, height) in sorted(zip(parts, part_sizes), key=lambda part: -len(part[0])):
+        if left and left + width > row_width:
+            left, top, row_height = 0, top - row_height - gap, 0
+        x[order] += left
+        y[order] = top - y[order]
+        left += width + gap
+        row_height = max(row_height, height)
+    return x, y
+
+
+def get_network_view(snp_distance_matrix: pd.DataFrame, *, metadata_index: dict[str, int], max_snps: float) -> dict:
+    """
+    Lay out the minimum spanning network of the samples in the report, for main.js to draw next to the tree. As with
+    get_tree_view, the hover text and colours are made in the browser from the metadata and colour datasets.
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances.
+    :param metadata_index: dict of sample ID: row number in the metadata dataset (see get_metadata_json).
+    :param max_snps: the largest SNP distance joined.
+    :return: dict with the node coordinates, metadata row of each node ("rows"), the nodes and SNP distance of each
+        edge ("sources", "targets", "snps") and max_snps ("maxSnps").
+    """
+    sample_ids = sorted(set(snp_distance_matrix.index) & set(metadata_index), key=metadata_index.get)
+    network = get_minimum_spanning_network(snp_distance_matrix, max_snps, sample_ids=sample_ids)
+    node_index = {sample_id: index for index, sample_id in enumerate(sample_ids)}
+    sources = network['source'].map(node_index).to_numpy(dtype=np.int32)
+    targets = network['target'].map(node_index).to_numpy(dtype=np.int32)
+    snps = network['snps'].to_numpy()
+    # Samples the same distance apart are drawn the same distance apart, but identical samples are drawn half a SNP
+    # apart so they don't hide each other
+    x, y = get_network_layout(len(sample_ids), sources, targets, np.maximum(snps, 0.5))
+    return dict(x=quantize_coordinates(x),
+                y=quantize_coordinates(y),
+                rows=np.array([metadata_index[sample_id] for sample_id in sample_ids], dtype=np.int32),
+                sources=sources,
+                targets=targets,
+                snps=snps,
+                maxSnps=max_snps)
+
+
+def build_tree_figure(*,
+                      tree,
+                      metadata: pd.DataFrame,
+                      id_column: str = 'ID',
+                      title: str = None,
+                      renderer: Literal["fast", "plotly"] = "fast",
+                      row_colourings: Optional[pd.DataFrame] = None) -> tuple[go.Figure | dict, dict]:
+    """
+    Lay out the tree and build the plotly figure, with hover text and colour options from the metadata.
+    :param tree: Bio Phylo Tree object or CompactTree.
+    :param metadata: Pandas dataframe of metadata, with the Nearest_neighbour column added. It is not changed.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :param title: string, title of the plot.
+    :param renderer: "fast" returns the figure spec dict, "plotly" a plotly go.Figure. (str, default = "fast")
+    :param row_colourings: the colours of each metadata row from get_row_colourings, if they have already been worked
+        out. Each node then takes the colours of the row with its name. (pandas df, default = None)
+    :return: tuple of the figure and the clade summary (see get_clade_summary).
+    """
     ###########
-    # 5. Create traces for plotly plot - These are the nodes.
-    trace = go.Scattergl(x=x_nodes,
-                         y=y_nodes,
-                         mode='markers',
-                         marker=dict(color=colourings,
-                                     size=10),
-                         opacity=1.0,
-                         text=hover_text,
-                         hoverinfo='text')
+    # 1 - 3. Lay out the tree: the node coordinates and the clade summary, which main.js draws the branches from
+    if isinstance(tree, CompactTree):
+        x_nodes, y_nodes, node_list, clade_summary = tree.get_layout()
+    else:
+        x_nodes, y_nodes, node_list, clade_summary = get_tree_layout(tree)
+
+    # Create the text for the hover text
+    hover_text = make_hover_text(metadata, id_column, node_list)
 
     ###########
-    # 6. Create the drop-down functionality
+    # 4. Set colours for the nodes - select a suitable column from the metadata:
+    # get the default category to colour on first:
+    default_category, colour_categories = get_colour_categories(metadata)
+
+    if row_colourings is None:
+        def get_node_colourings(category: str, *, gradient: bool) -> list:
+            get_category_colourings = get_continuous_colourings if gradient else get_colourings
+            return get_category_colourings(metadata, id_column, category,
+                                           number_of_nodes=len(x_nodes), node_list=node_list)
+    else:
+        # Each node takes the colours of the row with its name, and the nodes without a row (-1) the intermediate node
+        # colour added to the end of the row colours.
+        metadata_index = {sample_id: index for index, sample_id in enumerate(metadata[id_column])}
+        node_rows = np.array([metadata_index.get(name, -1) for name in node_list], dtype=np.intp)
+
+        def get_node_colourings(category: str, *, gradient: bool) -> list:
+            # The row colours of a date column are a gradient, so the default colouring of a date column isn't one
+            if gradient == ("date" in category.lower()):
+                category_colours = row_colourings[category]
+            else:
+                category_colours = get_category_colours(metadata, category)
+            return np.append(category_colours.to_numpy(dtype=object), 'rgb(100,100,100)')[node_rows].tolist()
+
+    colourings = get_node_colourings(default_category, gradient=False)
+
+    ###########
+    # 5. Create the drop-down functionality
     # Add a fancy drop_down list to change the node colours in the interactive tree:
     drop_down_update = list([dict(
         buttons=[],
@@ -642,123 +1938,152 @@ def write_interactive_tree(*,
     ])
 
     # Create a colour list for every column in the metadata dataframe if >=48 things to colour:
-    for category_to_colour in metadata.columns.values:
-        if "date" in category_to_colour.lower():
-            drop_down_update_dict = dict(label=category_to_colour,
-                                         method='update',
-                                         args=[{'marker.color': [
-                                             get_continuous_colourings(
-                                                 metadata_df=metadata,
-                                                 id_column=id_column,
-                                                 date_category=category_to_colour,
-                                                 number_of_nodes=len(x_nodes),
-                                                 node_list=node_list
-                                             )]}]
-                                         )
-            drop_down_update[0]['buttons'].append(drop_down_update_dict)
-        else:
-            list_of_categories = sorted(list(set(metadata[category_to_colour])))
-            if len(list_of_categories) <= 48:
-                drop_down_update_dict = dict(label=category_to_colour,
-                                             method='update',
-                                             args=[{'marker.color': [
-                                                 get_colourings(
-                                                     metadata_df=metadata,
-                                                     id_column=id_column,
-                                                     category=category_to_colour,
-                                                     number_of_nodes=len(x_nodes),
-                                                     node_list=node_list
-                                                 )]}]
-                                             )
-                drop_down_update[0]['buttons'].append(drop_down_update_dict)
+    for category_to_colour in colour_categories:
+        drop_down_update_dict = dict(label=category_to_colour,
+                                     method='update',
+                                     args=[{'marker.color': [get_node_colourings(
+                                         category_to_colour, gradient="date" in category_to_colour.lower())]}]
+                                     )
+        drop_down_update[0]['buttons'].append(drop_down_update_dict)
 
     ###########
-    # 7. Add layout to plotly plot - add the lines between nodes.
-    # Prep a title:
-    if title:
-        graph_title = f'{title}; (n={len(list(tree.get_terminals()))})'
-    else:
-        graph_title = f"Interactive Tree - {datetime.datetime.now()}"
-
-    # The branches are already defined and stored as Plotly shapes that are included in the plot layout below:
-    layout = go.Layout(title=dict(text=graph_title, yanchor='top', y=0.95),
-                       font=dict(family='Arial', size=14),
-                       showlegend=False,
-                       autosize=True,
-                       xaxis=dict(showline=True,
-                                  zeroline=False,
-                                  showgrid=False,
-                                  ticklen=4,
-                                  showticklabels=True,
-                                  title='Branch Length'),
-                       yaxis=dict(visible=False),
-                       hovermode='closest',
-                       plot_bgcolor='rgb(250,250,250)',
-                       margin=dict(l=10, t=150),
-                       # shapes=tree_line_shapes,  # lines for tree branches
-                       updatemenus=drop_down_update  # This adds the drop-down menu to change the node colours.
-                       )
-
-    fig = go.Figure(data=[trace], layout=layout)
-
-    # Add in the SVG path
-    fig.update_layout(
-        shapes=[
-            dict(
-                type="path",
-                path=svg_path,
-                line_color="rgb(25,25,25)",
-                layer="below"
-            )
-        ]
-    )
-
-    # Add text annotations as a separate trace
-    fig.add_trace(
-        go.Scattergl(
-            x=x_nodes,
-            y=y_nodes,
-            mode="text",
-            text=[f"\t\t\t{x.split('<br>')[0]}" if x else "" for x in hover_text],
-            textposition="middle right",
-            visible=False
-        )
-    )
+    # 6. Prep a title:
+    graph_title = get_graph_title(tree, title)
 
     ###########
-    # 8. Jsonify data for javascript shenanigans
-    metadata.index = metadata[id_column]
-    # split NN data back out into an array
-    metadata["Nearest_neighbour"] = metadata["Nearest_neighbour"].apply(lambda x: x.split("<br>"))
+    # 7. Build the figure - the nodes are trace 0 and the hidden text labels are trace 1.
+    figure_spec = build_figure_spec(x_nodes=np.asarray(x_nodes, dtype=float),
+                                    y_nodes=np.asarray(y_nodes, dtype=float),
+                                    colourings=colourings,
+                                    hover_text=hover_text,
+                                    drop_down_update=drop_down_update,
+                                    graph_title=graph_title)
+    if renderer == 'plotly':
+        return go.Figure(figure_spec), clade_summary
+    return figure_spec, clade_summary
 
-    # basket case to make sure we have normal jsonable types instead of weird numpy types
-    matrix_json = json.loads(snp_distance_matrix.to_json(orient="split"))
-    del matrix_json["columns"]
 
-    # Technically we only need ~half the data because snp_dist(A,B) == snp_dist(B,A) but we're keeping all of it for now
-    matrix_json = json.dumps(matrix_json)
+def write_interactive_tree(*,
+                           tree,
+                           output_name: str | os.PathLike,
+                           metadata: pd.DataFrame,
+                           id_column: str = 'ID',
+                           snp_distance_matrix: pd.DataFrame,
+                           title: str = None,
+                           renderer: Literal["fast", "plotly"] = "fast",
+                           compress: bool = False,
+                           split_assets: bool = False,
+                           nearest_neighbours: Optional[pd.Series] = None,
+                           network_snps: Optional[float] = None,
+                           row_colourings: Optional[pd.DataFrame] = None) -> None:
+    """
+    Create an interactive phylogeny (html) file for a given phylogeny file.
+    :param tree: Bio Phylo Tree object or CompactTree, or a dict of tree name: tree to make one report that can switch
+        between the trees. The metadata and SNP distances are written once for all the trees. The first tree is shown
+        when the report is opened.
+    :param output_name: A file name for or path and file name for the output (str). Do not add file format suffix.
+    :param metadata: Pandas dataframe of metadata. Each column will be read in as hover text for the tree
+        (pandas df)
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances. Column order must match row
+        order (pandas df)
+    :param title: string, title of the plot.
+    :param renderer: "fast" writes the Plotly figure JSON directly, "plotly" builds a plotly go.Figure first (slower,
+        kept for compatibility). (str, default = "fast")
+    :param compress: if True, the plot and datasets are gzipped into the html and unpacked by the browser when the
+        report is opened. The report is still one file, but much smaller. (bool, default = False)
+    :param split_assets: if True, write the plotly library and the datasets as separate files next to the html (see
+        write_split_assets). Reports in the same directory share the plotly library. The report has to be opened
+        through a web server, for example `python -m http.server`. (bool, default = False)
+    :param nearest_neighbours: the nearest neighbours of each sample, from get_all_nearest_neighbours, if they have
+        already been worked out. (pandas series, default = None)
+    :param network_snps: if given, the report also has a minimum spanning network of the samples, joining samples at
+        most this many SNPs apart (see get_network_view). (float, default = None)
+    :param row_colourings: the colour of each metadata row for each colour option, if they have already been worked
+        out, for example read from artefacts (see get_row_colourings). The nodes are then coloured from these rather
+        than by matching every node to the metadata. (pandas df, default = None)
+    :return: None, but html files are created
+    """
+    ##################
+    # Set up:
+    if compress and split_assets:
+        raise ValueError("Choose either compress or split_assets, not both")
+    trees = tree if isinstance(tree, dict) else {title: tree}
+    # With more than one tree, each is titled with its name
+    tree_titles = {name: (f'{title} - {name}' if title else name) if len(trees) > 1 else title for name in trees}
+    for name, each_tree in trees.items():
+        print(f'Creating Tree \'{tree_titles[name]}\'... \n Number of leaves: {len(get_leaf_names(each_tree))}')
+    first_tree_name = next(iter(trees))
+
+    # Add nearest neighbours to the metadata dataframe
+    metadata = add_nearest_neighbours(metadata=metadata,
+                                      id_column=id_column,
+                                      snp_distance_matrix=snp_distance_matrix,
+                                      nearest_neighbours=nearest_neighbours)
+    if row_colourings is not None:
+        # Fill in any colour options the given colours don't have, for example Nearest_neighbour
+        _, row_colourings = get_row_colourings(metadata, id_column, row_colourings=row_colourings)
 
     ###########
-    # 9. Write outputs
-    # use the html_res context manager to open the correct temp path to get access to the html_res folder needed for
-    # outputs in step 9:
-
-    # Write out the datasets to a javascript file -
-    with as_file(files('html_res')) as html_res_path:
-        with open(html_res_path / "tempmetadata.js", "w", encoding="utf-8") as outfile:
-            # write out the metadata
-            outfile.write("const inputMetadata = ")
-            outfile.write(metadata.to_json(
-                indent=4,
-                orient="index"
-            ))
-            outfile.write("\n\n")
-
-            # write out the distance matrix
-            outfile.write("const inputSnpMatrix = ")
-            outfile.write(matrix_json)
-            outfile.write("\n")
-
-        # Write the html file
-        with open(f'{output_name}', "w", encoding="utf-8") as outfile:
-            outfile.write(generate_html(html_res_path, fig))
+    # 1 - 7. Lay out the tree and build the figure. This runs in the background while the datasets are serialised and
+    # the start of the html file is written - iter_html waits for each piece when it gets to it.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        figure_future = executor.submit(build_tree_figure,
+                                        tree=trees[first_tree_name],
+                                        metadata=metadata,
+                                        id_column=id_column,
+                                        title=tree_titles[first_tree_name],
+                                        renderer=renderer,
+                                        row_colourings=row_colourings)
+        # The split asset report writes the SNP distances as a binary file instead
+        matrix_future = None if split_assets else executor.submit(get_snp_matrix_json, snp_distance_matrix)
+        fig_future = executor.submit(lambda: figure_future.result()[0])
+        clade_summary_future = executor.submit(lambda: json_for_script(figure_future.result()[1]))
+
+        ###########
+        # 8. Jsonify data for javascript shenanigans
+        data_payloads = {"inputMetadata": get_metadata_json(metadata, id_column),
+                         "inputSnpMatrix": matrix_future,
+                         "inputCladeSummary": clade_summary_future,
+                         "inputFacets": executor.submit(get_facets_json, metadata, id_column),
+                         "inputDates": executor.submit(get_dates_json, metadata)}
+
+        # The other trees and the network only need their layout, and the colour of each metadata row to colour their
+        # nodes. The first tree is in the figure.
+        metadata_index = {sample_id: index for index, sample_id in enumerate(metadata[id_column])}
+        if len(trees) > 1:
+            tree_view_futures = [executor.submit(get_tree_view,
+                                                 trees[name],
+                                                 metadata_index=metadata_index,
+                                                 title=tree_titles[name]) for name in list(trees)[1:]]
+            data_payloads["inputTrees"] = executor.submit(
+                lambda: json_for_script([dict(name=first_tree_name)] + [
+                    dict(name=name, **view_future.result()) for name, view_future in zip(list(trees)[1:],
+                                                                                         tree_view_futures)]))
+        if network_snps is not None:
+            data_payloads["inputNetwork"] = executor.submit(lambda: json_for_script(get_network_view(
+                snp_distance_matrix, metadata_index=metadata_index, max_snps=network_snps)))
+        if len(trees) > 1 or network_snps is not None:
+            data_payloads["inputColourings"] = executor.submit(get_row_colourings_json, metadata, id_column,
+                                                             row_colourings=row_colourings)
+
+        ###########
+        # 9. Write the html file
+        if split_assets:
+            del data_payloads["inputSnpMatrix"]
+            data_payloads = {name: _resolve(payload) for name, payload in data_payloads.items()}
+            manifest = write_split_assets(output_name=output_name,
+                                          figure_spec=fig_future.result(),
+                                          data_payloads=data_payloads,
+                                          snp_distance_matrix=snp_distance_matrix)
+            with open(f'{output_name}', "w", encoding="utf-8") as outfile:
+                outfile.writelines(iter_html(None, {}, sidecar_manifest=manifest))
+            return
+
+        try:
+            with open(f'{output_name}', "w", encoding="utf-8") as outfile:
+                outfile.writelines(iter_html(fig_future, data_payloads, compress=compress))
+        except BaseException:
+            # Don't leave a half written report behind if building the figure failed
+            Path(output_name).unlink(missing_ok=True)
+            raise
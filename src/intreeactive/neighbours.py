@@ -0,0 +1,200 @@
+import concurrent.futures
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+
+# Matrices with fewer samples than this are worked through in this process, as starting the worker processes and
+# copying the matrix to them takes longer than the work itself.
+PARALLEL_MIN_SAMPLES = 4000
+# Roughly the most distances (matrix cells) one block of rows holds, when the block size isn't given.
+BLOCK_CELLS = 1 << 22
+
+# In the worker processes, the SNP distance matrix in shared memory (set by _attach_matrix).
+_shared_matrix = None
+_matrix = None
+
+
+def _attach_matrix(name: str, shape: tuple, dtype: str) -> None:
+    """
+    Start a worker process by attaching to the SNP distance matrix in shared memory, so it isn't copied to every task.
+    :param name: name of the shared memory block.
+    :param shape: shape of the matrix.
+    :param dtype: numpy dtype string of the matrix.
+    """
+    global _shared_matrix, _matrix
+    _shared_matrix = shared_memory.SharedMemory(name=name)
+    _matrix = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_shared_matrix.buf)
+
+
+def _get_block(values: np.ndarray, start: int, stop: int, self_columns: np.ndarray = None) -> np.ndarray:
+    """
+    Get a block of rows of the matrix as floats. Missing distances and each sample's distance to itself are set to
+    infinity, so they are never a nearest neighbour or an edge.
+    :param values: array of SNP distances, square unless self_columns is given.
+    :param start: first row of the block.
+    :param stop: row after the last row of the block.
+    :param self_columns: the column of each row's own sample, if values isn't square. (default = None, the diagonal)
+    :return: array of the block's rows.
+    """
+    block = values[start:stop].astype(float)
+    block[np.isnan(block)] = np.inf
+    block_rows = np.arange(stop - start)
+    block[block_rows, start + block_rows if self_columns is None else self_columns[start:stop]] = np.inf
+    return block
+
+
+def _nearest_in_block(start: int, stop: int, self_columns: np.ndarray = None,
+                      values: np.ndarray = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the nearest neighbours (including ties) of the samples in a block of rows.
+    :param start: first row of the block.
+    :param stop: row after the last row of the block.
+    :param self_columns: the column of each row's own sample, if values isn't square. (default = None, the diagonal)
+    :param values: array of SNP distances, square unless self_columns is given. (default = None, the matrix in shared
+        memory)
+    :return: tuple of the smallest distance in each row, and the rows and columns of the nearest neighbours, in order.
+    """
+    block = _get_block(_matrix if values is None else values, start, stop, self_columns)
+    minimums = block.min(axis=1)
+    rows, columns = np.nonzero((block == minimums[:, None]) & np.isfinite(block))
+    return minimums, rows + start, columns
+
+
+def _edges_in_block(start: int, stop: int, max_snps: float,
+                    values: np.ndarray = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the pairs of samples within max_snps of each other in a block of rows, keeping each pair once.
+    :param start: first row of the block.
+    :param stop: row after the last row of the block.
+    :param max_snps: the largest SNP distance kept.
+    :param values: square array of SNP distances. (default = None, the matrix in shared memory)
+    :return: tuple of the rows, columns (always after the row) and SNP distances of the edges, in order.
+    """
+    block = _get_block(_matrix if values is None else values, start, stop)
+    rows, columns = np.nonzero(block <= max_snps)
+    keep = columns > rows + start
+    rows, columns = rows[keep], columns[keep]
+    return rows + start, columns, block[rows, columns]
+
+
+def map_row_blocks(function: Callable, values: np.ndarray, *args, block_size: int = None,
+                   workers: int = None) -> list:
+    """
+    Run function over blocks of rows of the SNP distance matrix. Large matrices are copied once into shared memory and
+    the blocks are shared out over a pool of processes; the results are returned in the order of the blocks, so they
+    are the same however many processes are used.
+    :param function: one of the *_in_block functions, called as function(start, stop, *args).
+    :param values: array of SNP distances, with a row for each sample worked through.
+    :param args: any other arguments for function.
+    :param block_size: number of rows in each block. (int, default = None, sized to BLOCK_CELLS)
+    :param workers: number of processes to use. (int, default = None, the number of CPUs)
+    :return: list of the results of function for each block.
+    """
+    n_samples = len(values)
+    block_size = block_size or max(1, BLOCK_CELLS // max(values.shape[-1], 1))
+    starts = list(range(0, n_samples, block_size))
+    stops = [min(start + block_size, n_samples) for start in starts]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or n_samples < PARALLEL_MIN_SAMPLES or len(starts) == 1:
+        return [function(start, stop, *args, values=values) for start, stop in zip(starts, stops)]
+
+    # Whole-number distances are stored in the smallest type that holds them, to keep the copy small
+    if np.issubdtype(values.dtype, np.integer) and values.size and values.min() >= 0:
+        dtype = np.min_scalar_type(values.max())
+    else:
+        dtype = values.dtype
+    shared = shared_memory.SharedMemory(create=True, size=max(values.size * dtype.itemsize, 1))
+    try:
+        np.ndarray(values.shape, dtype=dtype, buffer=shared.buf)[:] = values
+        # Processes are spawned rather than forked, as the matrix is usually read in on another thread
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(starts)),
+                                                    mp_context=multiprocessing.get_context('spawn'),
+                                                    initializer=_attach_matrix,
+                                                    initargs=(shared.name, values.shape, dtype.str)) as executor:
+            return list(executor.map(function, starts, stops, *[[arg] * len(starts) for arg in args]))
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def get_nearest(values: np.ndarray, *, self_columns: np.ndarray = None, block_size: int = None,
+                workers: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the nearest neighbours (including ties) of every sample. The matrix must be symmetric.
+    :param values: square array of SNP distances, or the rows of some of the samples with self_columns.
+    :param self_columns: the column of each row's own sample, when values only has some of the rows. (default = None,
+        values is square)
+    :param block_size: number of rows in each block. (int, default = None, sized to BLOCK_CELLS)
+    :param workers: number of processes to use. (int, default = None, the number of CPUs)
+    :return: tuple of the smallest distance for each sample, and the rows and columns of the nearest neighbours, in
+        order of row then column.
+    """
+    blocks = map_row_blocks(_nearest_in_block, values, self_columns, block_size=block_size, workers=workers)
+    if not blocks:
+        return np.empty(0), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    minimums, rows, columns = (np.concatenate(parts) for parts in zip(*blocks))
+    return minimums, rows, columns
+
+
+def get_edges(values: np.ndarray, max_snps: float, *, block_size: int = None,
+              workers: int = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find every pair of samples within max_snps of each other. The matrix must be symmetric.
+    :param values: square array of SNP distances.
+    :param max_snps: the largest SNP distance kept.
+    :param block_size: number of rows in each block. (int, default = None, sized to BLOCK_CELLS)
+    :param workers: number of processes to use. (int, default = None, the number of CPUs)
+    :return: tuple of the rows, columns (always after the row) and SNP distances of the edges, in order of row then
+        column.
+    """
+    blocks = map_row_blocks(_edges_in_block, values, max_snps, block_size=block_size, workers=workers)
+    if not blocks:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    rows, columns, distances = (np.concatenate(parts) for parts in zip(*blocks))
+    return rows, columns, distances
+
+
+def get_minimum_spanning_edges(values: np.ndarray, max_snps: float, *,
+                               samples: np.ndarray = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find the minimum spanning network of the samples with Prim's algorithm, only joining samples within max_snps of
+    each other, so samples with nothing that close are left in separate parts of the network. One row of the matrix is
+    read for each sample added, so besides the matrix only a few arrays of one value per sample are used. Ties are
+    broken by matrix order, so the network is always the same. The matrix must be symmetric.
+    :param values: square array of SNP distances.
+    :param max_snps: the largest SNP distance joined.
+    :param samples: rows of the matrix to include, in order. (array, default = None, all of them)
+    :return: tuple of the sources, targets and SNP distances of the edges, as positions in samples, in the order they
+        were added.
+    """
+    # Read each row from whichever way round the matrix is contiguous in memory
+    if values.flags.f_contiguous and not values.flags.c_contiguous:
+        values = values.T
+    samples = np.arange(len(values)) if samples is None else np.asarray(samples)
+    n_samples = len(samples)
+    # The closest distance from the network so far to each sample not yet in it, and which sample that is from
+    closest = np.full(n_samples, np.inf)
+    closest_to = np.full(n_samples, -1)
+    is_added = np.zeros(n_samples, dtype=bool)
+    sources, targets, distances = [], [], []
+    for _ in range(n_samples):
+        sample = int(np.argmin(closest))
+        if closest[sample] == np.inf:
+            # Nothing left is close enough to join, start a new part of the network from the first sample left
+            sample = int(np.argmin(is_added))
+        else:
+            sources.append(closest_to[sample])
+            targets.append(sample)
+            distances.append(closest[sample])
+        is_added[sample] = True
+        closest[sample] = np.inf
+
+        row = values[samples[sample], samples].astype(float)
+        is_closer = (row < closest) & (row <= max_snps) & ~is_added
+        closest[is_closer] = row[is_closer]
+        closest_to[is_closer] = sample
+    return (np.array(sources, dtype=np.intp), np.array(targets, dtype=np.intp),
+            np.array(distances, dtype=float))
@@ -0,0 +1,215 @@
+import gzip
+import http.server
+import urllib.parse
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+
+from intreeactive import intreeactive
+
+# Limits on what one request can ask for, so a viewer can't make the server do (or send) an unbounded amount of work.
+MAX_IDS_PER_REQUEST = 1000
+MAX_FIELDS_PER_REQUEST = 20
+MAX_NEIGHBOURS = 1000
+# Responses smaller than this are not worth gzipping.
+MIN_GZIP_SIZE = 1024
+
+
+class ReportData:
+    """
+    The datasets behind a served report, held once in memory for every viewer. The SNP distances are one NumPy array
+    of the smallest dtype that holds them, rather than a dataframe, and samples are looked up by index.
+    """
+
+    def __init__(self, *, metadata: pd.DataFrame, id_column: str = 'ID', snp_distance_matrix: pd.DataFrame):
+        """
+        :param metadata: Pandas dataframe of metadata, with the Nearest_neighbour column added.
+        :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+        :param snp_distance_matrix: Pandas dataframe with all against all SNP distances. Column order must match row
+            order.
+        """
+        self.matrix_ids = snp_distance_matrix.index.to_list()
+        self.matrix_index = {sample_id: index for index, sample_id in enumerate(self.matrix_ids)}
+        # Not copied if the matrix is already the smallest dtype (see cli.serve)
+        values = snp_distance_matrix.to_numpy()
+        self.matrix = values.astype(intreeactive.get_smallest_dtype(values), copy=False)
+
+        metadata = metadata.set_index(metadata[id_column])
+        metadata = metadata[~metadata.index.duplicated()].copy()
+        # split NN data back out into an array, as in the report
+        metadata["Nearest_neighbour"] = metadata["Nearest_neighbour"].apply(lambda x: x.split("<br>"))
+        self.metadata = metadata
+        self.metadata_ids = sorted(metadata.index)
+
+    def get_metadata_rows(self, sample_ids: list[str]) -> dict:
+        """
+        :param sample_ids: IDs to get the metadata of. Unknown IDs are left out.
+        :return: dict of ID: {field: value}.
+        """
+        known_ids = [sample_id for sample_id in sample_ids if sample_id in self.metadata.index]
+        return self.metadata.loc[known_ids].to_dict(orient='index')
+
+    def get_metadata_columns(self, fields: list[str]) -> dict:
+        """
+        :param fields: metadata fields (columns) to get. Unknown fields are left out.
+        :return: dict with 'ids' (every ID in the metadata) and 'fields', a dict of field: list of values in the order
+            of 'ids'.
+        """
+        known_fields = [field for field in fields if field in self.metadata.columns]
+        return dict(ids=self.metadata.index.to_list(),
+                    fields={field: self.metadata[field].to_list() for field in known_fields})
+
+    def get_neighbours_within_snp_threshold(self, sample_id: str, max_snps: float) -> list:
+        """
+        :param sample_id: ID to get the neighbours of.
+        :param max_snps: the largest SNP distance to include.
+        :return: list of [ID, SNP distance], nearest first, at most MAX_NEIGHBOURS long. Empty if the ID is not in the
+            matrix.
+        """
+        if sample_id not in self.matrix_index:
+            return []
+        index = self.matrix_index[sample_id]
+        distances = self.matrix[index]
+        within_threshold = distances <= max_snps
+        within_threshold[index] = False
+        neighbours = np.flatnonzero(within_threshold)
+        neighbours = neighbours[np.argsort(distances[neighbours], kind='stable')][:MAX_NEIGHBOURS]
+        return [[self.matrix_ids[neighbour], distances[neighbour].item()] for neighbour in neighbours]
+
+    def get_snp_distance(self, sample_id: str, sample_id2: str) -> float | None:
+        """
+        :return: the SNP distance between the two samples, or None if either is not in the matrix.
+        """
+        if sample_id not in self.matrix_index or sample_id2 not in self.matrix_index:
+            return None
+        return self.matrix[self.matrix_index[sample_id], self.matrix_index[sample_id2]].item()
+
+
+def _get_ids(params: dict, name: str = 'id', limit: int = MAX_IDS_PER_REQUEST) -> list[str]:
+    """
+    Get a repeated query string parameter, refusing requests for more than limit values.
+    """
+    values = params.get(name, [])
+    if len(values) > limit:
+        raise ValueError(f"At most {limit} values of '{name}' can be requested at once")
+    return values
+
+
+# The JSON endpoints main.js uses in a served report, under /api/. Each takes the ReportData and the parsed query
+# string.
+API_ROUTES = {
+    'ids': lambda data, params: data.metadata_ids,
+    'fields': lambda data, params: data.metadata.columns.to_list(),
+    'metadata': lambda data, params: data.get_metadata_rows(_get_ids(params)),
+    'columns': lambda data, params: data.get_metadata_columns(_get_ids(params, 'field', MAX_FIELDS_PER_REQUEST)),
+    'neighbours': lambda data, params: data.get_neighbours_within_snp_threshold(params['id'][0],
+                                                                                float(params['max_snps'][0])),
+    'distance': lambda data, params: data.get_snp_distance(*_get_ids(params, limit=2)),
+}
+
+
+class ReportRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the report page at / and the datasets from API_ROUTES at /api/<route>. The report and data are on the
+    server (a ReportServer).
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path in ['/', '/index.html']:
+            self.send_body(self.server.report_html, 'text/html; charset=utf-8', self.server.report_html_gzip)
+            return
+
+        route = API_ROUTES.get(url.path.removeprefix('/api/')) if url.path.startswith('/api/') else None
+        if route is None:
+            self.send_error(404)
+            return
+        try:
+            result = route(self.server.data, urllib.parse.parse_qs(url.query))
+        except (KeyError, IndexError, TypeError, ValueError) as error:
+            self.send_error(400, explain=str(error))
+            return
+        self.send_body(intreeactive.json_for_script(result).encode('utf-8'), 'application/json')
+
+    def send_body(self, body: bytes, content_type: str, body_gzip: bytes = None) -> None:
+        """
+        Send a 200 response, gzipped if the browser accepts it and it is worth it.
+        """
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            if body_gzip is None and len(body) >= MIN_GZIP_SIZE:
+                body_gzip = gzip.compress(body, compresslevel=6)
+        else:
+            body_gzip = None
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        if body_gzip is not None:
+            body = body_gzip
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_request(self, code='-', size='-'):
+        # Only errors are logged, a report makes a request for every search.
+        if isinstance(code, int) and code >= 400:
+            super().log_request(code, size)
+
+
+class ReportServer(http.server.ThreadingHTTPServer):
+    """
+    A threaded HTTP server for one report, so many viewers can use it at once.
+    """
+    daemon_threads = True
+
+    def __init__(self, server_address: tuple[str, int], *, report_html: str, data: ReportData):
+        super().__init__(server_address, ReportRequestHandler)
+        self.report_html = report_html.encode('utf-8')
+        self.report_html_gzip = gzip.compress(self.report_html, compresslevel=6)
+        self.data = data
+
+
+def make_report_server(*,
+                       tree,
+                       metadata: pd.DataFrame,
+                       id_column: str = 'ID',
+                       snp_distance_matrix: pd.DataFrame,
+                       title: str = None,
+                       renderer: Literal["fast", "plotly"] = "fast",
+                       nearest_neighbours: pd.Series = None,
+                       host: str = '127.0.0.1',
+                       port: int = 8000) -> ReportServer:
+    """
+    Build the report and load the datasets for a served report, where main.js fetches the metadata and SNP distances
+    from the server as it needs them, instead of them being in the page. Call serve_forever() on the result to start.
+    :param tree: Bio Phylo Tree object or CompactTree.
+    :param metadata: Pandas dataframe of metadata.
+    :param id_column: the column in the metadata that corresponds to the taxa in the tree. (str, default = 'ID')
+    :param snp_distance_matrix: Pandas dataframe with all against all SNP distances. Column order must match row
+        order.
+    :param title: string, title of the plot.
+    :param renderer: "fast" or "plotly", see write_interactive_tree. (str, default = "fast")
+    :param nearest_neighbours: the nearest neighbours of each sample, from get_all_nearest_neighbours, if they have
+        already been worked out. (pandas series, default = None)
+    :param host: address to serve on. (str, default = '127.0.0.1', only this computer)
+    :param port: port to serve on, 0 picks a free port. (int, default = 8000)
+    :return: the server.
+    """
+    print(f'Creating Tree \'{title}\'... \n Number of leaves: {len(intreeactive.get_leaf_names(tree))}')
+    metadata = intreeactive.add_nearest_neighbours(metadata=metadata,
+                                                   id_column=id_column,
+                                                   snp_distance_matrix=snp_distance_matrix,
+                                                   nearest_neighbours=nearest_neighbours)
+    fig, clade_summary = intreeactive.build_tree_figure(tree=tree,
+                                                        metadata=metadata,
+                                                        id_column=id_column,
+                                                        title=title,
+                                                        renderer=renderer)
+    data_payloads = {"inputCladeSummary": intreeactive.json_for_script(clade_summary),
+                     "inputDataApi": intreeactive.json_for_script({"url": "api/"})}
+    report_html = "".join(intreeactive.iter_html(fig, data_payloads))
+
+    data = ReportData(metadata=metadata, id_column=id_column, snp_distance_matrix=snp_distance_matrix)
+    return ReportServer((host, port), report_html=report_html, data=data)
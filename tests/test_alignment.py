@@ -0,0 +1,56 @@
+import gzip
+
+import numpy as np
+import pytest
+
+from src.intreeactive import alignment
+
+
+# Constants and fixtures:
+@pytest.fixture
+def alignment_path(tmp_path):
+    """
+    Write an alignment with lower case bases, Ns, gaps and an ambiguity code, and a sequence over two lines.
+    """
+    path = tmp_path / 'alignment.fasta'
+    path.write_text(">A sample A\nACGTACGT\n"
+                    ">B\nACGTACGA\n"
+                    ">C\nacgtNNTA\n"
+                    ">D\nTC-TAC\nRA\n")
+    return path
+
+
+# Tests
+def test_snp_distances(alignment_path):
+    sample_ids, codes = alignment.read_alignment(alignment_path)
+    assert sample_ids == ['A', 'B', 'C', 'D']
+    # only the sites where two samples have different bases are kept
+    assert codes.shape == (4, 3)
+
+    # differences are only counted where both samples have A, C, G or T, as snp-dists does
+    matrix = alignment.read_in_alignment_snp_dists(alignment_path)
+    assert matrix.to_numpy().tolist() == [[0, 1, 2, 2],
+                                          [1, 0, 1, 1],
+                                          [2, 1, 0, 1],
+                                          [2, 1, 1, 0]]
+    assert matrix.index.to_list() == sample_ids
+
+
+def test_snp_distances_in_blocks(monkeypatch):
+    """
+    The matrix is the same however many blocks it is worked out in, and matches comparing every pair of samples.
+    """
+    rng = np.random.default_rng(0)
+    codes = rng.choice(np.array([0, 1, 2, 4, 8], dtype=np.uint8), size=(30, 50))
+    expect = [[np.sum((row != 0) & (other != 0) & (row != other)) for other in codes] for row in codes]
+
+    monkeypatch.setattr(alignment, 'TILE_BYTES', 100)
+    assert alignment.get_snp_distances(codes, threads=3).tolist() == expect
+
+
+def test_read_alignment_errors(tmp_path):
+    path = tmp_path / 'alignment.fasta.gz'
+    with gzip.open(path, 'wt') as alignment_file:
+        alignment_file.write(">A\nACGT\n>B\nACG\n")
+    with pytest.raises(SystemExit):
+        alignment.read_alignment(path)
@@ -0,0 +1,96 @@
+import json
+from io import StringIO
+
+import pandas as pd
+import pytest
+from Bio import Phylo
+
+from src.intreeactive import artefacts, intreeactive
+
+
+# Constants and fixtures:
+@pytest.fixture
+def test_tree():
+    tree = Phylo.read(StringIO("(A:0.1,B:0.2,(C:0.3,D:0.4)E:0.5)F"), "newick")
+    tree.root_with_outgroup({'name': 'A'})
+    tree.ladderize(reverse=True)
+    return tree
+
+
+@pytest.fixture
+def snp_dist_matrix() -> pd.DataFrame:
+    return pd.DataFrame([[0, 3, 9, 10],
+                         [3, 0, 6, 7],
+                         [9, 6, 0, 1],
+                         [10, 7, 1, 0]], index=['A', 'B', 'C', 'D'], columns=['A', 'B', 'C', 'D'])
+
+
+@pytest.fixture
+def metadata() -> pd.DataFrame:
+    return pd.DataFrame({'ID': ['A', 'B', 'C', 'D'],
+                         'name': ['Ashley', 'Barbara', 'Charlie', 'Deborah'],
+                         'place': ['here', 'there', 'here', 'here']})
+
+
+# Tests
+def test_nearest_neighbour_table(snp_dist_matrix):
+    nearest_neighbours = intreeactive.get_all_nearest_neighbours(snp_dist_matrix)
+    nearest_neighbours['E'] = ""
+    neighbour_table = artefacts.get_nearest_neighbour_table(nearest_neighbours)
+
+    assert neighbour_table.to_dict(orient='list') == {'sample': ['A', 'B', 'C', 'D'],
+                                                      'neighbour': ['B', 'A', 'D', 'C'],
+                                                      'snps': [3, 3, 1, 1]}
+    # samples without neighbours are left out, and given none by add_nearest_neighbours
+    pd.testing.assert_series_equal(artefacts.get_nearest_neighbours_from_table(neighbour_table),
+                                   nearest_neighbours[nearest_neighbours != ""], check_names=False)
+
+
+def test_artefacts_round_trip(tmp_path, test_tree, metadata, snp_dist_matrix):
+    """
+    A report made from the artefacts is the same as one made from the inputs.
+    """
+    pytest.importorskip('pyarrow')
+    nearest_neighbours = intreeactive.get_all_nearest_neighbours(snp_dist_matrix)
+    manifest_path = artefacts.write_artefacts(output_dir=tmp_path / 'artefacts',
+                                              trees={'tree': test_tree},
+                                              metadata=metadata,
+                                              snp_distance_matrix=snp_dist_matrix,
+                                              nearest_neighbours=nearest_neighbours,
+                                              title='Tree')
+    manifest = json.loads(manifest_path.read_text())
+    assert manifest['trees'] == [{'name': 'tree', 'file': 'tree_0.parquet', 'leaves': 4}]
+    tree_table = pd.read_parquet(tmp_path / 'artefacts' / 'tree_0.parquet')
+    assert tree_table['name'].to_list() == [clade.name for clade in test_tree.find_clades()]
+
+    trees, read_metadata, id_column, read_matrix, read_neighbours, title = artefacts.read_artefacts(tmp_path /
+                                                                                                   'artefacts')
+    assert title == 'Tree' and id_column == 'ID'
+    pd.testing.assert_frame_equal(read_metadata, metadata)
+    assert (read_matrix.to_numpy() == snp_dist_matrix.to_numpy()).all()
+    assert read_matrix.dtypes.iloc[0] == 'uint8'
+
+    # the colours are read back rather than worked out again, and colour the nodes the same way
+    read_colours = artefacts.read_artefact_colours(tmp_path / 'artefacts', read_metadata)
+    pd.testing.assert_frame_equal(read_colours, intreeactive.get_row_colourings(metadata)[1])
+    with_neighbours = intreeactive.add_nearest_neighbours(metadata=read_metadata, snp_distance_matrix=read_matrix,
+                                                          nearest_neighbours=read_neighbours)
+    _, row_colourings = intreeactive.get_row_colourings(with_neighbours, row_colourings=read_colours)
+    figure, _ = intreeactive.build_tree_figure(tree=test_tree, metadata=with_neighbours, title='Tree',
+                                               row_colourings=row_colourings)
+    expect_figure, _ = intreeactive.build_tree_figure(tree=test_tree, metadata=with_neighbours, title='Tree')
+    assert intreeactive.figure_spec_to_json(figure) == intreeactive.figure_spec_to_json(expect_figure)
+
+    expect_path, read_path = tmp_path / 'expect.html', tmp_path / 'read.html'
+    intreeactive.write_interactive_tree(tree=test_tree, output_name=expect_path, metadata=metadata,
+                                        snp_distance_matrix=snp_dist_matrix, title='Tree')
+    intreeactive.write_interactive_tree(tree=trees, output_name=read_path, metadata=read_metadata,
+                                        snp_distance_matrix=read_matrix, title='Tree',
+                                        nearest_neighbours=read_neighbours, row_colourings=read_colours)
+    # the plots have random div IDs
+    assert len(expect_path.read_text()) == len(read_path.read_text())
+
+
+def test_read_artefacts_missing(tmp_path):
+    with pytest.raises(SystemExit):
+        artefacts.read_artefacts(tmp_path)
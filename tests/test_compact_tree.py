@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from Bio import Phylo
+
+from src.intreeactive import compact_tree, intreeactive
+
+
+# Constants and fixtures:
+@pytest.fixture
+def newick_path(tmp_path):
+    """
+    Write a Newick tree with support values, a quoted name, a comment and an unnamed internal node.
+    """
+    path = tmp_path / 'tree.newick'
+    path.write_text("(A:0.1,B:0.2,((C:0.3,'D ''x''':0.4)95:0.5[&comment],G:0.1):0.2,E:0.3)F;")
+    return path
+
+
+def assert_same_layout(compact_layout, bio_layout):
+    """
+    The coordinates and names must be the same as for the Bio.Phylo tree, as must the clade summary.
+    """
+    assert compact_layout[:3] == bio_layout[:3]
+    np.testing.assert_array_equal(compact_layout[3]['parents'], bio_layout[3]['parents'])
+    for key, values in bio_layout[3]['clades'].items():
+        np.testing.assert_array_equal(compact_layout[3]['clades'][key], values)
+
+
+# Tests
+def test_read_newick(newick_path):
+    tree = compact_tree.CompactTree.from_newick(newick_path)
+    bio_tree = Phylo.read(newick_path, 'newick')
+
+    # depth first, as Bio.Phylo, with the support value not read as a name
+    assert tree.names == [clade.name for clade in bio_tree.find_clades()]
+    assert tree.names[4] is None
+    assert tree.get_leaf_names() == ['A', 'B', 'C', "D 'x'", 'G', 'E']
+    np.testing.assert_array_equal(tree.branch_lengths,
+                                  [np.nan if clade.branch_length is None else clade.branch_length
+                                   for clade in bio_tree.find_clades()])
+    assert tree.parents.tolist() == [-1, 0, 0, 0, 3, 4, 4, 3, 0]
+
+
+def test_read_newick_in_pieces(newick_path, monkeypatch):
+    """
+    Names and branch lengths that are split between two pieces of the file are read whole.
+    """
+    expect = compact_tree.CompactTree.from_newick(newick_path)
+    monkeypatch.setattr(compact_tree, 'NEWICK_CHUNK_SIZE', 3)
+    tree = compact_tree.CompactTree.from_newick(newick_path)
+    assert tree.names == expect.names
+    np.testing.assert_array_equal(tree.branch_lengths, expect.branch_lengths)
+
+
+@pytest.mark.parametrize("newick", ["(A,B", "(A,B);(C,D);"])
+def test_read_newick_errors(tmp_path, newick):
+    path = tmp_path / 'tree.newick'
+    path.write_text(newick)
+    with pytest.raises(ValueError):
+        compact_tree.CompactTree.from_newick(path)
+
+
+@pytest.mark.parametrize("outgroup", [None, 'A', 'C', "D 'x'", 'E', 'G'])
+def test_layout_matches_bio_phylo(newick_path, outgroup):
+    """
+    Rerooting and ladderizing the arrays gives the same tree, and so the same layout, as Bio.Phylo.
+    """
+    tree = compact_tree.CompactTree.from_newick(newick_path)
+    bio_tree = Phylo.read(newick_path, 'newick')
+    if outgroup:
+        tree.root_with_outgroup(outgroup)
+        bio_tree.root_with_outgroup({'name': outgroup})
+    tree.ladderize(reverse=True)
+    bio_tree.ladderize(reverse=True)
+
+    assert_same_layout(tree.get_layout(), intreeactive.get_tree_layout(bio_tree))
+
+
+def test_prune(newick_path):
+    tree = compact_tree.CompactTree.from_newick(newick_path)
+    bio_tree = Phylo.read(newick_path, 'newick')
+    keep_ids = {'B', 'C', 'G'}
+
+    pruned_tree = tree.prune(keep_ids)
+    assert pruned_tree.get_leaf_names() == ['B', 'C', 'G']
+    assert_same_layout(pruned_tree.get_layout(), intreeactive.get_tree_layout(intreeactive.prune_tree(bio_tree,
+                                                                                                       keep_ids)))
+    # the original is not changed
+    assert len(tree) == 9
+
+
+def test_quantize_coordinates():
+    coords = [0, 0.123456789123, 1.5, 12.000000001]
+    # eight significant figures of the largest coordinate
+    assert compact_tree.quantize_coordinates(coords).tolist() == [0, 0.123457, 1.5, 12.0]
+    assert compact_tree.quantize_coordinates([0.0, 0.0]).tolist() == [0.0, 0.0]
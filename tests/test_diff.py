@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from src.intreeactive import diff, intreeactive
+
+
+# Constants and fixtures:
+@pytest.fixture
+def old_snp_dist_matrix() -> pd.DataFrame:
+    return pd.DataFrame([[0, 3, 9, 10],
+                         [3, 0, 6, 7],
+                         [9, 6, 0, 1],
+                         [10, 7, 1, 0]], index=['A', 'B', 'C', 'D'], columns=['A', 'B', 'C', 'D'])
+
+
+@pytest.fixture
+def new_snp_dist_matrix() -> pd.DataFrame:
+    # A is removed, E is new and closest to B, and the samples are in a different order
+    return pd.DataFrame([[0, 1, 7, 8],
+                         [1, 0, 6, 5],
+                         [7, 6, 0, 2],
+                         [8, 5, 2, 0]], index=['D', 'C', 'B', 'E'], columns=['D', 'C', 'B', 'E'])
+
+
+# Tests
+def test_get_snp_clusters(old_snp_dist_matrix):
+    assert intreeactive.get_snp_clusters(old_snp_dist_matrix, 3).to_dict() == {'A': 0, 'B': 0, 'C': 1, 'D': 1}
+    assert intreeactive.get_snp_clusters(old_snp_dist_matrix, 6).to_dict() == {'A': 0, 'B': 0, 'C': 0, 'D': 0}
+    assert intreeactive.get_snp_clusters(old_snp_dist_matrix, 0).to_dict() == {'A': 0, 'B': 1, 'C': 2, 'D': 3}
+
+
+def test_get_changes(old_snp_dist_matrix, new_snp_dist_matrix):
+    changes = diff.get_changes(old_snp_distance_matrix=old_snp_dist_matrix,
+                               old_nearest_neighbours=intreeactive.get_all_nearest_neighbours(old_snp_dist_matrix),
+                               new_snp_distance_matrix=new_snp_dist_matrix,
+                               new_nearest_neighbours=intreeactive.get_all_nearest_neighbours(new_snp_dist_matrix),
+                               cluster_snps=4)
+    # C and D have the same neighbour and cluster in both runs, so aren't listed
+    assert changes['sample'].to_list() == ['B', 'E', 'A']
+    assert changes['change'].to_list() == ['changed', 'new', 'removed']
+    assert changes['neighbours_changed'].to_list() == [True, False, False]
+    assert changes['cluster_changed'].to_list() == [True, False, False]
+    assert changes.loc[0, ['old_neighbours', 'new_neighbours']].to_list() == ['A=3', 'E=2']
+    assert changes.loc[0, ['old_cluster', 'old_cluster_size', 'new_cluster', 'new_cluster_size']].to_list() == \
+           ['A', 2, 'B', 2]
+
+    # Without cluster_snps only the neighbours are compared
+    changes = diff.get_changes(old_snp_distance_matrix=old_snp_dist_matrix,
+                               old_nearest_neighbours=intreeactive.get_all_nearest_neighbours(old_snp_dist_matrix),
+                               new_snp_distance_matrix=old_snp_dist_matrix,
+                               new_nearest_neighbours=intreeactive.get_all_nearest_neighbours(old_snp_dist_matrix))
+    assert changes.empty
+    assert 'cluster_changed' not in changes
+
+
+def test_add_change_column(old_snp_dist_matrix, new_snp_dist_matrix):
+    changes = diff.get_changes(old_snp_distance_matrix=old_snp_dist_matrix,
+                               old_nearest_neighbours=intreeactive.get_all_nearest_neighbours(old_snp_dist_matrix),
+                               new_snp_distance_matrix=new_snp_dist_matrix,
+                               new_nearest_neighbours=intreeactive.get_all_nearest_neighbours(new_snp_dist_matrix),
+                               cluster_snps=4)
+    metadata = pd.DataFrame({'ID': ['B', 'C', 'D', 'E']})
+    diff.add_change_column(metadata, changes)
+    assert metadata['Change'].to_list() == ['Neighbours and cluster changed', 'Unchanged', 'Unchanged', 'New']
@@ -1,6 +1,11 @@
-from src.intreeactive import intreeactive
+from src.intreeactive import cli, intreeactive
+import json
+import gzip
+import base64
 import pytest
+import numpy as np
 import pandas as pd
+import plotly.graph_objects as go
 
 from Bio import Phylo
 from io import StringIO
@@ -129,6 +134,54 @@ def test_check_ids_occur_where_needed(test_tree, metadata_with_neighbours, snp_d
     assert 'O' not in outcome['ID'].to_list()
 
 
+@pytest.mark.parametrize("query_ids, context_snps, ancestral_hops, expect", [
+    (['C'], 0, 0, {'C'}),
+    (['C'], 1, 0, {'C', 'D'}),
+    (['A'], 3, 0, {'A', 'B'}),
+    (['B'], 0, 1, {'B', 'C', 'D'}),
+    (['B', 'X'], 0, 5, {'A', 'B', 'C', 'D'}),
+])
+def test_get_focus_ids(test_tree, snp_dist_matrix, query_ids, context_snps, ancestral_hops, expect):
+    """
+    Focus samples are the queries, samples within context_snps of them and leaves below their ancestors. 'O' is within
+    range of 'C' but not in the tree, so is never included.
+    """
+    assert intreeactive.get_focus_ids(tree=test_tree,
+                                      snp_dists=snp_dist_matrix,
+                                      query_ids=query_ids,
+                                      context_snps=context_snps,
+                                      ancestral_hops=ancestral_hops) == expect
+
+
+def test_exit_if_no_focus_ids_in_tree(test_tree, snp_dist_matrix):
+    with pytest.raises(SystemExit):
+        intreeactive.get_focus_ids(tree=test_tree, snp_dists=snp_dist_matrix, query_ids=['O'])
+
+
+def test_focus_inputs(test_tree, metadata_with_neighbours, snp_dist_matrix):
+    """
+    Pruning to A and D removes E and F, which are left with one child, adding their branch lengths to D's.
+    """
+    tree, metadata, snp_dists = intreeactive.focus_inputs(tree=test_tree,
+                                                          metadata=metadata_with_neighbours,
+                                                          snp_dists=snp_dist_matrix,
+                                                          query_ids=['D'],
+                                                          ancestral_hops=3)
+    assert sorted(leaf.name for leaf in tree.get_terminals()) == ['A', 'B', 'C', 'D']
+
+    tree, metadata, snp_dists = intreeactive.focus_inputs(tree=test_tree,
+                                                          metadata=metadata_with_neighbours,
+                                                          snp_dists=snp_dist_matrix,
+                                                          query_ids=['A', 'D'])
+    assert [clade.name for clade in tree.find_clades()] == [None, 'A', 'D']
+    assert tree.distance('D') == pytest.approx(test_tree.distance('D'))
+    assert metadata['ID'].to_list() == ['A', 'D']
+    assert metadata['Focus'].to_list() == ['Query', 'Query']
+    assert snp_dists.to_numpy().tolist() == [[0, 10], [10, 0]]
+    # The input tree is unchanged:
+    assert test_tree.count_terminals() == 4
+
+
 def test_get_x_coordinates(test_tree):
     """
     Test function that gets x-coordinates from the phylo tree object.
@@ -276,6 +329,56 @@ def test_missing_snp_dist_entry(snp_dist_matrix):
     assert actual == expect
 
 
+def test_get_all_nearest_neighbours(snp_dist_matrix):
+    """
+    All nearest neighbours at once should match get_nearest_neighbours for each sample, including ties, whichever
+    block size is used. Missing distances are skipped.
+    """
+    for block_size in [1, 2, 512]:
+        neighbours = intreeactive.get_all_nearest_neighbours(snp_dist_matrix, block_size=block_size)
+        assert neighbours.to_dict() == {node: intreeactive.get_nearest_neighbours(snp_dist_matrix, node)
+                                        for node in snp_dist_matrix.index}
+    assert neighbours['D'] == 'C=1<br>O=1'
+
+    snp_dist_matrix = snp_dist_matrix.astype(float)
+    snp_dist_matrix.loc['C', 'D'] = np.nan
+    assert intreeactive.get_all_nearest_neighbours(snp_dist_matrix)['D'] == 'O=1'
+
+
+def test_get_focus_nearest_neighbours(test_tree, metadata_with_neighbours, snp_dist_matrix):
+    """
+    The nearest neighbours of the focus samples are found in the full matrix, so can be outside the focus samples.
+    """
+    _, _, snp_dists = intreeactive.focus_inputs(tree=test_tree,
+                                                metadata=metadata_with_neighbours,
+                                                snp_dists=snp_dist_matrix,
+                                                query_ids=['A', 'D'])
+    for block_size in [1, 512]:
+        neighbours = intreeactive.get_all_nearest_neighbours(snp_dist_matrix, samples=snp_dists.index,
+                                                             block_size=block_size)
+        assert neighbours.to_dict() == {node: intreeactive.get_nearest_neighbours(snp_dist_matrix, node)
+                                        for node in ['A', 'D']}
+    assert neighbours['D'] == 'C=1<br>O=1'
+    assert intreeactive.get_all_nearest_neighbours(snp_dists)['D'] == 'A=10'
+
+
+def test_nearest_neighbours_and_edges_in_processes(snp_dist_matrix, monkeypatch):
+    """
+    Sharing the blocks out over processes gives the same nearest neighbours and edges, in the same order.
+    """
+    serial = intreeactive.get_all_nearest_neighbours(snp_dist_matrix, workers=1)
+    serial_edges = intreeactive.get_snp_edges(snp_dist_matrix, 2, workers=1)
+    assert serial_edges[['source', 'target']].apply(tuple, axis=1).to_list() == [
+        (source, target) for i, source in enumerate(snp_dist_matrix.index) for target in snp_dist_matrix.index[i + 1:]
+        if snp_dist_matrix.loc[source, target] <= 2]
+
+    monkeypatch.setattr(intreeactive.neighbours, 'PARALLEL_MIN_SAMPLES', 0)
+    assert intreeactive.get_all_nearest_neighbours(snp_dist_matrix, block_size=2, workers=2).equals(serial)
+    assert intreeactive.get_all_nearest_neighbours(snp_dist_matrix, samples=['A', 'D'], block_size=1,
+                                                   workers=2).equals(serial[['A', 'D']])
+    assert intreeactive.get_snp_edges(snp_dist_matrix, 2, block_size=2, workers=2).equals(serial_edges)
+
+
 def test_make_hover_text(metadata_with_neighbours):
     """
     Test the function that makes hover text. Hover text is given to plotly as a list, where the index in the list
@@ -456,6 +559,303 @@ def test_read_in_metadata_id_wrong():
     assert id_col == "ID"
     assert "ID" in df.columns.values
 
+
+def test_subtree_without_outgroup(tmp_path, monkeypatch, capsys):
+    """
+    With more than one tree, a tree without the outgroup (e.g. a subtree of one cluster) is left rooted as it is.
+    """
+    subtree_path = tmp_path / 'cluster.newick'
+    subtree_path.write_text('((C:0,(D:0,E:1):1):1,F:1);')
+    monkeypatch.setattr('sys.argv', ['intreeactive', '-t', 'test_snp_tree.newick', '-t', str(subtree_path),
+                                     '-m', 'test_snp_metadata.csv', '-I', 'ID_col', '-s', 'test_snp_dists.matrix',
+                                     '-O', 'A', '-d', str(tmp_path), '--force'])
+    cli.main()
+    assert (tmp_path / 'interactive_tree.html').exists()
+    assert f"{subtree_path} does not contain the outgroup A" in capsys.readouterr().out
+
+    # On its own, the tree must contain the outgroup
+    with pytest.raises(ValueError):
+        intreeactive.read_in_tree(path_to_tree=subtree_path, outgroup='A')
+
+
+@pytest.mark.parametrize("file_name,write", [('metadata.parquet', 'to_parquet'),
+                                              ('metadata.feather', 'to_feather'),
+                                              ('metadata_parquet', 'to_parquet'),
+                                              ('metadata_arrow', 'to_feather')])
+def test_read_in_metadata_arrow(tmp_path, file_name, write):
+    """
+    Parquet and Arrow files are recognised by their extension, or the start of the file, and read in the same as
+    delimited text.
+    """
+    pytest.importorskip('pyarrow')
+    path = tmp_path / file_name
+    getattr(pd.read_csv('test_snp_metadata.csv'), write)(path)
+
+    df, id_col = intreeactive.read_in_metadata(path, 'ID_col')
+    expect, _ = intreeactive.read_in_metadata('test_snp_metadata.csv', 'ID_col')
+    pd.testing.assert_frame_equal(df, expect)
+    assert id_col == "ID"
+
+
+def test_read_in_metadata_columns(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = tmp_path / 'metadata.parquet'
+    pd.read_csv('test_snp_metadata.csv').to_parquet(path)
+
+    # Only the ID column and the chosen columns are read, in the order of the file
+    for metadata_path in ['test_snp_metadata.csv', path]:
+        df, _ = intreeactive.read_in_metadata(metadata_path, 'ID_col', columns=['Date', 'Name'])
+        assert df.columns.to_list() == ['ID', 'Name', 'Date']
+    with pytest.raises(SystemExit):
+        intreeactive.read_in_metadata(path, columns=['not a column'])
+
+
+def test_read_in_metadata_arrow_without_pyarrow(tmp_path, monkeypatch):
+    """
+    Without pyarrow, reading a Parquet file exits, saying why pyarrow couldn't be imported.
+    """
+    path = tmp_path / 'metadata.parquet'
+    path.write_bytes(b'PAR1')
+    monkeypatch.setattr(intreeactive, 'pyarrow', None)
+    monkeypatch.setattr(intreeactive, 'pyarrow_import_error', ImportError('built for NumPy 2'))
+    with pytest.raises(SystemExit, match='built for NumPy 2'):
+        intreeactive.read_in_metadata(path, 'ID_col')
+
+
+@pytest.mark.parametrize("file_name", ['matrix.parquet', 'matrix.feather'])
+def test_read_in_snp_dist_matrix_arrow(tmp_path, file_name):
+    pytest.importorskip('pyarrow')
+    expect = intreeactive.read_in_snp_dist_matrix('test_snp_dists.matrix')
+    path = tmp_path / file_name
+    if file_name.endswith('.parquet'):
+        # with the sample names as the index
+        expect.to_parquet(path)
+    else:
+        expect.reset_index().to_feather(path)
+
+    pd.testing.assert_frame_equal(intreeactive.read_in_snp_dist_matrix(path), expect, check_names=False)
+
+
+@pytest.mark.parametrize("triangle", [np.tril, np.triu])
+def test_read_in_triangular_snp_dist_matrix(tmp_path, triangle):
+    expect = intreeactive.read_in_snp_dist_matrix('test_snp_dists.matrix')
+    path = tmp_path / 'triangle.matrix'
+    expect.where(triangle(np.ones(expect.shape, dtype=bool))).to_csv(path, sep='\t')
+
+    # the filled in matrix is stored in the smallest type that holds the distances
+    matrix = intreeactive.read_in_snp_dist_matrix(path)
+    assert (matrix.dtypes == np.min_scalar_type(expect.to_numpy().max())).all()
+    pd.testing.assert_frame_equal(matrix, expect, check_dtype=False)
+
+
+def test_validate_snp_dist_matrix():
+    matrix = pd.DataFrame([[1, 3, 'x'],
+                           [4, 0, 6.5],
+                           [9, 6, -1]], index=['A', 'B', 'C'], columns=['A', 'B', 'C'])
+    problems, _ = intreeactive.validate_snp_dist_matrix(matrix)
+    print(f'\n   Expect every problem at once, got: {problems}')
+    assert problems == ['distances that are not numbers for: A',
+                        'the distance of a sample to itself is not 0 for: A, C',
+                        'the matrix is not symmetric for: A-B, B-C',
+                        'distances that are not whole numbers of 0 or more for: B, C']
+
+    # the columns are put in the order of the rows
+    matrix = pd.DataFrame([[9, 3, 0], [6, 0, 3], [0, 6, 9]], index=['A', 'B', 'C'], columns=['C', 'B', 'A'])
+    problems, checked = intreeactive.validate_snp_dist_matrix(matrix)
+    assert problems == [] and checked.columns.to_list() == ['A', 'B', 'C']
+
+    problems, _ = intreeactive.validate_snp_dist_matrix(matrix.set_axis(['A', 'A', 'C']))
+    assert problems == ['duplicate row names: A']
+
+
+def test_validate_snp_dist_matrix_in_blocks(monkeypatch):
+    """
+    The matrix is checked and filled in a block of rows at a time, giving the same result whatever the block size.
+    """
+    matrix = pd.DataFrame([[0, np.nan, np.nan, np.nan],
+                           [3, np.nan, np.nan, 9],
+                           [np.nan, 6, 0, np.nan],
+                           [2, 7, 1.5, 0]], index=list('ABCD'), columns=list('ABCD'))
+    problems = ['distances missing (in both triangles) for: A-C',
+                'the matrix is not symmetric for: B-D',
+                'distances that are not whole numbers of 0 or more for: C, D']
+    filled = pd.DataFrame([[0, 3, 8], [3, 0, 5], [8, 5, 0]], index=list('ABD'), columns=list('ABD'))
+    assert intreeactive.validate_snp_dist_matrix(matrix)[0] == problems
+    checked = intreeactive.validate_snp_dist_matrix(filled.where(np.tril(np.ones((3, 3), dtype=bool))))[1]
+    pd.testing.assert_frame_equal(checked, filled.astype(np.uint8))
+
+    monkeypatch.setattr(intreeactive.neighbours, 'BLOCK_CELLS', 4)
+    assert intreeactive.validate_snp_dist_matrix(matrix)[0] == problems
+    checked = intreeactive.validate_snp_dist_matrix(filled.where(np.triu(np.ones((3, 3), dtype=bool))))[1]
+    pd.testing.assert_frame_equal(checked, filled.astype(np.uint8))
+
+
+def test_json_for_script():
+    """
+    NumPy arrays and scalars are encoded as plain JSON lists and numbers, and "</" is escaped so the JSON can't close
+    the <script> tag it is written into.
+    """
+    encoded = intreeactive.json_for_script({'x': np.array([0.5, 1.0]), 'n': np.int64(3), 'text': '</script>'})
+    print(f'\n   Expect compact JSON with escaped closing tag, got: {encoded}')
+    assert '</' not in encoded
+    assert json.loads(encoded) == {'x': [0.5, 1.0], 'n': 3, 'text': '</script>'}
+
+
+def test_build_figure_spec():
+    """
+    The figure spec has the nodes as trace 0 and hidden text labels as trace 1 (main.js relies on this), and the same
+    layout is accepted by plotly's go.Figure.
+    """
+    hover_text = ['A<br>ID: A<br>', None, 'B<br>ID: B<br>']
+    spec = intreeactive.build_figure_spec(x_nodes=np.array([0.0, 0.1, 0.3]),
+                                          y_nodes=np.array([1.0, 1.5, 2.0]),
+                                          colourings=['red', 'grey', 'blue'],
+                                          hover_text=hover_text,
+                                          drop_down_update=[dict(buttons=[])],
+                                          graph_title='Test')
+    assert spec['data'][0]['mode'] == 'markers'
+    assert spec['data'][1]['text'] == ['\t\t\tA', '', '\t\t\tB']
+    assert spec['data'][1]['visible'] is False
+    # the branches are drawn by main.js
+    assert 'shapes' not in spec['layout']
+    fig = go.Figure(spec)
+    assert fig.layout.title.text == 'Test'
+
+
+def test_static_assets_are_cached(tmp_path, monkeypatch):
+    """
+    The static asset bundle (css, js, help page with inlined images) is built once and then read from the cache.
+    """
+    monkeypatch.setenv('INTREEACTIVE_CACHE_DIR', str(tmp_path))
+    assets = intreeactive.get_static_assets.__wrapped__()
+    assert len(list(tmp_path.glob('static_assets_*.json'))) == 1
+    assert 'data:image/png;base64,' in assets['help_html']
+    assert 'function init()' in assets['main_js']
+
+    monkeypatch.setattr(intreeactive, 'build_static_assets', lambda: pytest.fail('Bundle was rebuilt'))
+    assert intreeactive.get_static_assets.__wrapped__() == assets
+
+
+def test_compress_payload():
+    """
+    Compressed payloads are base64 gzip, which the browser unpacks with DecompressionStream.
+    """
+    payload = json.dumps({'A': {'ID': 'A', 'name': 'Ashley'}})
+    compressed = intreeactive.compress_payload(payload)
+    assert gzip.decompress(base64.b64decode(compressed)).decode('utf-8') == payload
+    # Same input, same output - so reports can be compared
+    assert intreeactive.compress_payload(payload) == compressed
+
+
+def test_generate_html_compressed():
+    """
+    A compressed report embeds the datasets as payloads for loader.js, rather than as javascript globals.
+    """
+    spec = intreeactive.build_figure_spec(x_nodes=np.array([0.0]), y_nodes=np.array([1.0]), colourings=['red'],
+                                          hover_text=['A'], drop_down_update=[], graph_title='Test')
+    data_payloads = {'inputMetadata': '{"A": {"ID": "A"}}'}
+    plain_html = intreeactive.generate_html(spec, data_payloads)
+    compressed_html = intreeactive.generate_html(spec, data_payloads, compress=True)
+    assert 'const inputMetadata = {"A": {"ID": "A"}}' in plain_html
+    assert 'const inputMetadata' not in compressed_html
+    assert 'data-name="inputMetadata"' in compressed_html
+    assert 'id="mainScript"' in compressed_html
+    assert len(compressed_html) < len(plain_html) / 2
+
+
+def test_generate_html_waits_for_futures():
+    """
+    The figure and datasets can still be being worked out when the html is generated.
+    """
+    spec = intreeactive.build_figure_spec(x_nodes=np.array([0.0, 0.5]), y_nodes=np.array([1.0, 2.0]),
+                                          colourings=['red', 'blue'], hover_text=['A', 'B'], drop_down_update=[],
+                                          graph_title='Test')
+    with intreeactive.concurrent.futures.ThreadPoolExecutor() as executor:
+        html = intreeactive.generate_html(executor.submit(lambda: spec),
+                                          {'inputMetadata': executor.submit(lambda: '{"A": {}}')})
+    assert 'const inputMetadata = {"A": {}}' in html
+    assert intreeactive.figure_spec_to_json(spec) in html
+    # the size of each dataset is written for the debug panel
+    assert 'var payloadSizes = {"compressed":false,"sizes":{"inputMetadata":9}}' in html
+
+
+@pytest.mark.parametrize("values,expect", [([0, 3, 255], 'uint8'),
+                                           ([0, 3, 256], 'uint16'),
+                                           ([0, 70000], 'uint32'),
+                                           ([0, 1.5], 'float64'),
+                                           ([-1, 3], 'float64')
+                                           ]
+                         )
+def test_get_smallest_dtype(values, expect):
+    """
+    SNP distances are stored in the smallest unsigned integer type that fits, anything else as float64.
+    """
+    assert intreeactive.get_smallest_dtype(np.array(values)) == expect
+
+
+def test_write_split_assets(tmp_path, snp_dist_matrix):
+    """
+    Split asset reports write the coordinates and SNP distances as binary files, with a manifest for loader.js.
+    """
+    spec = intreeactive.build_figure_spec(x_nodes=np.array([0.0, 0.5]), y_nodes=np.array([1.0, 2.0]),
+                                          colourings=['red', 'blue'], hover_text=['A', 'B'], drop_down_update=[],
+                                          graph_title='Test')
+    manifest = intreeactive.write_split_assets(output_name=tmp_path / 'my report.html',
+                                               figure_spec=spec,
+                                               data_payloads={'inputMetadata': '{}'},
+                                               snp_distance_matrix=snp_dist_matrix)
+    assert manifest['matrix']['dtype'] == 'uint8'
+    assert manifest['json']['inputMetadata'] == 'my%20report_data/inputMetadata.json'
+    assert (tmp_path / manifest['plotlyjs']).exists()
+
+    data_dir = tmp_path / 'my report_data'
+    matrix = np.fromfile(data_dir / 'matrix.bin', dtype='uint8').reshape(5, 5)
+    assert (matrix == snp_dist_matrix.to_numpy()).all()
+    assert json.loads((data_dir / 'matrix_index.json').read_text()) == ['A', 'B', 'C', 'D', 'O']
+    assert np.fromfile(data_dir / 'coordinates.bin', dtype='<f8').tolist() == [0.0, 0.5, 1.0, 2.0]
+    assert json.loads((data_dir / 'figure.json').read_text())['data'][0]['x'] is None
+
+
+def test_write_split_assets_plotly_figure(tmp_path, snp_dist_matrix):
+    """
+    The plotly renderer's go.Figure is split the same way as the figure spec.
+    """
+    spec = intreeactive.build_figure_spec(x_nodes=np.array([0.0, 0.5]), y_nodes=np.array([1.0, 2.0]),
+                                          colourings=['red', 'blue'], hover_text=['A', 'B'], drop_down_update=[],
+                                          graph_title='Test')
+    intreeactive.write_split_assets(output_name=tmp_path / 'report.html',
+                                    figure_spec=go.Figure(spec),
+                                    data_payloads={},
+                                    snp_distance_matrix=snp_dist_matrix)
+    data_dir = tmp_path / 'report_data'
+    assert np.fromfile(data_dir / 'coordinates.bin', dtype='<f8').tolist() == [0.0, 0.5, 1.0, 2.0]
+    figure = json.loads((data_dir / 'figure.json').read_text())
+    assert figure['data'][0]['x'] is None
+    assert figure['data'][0]['marker']['color'] == ['red', 'blue']
+
+
+def test_get_clade_summary(test_tree):
+    """
+    Each clade covers a contiguous range of nodes, and knows the box its descendants are drawn in.
+    """
+    x_coords = intreeactive.get_x_coordinates(test_tree)
+    y_coords = intreeactive.get_y_coordinates(test_tree)
+    summary = intreeactive.get_clade_summary(x_coords, y_coords)
+
+    names = [clade.name for clade in x_coords]
+    assert names == [None, 'A', 'F', 'B', 'E', 'C', 'D']
+    assert summary['parents'].tolist() == [-1, 0, 0, 2, 2, 4, 4]
+
+    clades = summary['clades']
+    assert clades['node'].tolist() == [0, 2, 4]
+    assert clades['end'].tolist() == [7, 7, 7]
+    assert clades['leaves'].tolist() == [4, 3, 2]
+    leaf_y = {clade.name: y for clade, y in y_coords.items() if clade.name in ['A', 'B', 'C', 'D']}
+    assert clades['yMin'].tolist() == [leaf_y['A'], leaf_y['B'], leaf_y['C']]
+    assert clades['yMax'].tolist() == [leaf_y['D']] * 3
+    assert clades['xMax'].tolist() == [max(x_coords.values())] * 3
+
+
 # def test_make_12snp_clusters():
 #     from scipy.cluster.hierarchy import linkage, fcluster
 #     from scipy.spatial.distance import squareform
@@ -479,3 +879,145 @@ def test_read_in_metadata_id_wrong():
 #     # Get a reduced filtered matrix for cluster 1
 #     filtered_dist_matrix = dist_matrix.loc[cluster_1, cluster_1]
 #     print(filtered_dist_matrix)
+
+
+@pytest.mark.parametrize("values,expect", [(['x', 'y', 'x', 'x'], {'values': ['x', 'y'], 'codes': [0, 1, 0, 0]}),
+                                           (['x', None, None, None], {'values': ['x'], 'codes': [0, -1, -1, -1]}),
+                                           (['w', 'x', 'y', 'x'], {'data': ['w', 'x', 'y', 'x']}),
+                                           ([1.5, np.nan, 2.5], {'data': [1.5, None, 2.5]})
+                                           ]
+                         )
+def test_encode_column(values, expect):
+    """
+    Columns with many repeated values are dictionary encoded, and missing values are null.
+    """
+    assert json.loads(intreeactive.json_for_script(intreeactive.encode_column(pd.Series(values)))) == expect
+
+
+def test_get_metadata_json(metadata_with_neighbours):
+    metadata_with_neighbours.loc[4, 'Nearest_neighbour'] = ""
+    metadata_json = json.loads(intreeactive.get_metadata_json(metadata_with_neighbours, id_column))
+
+    assert metadata_json['ids'] == ['A', 'B', 'C', 'D', 'O']
+    assert metadata_json['fields'] == ['ID', 'name', 'last', 'date', 'somebool', 'Nearest_neighbour']
+    assert metadata_json['columns']['somebool'] == {'values': [True, False], 'codes': [0, 0, 1, 1, 0]}
+    assert metadata_json['columns']['name'] == {'data': ['Ashley', 'Barbara', 'Charlie', 'Deborah', 'Otto']}
+    # D has two nearest neighbours, and O none
+    assert metadata_json['neighbours'] == {'field': 'Nearest_neighbour',
+                                           'offsets': [0, 1, 2, 3, 5, 5],
+                                           'ids': {'data': ['B', 'A', 'D', 'C', 'O']},
+                                           'snps': [3, 3, 1, 1, 1]}
+
+    with pytest.raises(SystemExit, match="Metadata IDs must be unique"):
+        intreeactive.get_metadata_json(pd.concat([metadata_with_neighbours] * 2), id_column)
+
+
+def test_get_tree_view(test_tree, metadata_with_neighbours):
+    metadata_index = {sample_id: index for index, sample_id in enumerate(metadata_with_neighbours[id_column])}
+    view = intreeactive.get_tree_view(test_tree, metadata_index=metadata_index, title='Tree')
+    x_nodes, y_nodes, names, _ = intreeactive.get_tree_layout(test_tree)
+
+    assert view['title'] == 'Tree; (n=4)'
+    assert view['x'].tolist() == x_nodes and view['y'].tolist() == y_nodes
+    assert [metadata_with_neighbours[id_column][row] if row >= 0 else None for row in view['rows']] == \
+           [name if name in metadata_index else None for name in names]
+    # the internal nodes have names, but no metadata
+    assert sorted(view['labels'].values()) == ['E', 'F']
+
+
+def test_get_facets_json(metadata_with_neighbours):
+    """
+    Each value has a bitset of the metadata rows with that value. The ID, nearest neighbour and date columns can't be
+    filtered by.
+    """
+    facets = json.loads(intreeactive.get_facets_json(metadata_with_neighbours, id_column))
+    assert facets['words'] == 1
+    assert list(facets['columns']) == ['name', 'last', 'somebool']
+
+    somebool = facets['columns']['somebool']
+    bitsets = np.frombuffer(base64.b64decode(somebool['bitsets']), dtype='<u4')
+    assert dict(zip(somebool['values'], bitsets.tolist())) == {True: 0b10011, False: 0b01100}
+
+
+def test_get_dates_json(metadata_with_neighbours):
+    """
+    The rows with a date are sorted by date, and rows without one are left out.
+    """
+    metadata_with_neighbours['date'] = ['2024-01-03', '2024-01-01', 'not a date', '2024-01-02', '2024-01-01']
+    dates = json.loads(intreeactive.get_dates_json(metadata_with_neighbours))['columns']['date']
+    days = np.frombuffer(base64.b64decode(dates['days']), dtype='<i4')
+    order = np.frombuffer(base64.b64decode(dates['order']), dtype='<u4')
+
+    assert order.tolist() == [1, 4, 3, 0]
+    assert days[order].tolist() == [19723, 19723, 19724, 19725]  # days since 1970-01-01
+    assert days[2] == np.iinfo(np.int32).min
+
+
+def test_get_row_colourings_json(test_tree, metadata_with_neighbours):
+    """
+    The colours of the metadata rows give the same node colours as the figure, for every colour option.
+    """
+    metadata_index = {sample_id: index for index, sample_id in enumerate(metadata_with_neighbours[id_column])}
+    rows = intreeactive.get_tree_view(test_tree, metadata_index=metadata_index)['rows']
+    figure_spec, _ = intreeactive.build_tree_figure(tree=test_tree, metadata=metadata_with_neighbours)
+    colourings = json.loads(intreeactive.get_row_colourings_json(metadata_with_neighbours, id_column))
+
+    buttons = figure_spec['layout']['updatemenus'][0]['buttons']
+    assert colourings['default'] == 'name'
+    assert list(colourings['categories']) == [button['label'] for button in buttons]
+    for button in buttons:
+        column = colourings['categories'][button['label']]
+        row_colours = [column['values'][code] for code in column['codes']] if 'codes' in column else column['data']
+        assert [row_colours[row] if row >= 0 else 'rgb(100,100,100)' for row in rows] == \
+               button['args'][0]['marker.color'][0]
+
+
+def test_get_row_colourings_prefix_ids():
+    """
+    Each row is coloured by its own values, even when its ID starts with another row's ID.
+    """
+    metadata = pd.DataFrame({'ID': ['S10', 'S1', 'S100'],
+                             'place': ['here', 'there', 'there'],
+                             'date': ['2021-01-01', '2021-01-03', '']})
+    _, row_colourings = intreeactive.get_row_colourings(metadata, 'ID')
+    place_colours = intreeactive.get_category_colours(metadata, 'place')
+    assert row_colourings['place'].to_list() == place_colours.to_list()
+    assert row_colourings['place'][0] != row_colourings['place'][1] == row_colourings['place'][2]
+    assert row_colourings['date'].to_list() == ['rgb(128, 0, 0)', 'rgb(0, 0, 131)', 'rgb(0, 0, 0)']
+
+
+def test_write_interactive_tree_with_several_trees(tmp_path, test_tree, metadata_with_neighbours, snp_dist_matrix):
+    """
+    The metadata is written once, with the first tree in the figure and the others as tree views.
+    """
+    output_path = tmp_path / 'trees.html'
+    small_tree = intreeactive.prune_tree(test_tree, {'A', 'C', 'D'})
+    intreeactive.write_interactive_tree(tree={'all': test_tree, 'small': small_tree},
+                                        output_name=output_path,
+                                        metadata=metadata_with_neighbours.drop(columns='Nearest_neighbour'),
+                                        snp_distance_matrix=snp_dist_matrix,
+                                        title='Trees')
+    html = output_path.read_text()
+
+    assert html.count('const inputMetadata = ') == 1
+    trees = json.loads(html.split('const inputTrees = ')[1].split('\n')[0])
+    assert [tree['name'] for tree in trees] == ['all', 'small']
+    assert trees[1]['title'] == 'Trees - small; (n=3)'
+    assert 'Trees - all; (n=4)' in html
+
+
+def test_get_network_view(snp_dist_matrix, metadata_with_neighbours):
+    """
+    The minimum spanning network only joins samples within max_snps of each other, and each edge is drawn as long as
+    its SNP distance.
+    """
+    network = intreeactive.get_minimum_spanning_network(snp_dist_matrix, 3)
+    assert network.values.tolist() == [['A', 'B', 3], ['C', 'D', 1], ['D', 'O', 1]]
+
+    metadata_index = {sample_id: index for index, sample_id in enumerate(metadata_with_neighbours[id_column])}
+    view = intreeactive.get_network_view(snp_dist_matrix, metadata_index=metadata_index, max_snps=3)
+    assert view['rows'].tolist() == [0, 1, 2, 3, 4]
+    assert [(view['sources'][i], view['targets'][i]) for i in range(3)] == [(0, 1), (2, 3), (3, 4)]
+    lengths = np.hypot(view['x'][view['sources']] - view['x'][view['targets']],
+                       view['y'][view['sources']] - view['y'][view['targets']])
+    assert lengths == pytest.approx(view['snps'])
@@ -0,0 +1,94 @@
+import gzip
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.intreeactive import server
+
+
+# Constants and fixtures:
+@pytest.fixture
+def snp_dist_matrix() -> pd.DataFrame:
+    """
+    Create a snp distance matrix for 4 samples.
+    """
+    snp_dists_matrix = pd.DataFrame([[0, 3, 9, 10],
+                                     [3, 0, 6, 7],
+                                     [9, 6, 0, 1],
+                                     [10, 7, 1, 0]], index=['A', 'B', 'C', 'D'], columns=['A', 'B', 'C', 'D'])
+    return snp_dists_matrix
+
+
+@pytest.fixture
+def metadata() -> pd.DataFrame:
+    """
+    Create metadata for the samples in the matrix, with nearest neighbours added as write_interactive_tree does.
+    """
+    return pd.DataFrame({'ID': ['A', 'B', 'C', 'D'],
+                         'name': ['Ashley', 'Barbara', 'Charlie', 'Deborah'],
+                         'Nearest_neighbour': ['B=3', 'A=3', 'D=1', 'C=1']})
+
+
+@pytest.fixture
+def report_data(metadata, snp_dist_matrix) -> server.ReportData:
+    return server.ReportData(metadata=metadata, snp_distance_matrix=snp_dist_matrix)
+
+
+# Tests
+def test_report_data(report_data):
+    assert report_data.matrix.dtype == 'uint8'
+    assert report_data.get_metadata_rows(['B', 'X']) == {'B': {'ID': 'B', 'name': 'Barbara',
+                                                               'Nearest_neighbour': ['A=3']}}
+    assert report_data.get_metadata_columns(['name', 'X']) == {'ids': ['A', 'B', 'C', 'D'],
+                                                               'fields': {'name': ['Ashley', 'Barbara', 'Charlie',
+                                                                                   'Deborah']}}
+    assert report_data.get_neighbours_within_snp_threshold('B', 7) == [['A', 3], ['C', 6], ['D', 7]]
+    assert report_data.get_neighbours_within_snp_threshold('X', 7) == []
+    assert report_data.get_snp_distance('A', 'D') == 10
+    assert report_data.get_snp_distance('A', 'X') is None
+
+
+def test_report_data_shares_matrix(metadata, snp_dist_matrix):
+    """
+    A matrix that is already the smallest dtype is used as it is, not copied.
+    """
+    snp_dist_matrix = snp_dist_matrix.astype('uint8')
+    report_data = server.ReportData(metadata=metadata, snp_distance_matrix=snp_dist_matrix)
+    assert np.shares_memory(report_data.matrix, snp_dist_matrix.to_numpy())
+
+
+def test_report_server(report_data):
+    """
+    The report is served at / and the datasets from /api/, with bad requests refused.
+    """
+    report_server = server.ReportServer(('127.0.0.1', 0), report_html='<html></html>', data=report_data)
+    threading.Thread(target=report_server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{report_server.server_address[1]}'
+
+    try:
+        with urllib.request.urlopen(f'{url}/') as response:
+            assert response.read() == b'<html></html>'
+        request = urllib.request.Request(f'{url}/', headers={'Accept-Encoding': 'gzip'})
+        with urllib.request.urlopen(request) as response:
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert gzip.decompress(response.read()) == b'<html></html>'
+
+        with urllib.request.urlopen(f'{url}/api/neighbours?id=C&max_snps=6') as response:
+            assert json.loads(response.read()) == [['D', 1], ['B', 6]]
+        with urllib.request.urlopen(f'{url}/api/distance?id=B&id=C') as response:
+            assert json.loads(response.read()) == 6
+
+        for bad_path, status in [('/api/neighbours?id=C', 400),
+                                 ('/api/metadata?' + '&'.join(['id=A'] * (server.MAX_IDS_PER_REQUEST + 1)), 400),
+                                 ('/api/nothing', 404)]:
+            with pytest.raises(urllib.error.HTTPError) as error:
+                urllib.request.urlopen(f'{url}{bad_path}')
+            assert error.value.code == status
+    finally:
+        report_server.shutdown()
+        report_server.server_close()